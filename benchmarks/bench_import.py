@@ -0,0 +1,57 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import utils
+import os
+import sys
+import subprocess
+
+# Every run starts a new interpreter, so the numbers include the
+# interpreter startup; compare them to the 'import[none]' baseline.
+
+def _env():
+    env = dict(os.environ)
+    path = env.get('PYTHONPATH')
+    if path:
+        env['PYTHONPATH'] = utils.parent_dir + os.pathsep + path
+    else:
+        env['PYTHONPATH'] = utils.parent_dir
+    return env
+
+def _import(statement, env):
+    args = [sys.executable, '-c', statement]
+    def bench():
+        subprocess.check_call(args, env = env)
+    return bench
+
+def get_benchmarks():
+    env = _env()
+    return [utils.Benchmark('import[none]', _import('pass', env)),
+            utils.Benchmark('import[usb]', _import('import usb', env)),
+            utils.Benchmark('import[usb.util]', _import('import usb.util', env)),
+            utils.Benchmark('import[usb.core]', _import('import usb.core', env))]
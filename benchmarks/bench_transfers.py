@@ -0,0 +1,114 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import utils
+import usb.backend.sim as sim
+import usb._interop as _interop
+import usb.legacy
+
+SMALL = 8
+LARGE = 1 << 20
+
+def _find_device():
+    dev = utils.find_sim_device()
+    # a sink and a source instead of the loopback, so every transfer
+    # completes at once with the requested length
+    sim_dev = dev._ctx.dev
+    sim_dev.endpoints = {0x01:sim.Sink(), 0x81:sim.Source()}
+    return dev
+
+def _write(dev, data):
+    def bench():
+        dev.write(0x01, data)
+    return bench
+
+def _read(dev, size):
+    def bench():
+        dev.read(0x81, size)
+    return bench
+
+def _readinto(dev, buff):
+    def bench():
+        dev.readinto(0x81, buff)
+    return bench
+
+def _buffered_read(reader, size):
+    def bench():
+        reader.read_exact(size)
+    return bench
+
+def _ctrl_read(dev, size):
+    def bench():
+        dev.ctrl_transfer(0xc0, 0x11, 0, 0, size)
+    return bench
+
+def _legacy_read(handle, size):
+    def bench():
+        handle.bulkRead(0x81, size)
+    return bench
+
+def _legacy_readinto(handle, buff):
+    def bench():
+        handle.bulkReadInto(0x81, buff)
+    return bench
+
+def get_benchmarks():
+    dev = _find_device()
+    small = _interop.as_array(range(SMALL))
+    large = _interop.as_array([0]) * LARGE
+    handle = usb.legacy.Device(dev).open()
+    handle.claimInterface(0)
+    reader = dev[0][(0,0)][1].buffered()
+    return [
+        utils.Benchmark('write[%d]' % SMALL, _write(dev, small), SMALL),
+        utils.Benchmark('read[%d]' % SMALL, _read(dev, SMALL), SMALL),
+        # most reads are served from the read ahead buffer
+        utils.Benchmark('buffered.read_exact[%d]' % SMALL,
+                        _buffered_read(reader, SMALL),
+                        SMALL),
+        utils.Benchmark('ctrl_read[%d]' % SMALL,
+                        _ctrl_read(dev, SMALL),
+                        SMALL),
+        # the array is passed as is, bytes are converted (copied) first
+        utils.Benchmark('write[%d]' % LARGE, _write(dev, large), LARGE),
+        utils.Benchmark('write[%d,bytes]' % LARGE,
+                        _write(dev, _interop._tobytes(large)),
+                        LARGE),
+        # read() allocates and returns a new array, readinto() does not
+        utils.Benchmark('read[%d]' % LARGE, _read(dev, LARGE), LARGE),
+        utils.Benchmark('readinto[%d]' % LARGE,
+                        _readinto(dev, _interop.as_array([0]) * LARGE),
+                        LARGE),
+        # the 0.x API on top of the same device
+        utils.Benchmark('legacy.bulkRead[%d]' % SMALL,
+                        _legacy_read(handle, SMALL),
+                        SMALL),
+        utils.Benchmark('legacy.bulkReadInto[%d]' % SMALL,
+                        _legacy_readinto(handle, _interop.as_array([0]) * SMALL),
+                        SMALL)
+    ]
@@ -0,0 +1,146 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+# Run the benchmarks of all bench_*.py modules.
+#
+# Usage: python benchall.py [-k PATTERN] [--save FILE] [--compare FILE]
+#
+# The results saved with --save can be passed to --compare in a later run,
+# for example in another commit, to see the relative change of each
+# benchmark. Compare runs of the same machine and Python version only.
+
+import utils
+import glob
+import os
+import os.path
+import sys
+import time
+import platform
+import subprocess
+import json
+from optparse import OptionParser
+
+def _git_revision():
+    try:
+        p = subprocess.Popen(['git', 'rev-parse', 'HEAD'],
+                             stdout = subprocess.PIPE,
+                             stderr = subprocess.PIPE,
+                             cwd = utils.parent_dir)
+        out = p.communicate()[0]
+    except OSError:
+        return None
+    if p.returncode:
+        return None
+    return out.decode('ascii').strip()
+
+def _load_benchmarks():
+    benchmarks = []
+    here = os.path.dirname(os.path.abspath(__file__))
+    for i in sorted(glob.glob(os.path.join(here, 'bench_*.py'))):
+        m = __import__(os.path.splitext(os.path.basename(i))[0])
+        benchmarks.extend(m.get_benchmarks())
+    return benchmarks
+
+def _format(result):
+    best = result['best']
+    s = '%12.2f us %12.0f calls/s' % (best * 1e6, 1.0 / best)
+    if 'nbytes' in result:
+        s += ' %10.1f MB/s' % (result['nbytes'] / best / 1e6)
+    return s
+
+def main(argv):
+    parser = OptionParser()
+    parser.add_option('-k', dest = 'pattern', default = '',
+                      help = 'run only the benchmarks whose name contains '
+                             'PATTERN')
+    parser.add_option('--save', dest = 'save', metavar = 'FILE',
+                      help = 'save the results to FILE')
+    parser.add_option('--compare', dest = 'compare', metavar = 'FILE',
+                      help = 'compare the results to the ones saved in FILE')
+    parser.add_option('--threshold', dest = 'threshold', type = 'float',
+                      default = 10.0,
+                      help = 'flag changes above THRESHOLD percent '
+                             '(default: %default)')
+    parser.add_option('--min-time', dest = 'min_time', type = 'float',
+                      default = utils.MIN_TIME,
+                      help = 'minimum duration of each run, in seconds '
+                             '(default: %default)')
+    parser.add_option('--repeat', dest = 'repeat', type = 'int',
+                      default = utils.REPEAT,
+                      help = 'number of runs of each benchmark '
+                             '(default: %default)')
+    options, args = parser.parse_args(argv)
+
+    baseline = {}
+    if options.compare:
+        f = open(options.compare)
+        try:
+            baseline = json.load(f)['results']
+        finally:
+            f.close()
+
+    results = {}
+    regressions = 0
+    for b in _load_benchmarks():
+        if options.pattern not in b.name:
+            continue
+        r = b.run(options.min_time, options.repeat)
+        results[b.name] = r
+        line = '%-28s %s' % (b.name, _format(r))
+        if b.name in baseline:
+            change = (r['best'] / baseline[b.name]['best'] - 1.0) * 100.0
+            line += ' %+7.1f%%' % change
+            if change > options.threshold:
+                line += ' SLOWER'
+                regressions += 1
+            elif change < -options.threshold:
+                line += ' faster'
+        print(line)
+        sys.stdout.flush()
+
+    if options.save:
+        f = open(options.save, 'w')
+        try:
+            json.dump({'meta':{'revision':_git_revision(),
+                               'python':platform.python_version(),
+                               'implementation':
+                                    platform.python_implementation(),
+                               'machine':platform.machine(),
+                               'platform':platform.platform(),
+                               'date':time.strftime('%Y-%m-%dT%H:%M:%S')},
+                       'results':results},
+                      f,
+                      indent = 1,
+                      sort_keys = True)
+        finally:
+            f.close()
+
+    return regressions
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]) and 1 or 0)
@@ -0,0 +1,120 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import sys
+import os.path
+
+parent_dir = os.path.split(os.path.abspath(os.path.dirname(__file__)))[0]
+
+# if we are at PyUSB source tree, add usb package to python path
+if os.path.exists(os.path.join(parent_dir, 'usb')):
+    sys.path.insert(0, parent_dir)
+
+import usb.core
+import usb.backend.sim as sim
+import usb._interop as _interop
+
+# minimum duration of each timed run, in seconds
+MIN_TIME = 0.2
+
+# number of timed runs of each benchmark
+REPEAT = 5
+
+class Benchmark(object):
+    r"""A benchmark.
+
+    func is called without arguments in a loop and timed. If nbytes is
+    not None, it is the number of bytes moved by each call and the
+    throughput is reported. setup is called before the benchmark runs and
+    teardown after it.
+    """
+    def __init__(self, name, func, nbytes = None, setup = None,
+                 teardown = None):
+        self.name = name
+        self.func = func
+        self.nbytes = nbytes
+        self.setup = setup
+        self.teardown = teardown
+
+    def run(self, min_time = MIN_TIME, repeat = REPEAT):
+        r"""Run the benchmark and return a dictionary with the results.
+
+        The times are the duration of a single call, in seconds, and the
+        best one is the least affected by the noise of the machine.
+        """
+        if self.setup is not None:
+            self.setup()
+        try:
+            number = self.__calibrate(min_time)
+            times = []
+            for i in range(repeat):
+                times.append(self.__time(number) / number)
+        finally:
+            if self.teardown is not None:
+                self.teardown()
+        times.sort()
+        result = {'number':number,
+                  'best':times[0],
+                  'median':times[len(times) // 2]}
+        if self.nbytes is not None:
+            result['nbytes'] = self.nbytes
+        return result
+
+    def __calibrate(self, min_time):
+        number = 1
+        while True:
+            elapsed = self.__time(number)
+            if elapsed >= min_time:
+                return number
+            if elapsed <= 0:
+                number *= 10
+            else:
+                number = max(number * 2,
+                             int(number * min_time * 1.2 / elapsed))
+
+    def __time(self, number):
+        func = self.func
+        loop = range(number)
+        start = _interop._perf_counter()
+        for i in loop:
+            func()
+        return _interop._perf_counter() - start
+
+def sim_backend(count = 1, **kwargs):
+    r"""Return a simulated backend with count loopback devices.
+
+    The keyword arguments are passed to usb.backend.sim.loopback_device().
+    """
+    return sim.get_backend([sim.loopback_device(idProduct = i, **kwargs)
+                            for i in range(count)])
+
+def find_sim_device(**kwargs):
+    r"""Return a configured Device object of a simulated loopback device."""
+    dev = usb.core.find(backend = sim_backend(**kwargs))
+    dev.set_configuration()
+    return dev
@@ -29,7 +29,13 @@
 import utils
 import unittest
 import devinfo
+import os
+import sys
+import shutil
+import ctypes.util
+import tempfile
 import usb.util
+import usb.backend
 import usb.backend.libusb0 as libusb0
 import usb.backend.libusb1 as libusb1
 import usb.backend.openusb as openusb
@@ -220,8 +226,72 @@ class BackendTest(unittest.TestCase):
                                 ', in EP = ' + \
                                 str(ep_in))
 
+class LibraryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = os.path.join(self.dir, 'pyusb', 'libraries')
+        self.environ = dict(os.environ)
+        os.environ['PYUSB_LIBRARY_CACHE'] = self.cache
+        os.environ.pop('PYUSB_TEST_LIBRARY', None)
+        self.loaded = []
+        self.lookups = []
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.dir)
+
+    def loader(self, libname):
+        if libname == 'stale':
+            raise OSError(libname)
+        self.loaded.append(libname)
+        return libname
+
+    def find_library(self, candidate):
+        self.lookups.append(candidate)
+        if candidate == 'b':
+            return 'libb.so'
+        return None
+
+    def load(self, find_library = None):
+        return usb.backend._load_library('test', ('a', 'b'), self.loader,
+                                         find_library)
+
+    def test_find_library(self):
+        self.assertEqual(self.load(self.find_library), 'libb.so')
+        self.assertEqual(self.lookups, ['a', 'b'])
+        # an explicit find_library bypasses the cache
+        self.assertFalse(os.path.exists(self.cache))
+        self.assertRaises(OSError, self.load, lambda x: None)
+
+    def test_cache(self):
+        usb.backend._write_library_cache(self.cache,
+                                         {'test-' + sys.platform: 'libc.so'})
+        self.assertEqual(self.load(), 'libc.so')
+        self.assertEqual(usb.backend._read_library_cache(self.cache),
+                         {'test-' + sys.platform: 'libc.so'})
+
+    def test_stale_cache(self):
+        key = 'test-' + sys.platform
+        usb.backend._write_library_cache(self.cache, {key: 'stale', 'x': 'y'})
+        find_library = ctypes.util.find_library
+        ctypes.util.find_library = self.find_library
+        try:
+            self.assertEqual(self.load(), 'libb.so')
+        finally:
+            ctypes.util.find_library = find_library
+        self.assertEqual(usb.backend._read_library_cache(self.cache),
+                         {key: 'libb.so', 'x': 'y'})
+
+    def test_environment(self):
+        os.environ['PYUSB_TEST_LIBRARY'] = '/opt/libtest.so'
+        self.assertEqual(self.load(), '/opt/libtest.so')
+        self.assertEqual(self.loaded, ['/opt/libtest.so'])
+        self.assertFalse(os.path.exists(self.cache))
+
 def get_suite():
     suite = unittest.TestSuite()
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(LibraryCacheTest))
     for m in (libusb1, libusb0, openusb):
         b = m.get_backend()
         if b is not None and utils.find_my_device(b):
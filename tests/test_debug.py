@@ -0,0 +1,109 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import utils
+import unittest
+import io
+import usb.core
+import usb.util
+import usb._debug as _debug
+import usb._interop as _interop
+import usb.backend.sim as sim
+
+class TracingTest(unittest.TestCase):
+    def setUp(self):
+        self.dev = usb.core.find(backend=sim.get_backend([sim.loopback_device()]))
+        self.dev.set_configuration()
+
+    def tearDown(self):
+        _debug.enable_tracing(False)
+        usb.util.dispose_resources(self.dev)
+
+    def records(self, name):
+        return [r for r in _debug.trace_records()
+                    if _debug.function_name(r.function).endswith(name)]
+
+    def test_enable(self):
+        _debug.enable_tracing(True, 1024)
+        self.assertEqual(_debug.trace_records(), [])
+        # digits must not be parsed as the length
+        data = _interop.as_array(b'12345678')
+        self.assertEqual(self.dev.write(0x01, data), 8)
+        self.assertEqual(self.dev.read(0x81, 64), data)
+        submits = self.records('submit_transfer')
+        self.assertEqual([(r.endpoint, r.length) for r in submits],
+                         [(0x01, 8), (0x81, 64)])
+        waits = self.records('wait_transfer')
+        self.assertEqual([r.status for r in waits], [8, 8])
+        self.assertTrue(all(r.duration >= 0 for r in waits))
+        _debug.enable_tracing(False)
+        n = len(_debug.trace_records())
+        self.dev.write(0x01, data)
+        self.dev.read(0x81, 64)
+        self.assertEqual(len(_debug.trace_records()), n)
+
+    def test_errors(self):
+        _debug.enable_tracing(True, 1024)
+        self.assertRaises(usb.core.USBError, self.dev.read, 0x81, 8, None, 10)
+        r = self.records('wait_transfer')[-1]
+        self.assertTrue(r.status < 0)
+
+    def test_ring(self):
+        _debug.enable_tracing(True, 4)
+        for i in range(3):
+            self.dev.write(0x01, _interop.as_array([0]) * (i + 1))
+        records = _debug.trace_records()
+        # the oldest records are overwritten
+        self.assertEqual(len(records), 4)
+        self.assertEqual([r.length for r in records if r.endpoint == 0x01],
+                         [2, 3])
+        self.assertEqual(records, sorted(records, key=lambda r: r.timestamp))
+
+    def test_dump(self):
+        _debug.enable_tracing(True, 1024)
+        self.dev.write(0x01, _interop.as_array([0]) * 5)
+        records = _debug.trace_records()
+        f = io.BytesIO()
+        _debug.dump_trace(f)
+        f.seek(0)
+        names, loaded = _debug.load_trace(f)
+        self.assertEqual(len(loaded), len(records))
+        for a, b in zip(records, loaded):
+            self.assertEqual(a.function, b.function)
+            self.assertEqual((a.endpoint, a.length, a.status),
+                             (b.endpoint, b.length, b.status))
+            self.assertEqual(names[a.function], _debug.function_name(a.function))
+        lines = _debug.format_records(names, loaded)
+        self.assertEqual(len(lines), len(loaded))
+        self.assertRaises(ValueError, _debug.load_trace, io.BytesIO(b'x' * 16))
+
+def get_suite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(TracingTest)
+
+if __name__ == '__main__':
+    utils.run_tests(get_suite())
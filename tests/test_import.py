@@ -0,0 +1,71 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import utils
+import unittest
+import os
+import sys
+import subprocess
+
+# run a statement in a new interpreter and return the names of the
+# modules given in the modules list which got imported
+def imported_modules(statement, modules):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(sys.path)
+    code = '%s\nimport sys\nprint(",".join([m for m in %r if m in sys.modules]))' % \
+            (statement, modules)
+    p = subprocess.Popen([sys.executable, '-c', code],
+                         stdout = subprocess.PIPE,
+                         env = env)
+    out = p.communicate()[0].decode('ascii').strip()
+    if p.returncode:
+        raise RuntimeError('The child interpreter failed')
+    return [m for m in out.split(',') if m]
+
+class LazyImportTest(unittest.TestCase):
+    heavy = ['usb.core', 'usb.legacy', 'usb.backend', 'logging', 'ctypes']
+
+    def test_import_usb(self):
+        if sys.version_info < (3, 7):
+            return
+        self.assertEqual(imported_modules('import usb', self.heavy), [])
+        self.assertEqual(imported_modules('import usb.util', self.heavy), [])
+
+    def test_lazy_attributes(self):
+        self.assertEqual(imported_modules('import usb\nusb.busses',
+                                          ['usb.core', 'usb.legacy']),
+                         ['usb.core', 'usb.legacy'])
+        self.assertEqual(imported_modules('import usb\nusb.core.find',
+                                          ['usb.core', 'logging']),
+                         ['usb.core', 'logging'])
+
+def get_suite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(LazyImportTest)
+
+if __name__ == '__main__':
+    utils.run_tests(get_suite())
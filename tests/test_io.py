@@ -0,0 +1,120 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import utils
+import unittest
+import io
+import shutil
+import struct
+import usb.core
+import usb.util
+import usb.io
+import usb._interop as _interop
+import usb.backend.sim as sim
+
+class EndpointIOTest(unittest.TestCase):
+    def setUp(self):
+        self.dev = usb.core.find(backend=sim.get_backend([sim.loopback_device()]))
+        self.dev.set_configuration()
+        self.ep_out, self.ep_in = self.dev[0][(0,0)]
+
+    def tearDown(self):
+        usb.util.dispose_resources(self.dev)
+
+    def test_directions(self):
+        self.assertRaises(ValueError, usb.io.EndpointIO)
+        self.assertRaises(ValueError, usb.io.EndpointIO, self.ep_out)
+        self.assertRaises(ValueError, usb.io.EndpointIO, None, self.ep_in)
+        f = usb.io.EndpointIO(self.ep_in)
+        self.assertTrue(f.readable())
+        self.assertFalse(f.writable())
+        self.assertRaises(io.UnsupportedOperation, f.write, b'abc')
+        f.close()
+        self.assertRaises(ValueError, f.readinto, bytearray(64))
+
+    def test_buffered(self):
+        f = io.BufferedRWPair(usb.io.EndpointIO(self.ep_in),
+                              usb.io.EndpointIO(None, self.ep_out),
+                              256)
+        f.write(struct.pack('<HI', 1, 2) + b'line\n')
+        f.flush()
+        self.assertEqual(struct.unpack('<HI', f.read(6)), (1, 2))
+        self.assertEqual(f.readline(), b'line\n')
+
+    def test_readinto(self):
+        f = usb.io.EndpointIO(self.ep_in, self.ep_out)
+        data = bytes(bytearray(range(200)))
+        self.assertEqual(f.write(memoryview(data)), 200)
+        # rounded down to a multiple of wMaxPacketSize (64)
+        b = bytearray(100)
+        self.assertEqual(f.readinto(b), 64)
+        self.assertEqual(bytes(b[:64]), data[:64])
+        a = _interop.as_array([0]) * 128
+        self.assertEqual(f.readinto(a), 128)
+        self.assertEqual(_interop._tobytes(a), data[64:192])
+        self.assertEqual(f.read(64), data[192:])
+
+    def test_copyfileobj(self):
+        data = bytes(bytearray(range(256))) * 8
+        out = io.BufferedWriter(usb.io.EndpointIO(None, self.ep_out), 512)
+        shutil.copyfileobj(io.BytesIO(data), out, 700)
+        out.flush()
+        dest = io.BytesIO()
+        inp = io.BufferedReader(usb.io.EndpointIO(self.ep_in), 512)
+        while dest.tell() < len(data):
+            dest.write(inp.read1(512))
+        self.assertEqual(dest.getvalue(), data)
+
+    def test_in_place(self):
+        buffers = []
+        backend = self.dev._ctx.backend
+        submit_transfer = backend.submit_transfer
+        def recording_submit(dev_handle, ep, intf, ep_type, data, timeout,
+                             callback = None):
+            buffers.append(data)
+            return submit_transfer(dev_handle, ep, intf, ep_type, data,
+                                   timeout, callback)
+        backend.submit_transfer = recording_submit
+        data = bytes(bytearray(range(256)))
+        out = io.BufferedWriter(usb.io.EndpointIO(None, self.ep_out), 128)
+        for i in range(0, 256, 32):
+            out.write(data[i:i + 32])
+        out.flush()
+        inp = io.BufferedReader(usb.io.EndpointIO(self.ep_in), 128)
+        for i in range(0, 256, 32):
+            self.assertEqual(inp.read(32), data[i:i + 32])
+        # the buffers of the buffering classes themselves reach the backend
+        self.assertEqual(len(buffers), 4)
+        for b in buffers:
+            self.assertTrue(isinstance(b, memoryview))
+
+def get_suite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(EndpointIOTest)
+
+if __name__ == '__main__':
+    utils.run_tests(get_suite())
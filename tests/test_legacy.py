@@ -0,0 +1,117 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import utils
+import unittest
+import usb.core
+import usb.util
+import usb.legacy
+import usb._interop as _interop
+import usb.backend.sim as sim
+
+class _CountingBackend(object):
+    def __init__(self, backend):
+        self.backend = backend
+        self.calls = 0
+
+    def get_configuration_descriptor(self, dev, config):
+        self.calls += 1
+        return self.backend.get_configuration_descriptor(dev, config)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+class LegacyTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = _CountingBackend(sim.get_backend([
+                            sim.loopback_device(bus = 2),
+                            sim.loopback_device(bus = 1, idProduct = 2),
+                            sim.loopback_device(bus = 2, idProduct = 3)
+                        ]))
+
+    def test_lazy_device(self):
+        dev = usb.legacy.Device(usb.core.find(backend = self.backend))
+        self.assertEqual(self.backend.calls, 0)
+        cfg = dev.configurations[0]
+        calls = self.backend.calls
+        self.assertEqual(cfg.value, 1)
+        self.assertEqual(cfg.totalLength, 78)
+        self.assertTrue(dev.configurations[0] is cfg)
+        intf = cfg.interfaces[0][0]
+        self.assertEqual(intf.interfaceNumber, 0)
+        self.assertEqual([e.address for e in intf.endpoints], [0x01, 0x81])
+        self.assertTrue(intf.endpoints is intf.endpoints)
+        # nothing is read twice
+        dev.configurations[0].interfaces[0][0].endpoints
+        self.assertEqual(self.backend.calls, calls)
+
+    def test_busses(self):
+        find = usb.core.find
+        backend = self.backend
+        def find_sim(find_all = False, **args):
+            return find(find_all, backend, **args)
+        usb.core.find = find_sim
+        try:
+            busses = usb.legacy.busses()
+        finally:
+            usb.core.find = find
+        self.assertEqual([b.location for b in busses], [2, 1])
+        self.assertEqual([b.dirname for b in busses], ['002', '001'])
+        self.assertEqual([[d.idProduct for d in b.devices] for b in busses],
+                         [[1, 3], [2]])
+        self.assertEqual(self.backend.calls, 0)
+        for b in busses:
+            for d in b.devices:
+                self.assertEqual(d.filename, '%03d' % d.devnum)
+
+    def test_handle(self):
+        dev = usb.core.find(backend = self.backend)
+        handle = usb.legacy.Device(dev).open()
+        handle.setConfiguration(1)
+        handle.claimInterface(0)
+        data = utils.get_array_data1()
+        self.assertEqual(handle.bulkWrite(0x01, data), len(data))
+        buff = _interop.as_array([0]) * len(data)
+        self.assertEqual(handle.bulkReadInto(0x81, buff), len(data))
+        self.assertEqual(buff, data)
+        self.assertEqual(dev._ctx.prepare_transfer(dev, 0x81, 0)[1],
+                         usb.util.ENDPOINT_TYPE_BULK)
+        # the cached endpoint types follow the alternate setting
+        handle.setAltInterface(1)
+        self.assertEqual(dev._ctx.prepare_transfer(dev, 0x81, 0)[1],
+                         usb.util.ENDPOINT_TYPE_INTR)
+        self.assertEqual(handle.interruptWrite(0x01, data), len(data))
+        self.assertEqual(handle.interruptRead(0x81, len(data)), data)
+        handle.releaseInterface()
+        usb.util.dispose_resources(dev)
+
+def get_suite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(LegacyTest)
+
+if __name__ == '__main__':
+    utils.run_tests(get_suite())
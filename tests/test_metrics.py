@@ -0,0 +1,96 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import utils
+import unittest
+import usb.core
+import usb.util
+import usb.metrics
+import usb.backend.sim as sim
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        usb.metrics.reset()
+        usb.metrics.enable()
+        self.dev = usb.core.find(backend=sim.get_backend())
+        self.dev.set_configuration()
+        self.labels = 'bus="%d",address="%d",vendor="fffe",product="0001"' % \
+                        (self.dev.bus, self.dev.address)
+
+    def tearDown(self):
+        usb.metrics.disable()
+        usb.metrics.reset()
+        usb.util.dispose_resources(self.dev)
+
+    def sample(self, text, name, labels):
+        prefix = '%s{%s} ' % (name, labels)
+        for line in text.splitlines():
+            if line.startswith(prefix):
+                return line[len(prefix):]
+        return None
+
+    def test_render(self):
+        self.dev.write(0x01, utils.get_array_data1())
+        self.dev.read(0x81, 8)
+        self.assertRaises(usb.core.USBError,
+                          self.dev.read, 0x81, 8, None, 1)
+        self.dev.ctrl_transfer(0xc0, 0x11, 0, 0, 4)
+        text = usb.metrics.render()
+        ep_in = self.labels + ',endpoint="0x81"'
+        self.assertEqual(self.sample(text, 'usb_transfers_total', ep_in), '2')
+        self.assertEqual(self.sample(text, 'usb_transfer_bytes_total', ep_in),
+                         '8')
+        self.assertEqual(self.sample(text, 'usb_transfer_timeouts_total',
+                                     ep_in),
+                         '1')
+        self.assertEqual(self.sample(text, 'usb_transfer_errors_total',
+                                     ep_in + ',errno="ETIMEDOUT"'),
+                         '1')
+        self.assertEqual(self.sample(text, 'usb_transfer_duration_seconds_bucket',
+                                     ep_in + ',le="+Inf"'),
+                         '2')
+        self.assertEqual(self.sample(text, 'usb_transfers_total',
+                                     self.labels + ',endpoint="0x00"'),
+                         '1')
+        self.assertEqual(self.sample(text, 'usb_claimed_interfaces',
+                                     self.labels),
+                         '1')
+
+    def test_disable(self):
+        usb.metrics.disable()
+        self.dev.write(0x01, utils.get_array_data1())
+        self.assertEqual(self.sample(usb.metrics.render(),
+                                     'usb_transfers_total',
+                                     self.labels + ',endpoint="0x01"'),
+                         None)
+
+def get_suite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(MetricsTest)
+
+if __name__ == '__main__':
+    utils.run_tests(get_suite())
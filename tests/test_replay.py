@@ -0,0 +1,144 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import utils
+import unittest
+import time
+import errno
+import os
+import struct
+import tempfile
+import usb.core
+import usb.util
+import usb.capture as capture
+import usb.backend.replay as replay
+
+_device_descriptor = struct.pack('<BBHBBBBHHHBBBB', 18, 1, 0x200, 0, 0, 0, 64,
+                                 0xfffe, 0x0001, 0x100, 0, 0, 0, 1)
+
+_config_descriptor = struct.pack('<BBHBBBBB', 9, 2, 32, 1, 1, 0, 0x80, 50) + \
+                     struct.pack('<BBBBBBBBB', 9, 4, 0, 0, 2, 0xff, 0, 0, 0) + \
+                     struct.pack('<BBBBHB', 7, 5, 0x01, 2, 64, 0) + \
+                     struct.pack('<BBBBHB', 7, 5, 0x81, 2, 64, 0)
+
+# write a pcapng file with a submission and a completion per transfer, gap
+# seconds apart
+def write_capture(f, transfers, gap = 0):
+    f.write(capture._section_header_block())
+    f.write(capture._interface_description_block(0))
+    ts = 1000.0
+    for urb_id, (xfer_type, epnum, setup, data, status) in enumerate(transfers):
+        if setup is not None:
+            setup_bytes = struct.pack('<BBHHH', *setup)
+            flag_setup = b'\x00'
+        else:
+            setup_bytes = b'\x00' * 8
+            flag_setup = b'-'
+        for kind, payload in ((b'S', b''), (b'C', data)):
+            header = capture._USBMON_HEADER.pack(urb_id, ord(kind), xfer_type,
+                                                 epnum, 2, 1, flag_setup,
+                                                 b'\x00', int(ts), 0, status,
+                                                 len(payload), len(payload),
+                                                 setup_bytes, 0, 0, 0, 0)
+            f.write(capture._enhanced_packet_block(ts, header + payload,
+                                                   len(header + payload)))
+            ts += 0.001
+        ts += gap
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp('.pcapng')
+        f = os.fdopen(fd, 'wb')
+        try:
+            write_capture(f, (
+                (2, 0x80, (0x80, 6, 0x100, 0, 18), _device_descriptor, 0),
+                (2, 0x80, (0x80, 6, 0x200, 0, 32), _config_descriptor, 0),
+                (2, 0x80, (0xc0, 1, 2, 3, 4), b'\x01\x02\x03\x04', 0),
+                (3, 0x81, None, b'abc', 0),
+                (3, 0x81, None, b'', -errno.EPIPE),
+            ))
+        finally:
+            f.close()
+        self.dev = usb.core.find(backend=replay.get_backend(self.path))
+
+    def tearDown(self):
+        self.dev = None
+        os.remove(self.path)
+
+    def test_descriptors(self):
+        self.assertEqual(self.dev.idVendor, 0xfffe)
+        self.assertEqual((self.dev.bus, self.dev.address), (1, 2))
+        intf = self.dev[0][(0, 0)]
+        self.assertEqual([e.bEndpointAddress for e in intf], [0x01, 0x81])
+
+    def test_ctrl_transfer(self):
+        for i in range(2):
+            self.assertEqual(list(self.dev.ctrl_transfer(0xc0, 1, 2, 3, 4)),
+                             [1, 2, 3, 4])
+        try:
+            self.dev.ctrl_transfer(0xc0, 1, 2, 4, 4)
+        except usb.core.USBError as e:
+            self.assertEqual(e.errno, errno.EPIPE)
+        else:
+            self.fail('USBError not raised')
+
+    def test_read(self):
+        self.dev.set_configuration()
+        self.assertEqual(list(self.dev.read(0x81, 64)), [97, 98, 99])
+        for err in (errno.EPIPE, errno.ETIMEDOUT):
+            try:
+                self.dev.read(0x81, 64)
+            except usb.core.USBError as e:
+                self.assertEqual(e.errno, err)
+            else:
+                self.fail('USBError not raised')
+
+    def test_timing(self):
+        f = open(self.path, 'wb')
+        try:
+            write_capture(f, (
+                (2, 0x80, (0x80, 6, 0x100, 0, 18), _device_descriptor, 0),
+                (2, 0x80, (0x80, 6, 0x200, 0, 32), _config_descriptor, 0),
+                (3, 0x81, None, b'abc', 0),
+                (3, 0x81, None, b'def', 0),
+            ), 0.1)
+        finally:
+            f.close()
+        dev = usb.core.find(backend=replay.get_backend(self.path, True, 2.0))
+        dev.set_configuration()
+        dev.read(0x81, 64)
+        start = time.time()
+        self.assertEqual(list(dev.read(0x81, 64)), [100, 101, 102])
+        # the idle time between the transfers is replayed too
+        self.assertTrue(time.time() - start >= 0.05)
+
+def get_suite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(ReplayTest)
+
+if __name__ == '__main__':
+    utils.run_tests(get_suite())
@@ -0,0 +1,107 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import utils
+import unittest
+import threading
+import usb.core
+import usb.util
+import usb.select
+import usb.backend.sim as sim
+import usb.backend._workers as _workers
+
+class _ThreadedBackend(_workers.ThreadedTransfers, sim._SimBackend):
+    def close_device(self, dev_handle):
+        self.close_pool(dev_handle)
+        sim._SimBackend.close_device(self, dev_handle)
+
+class SelectorTest(unittest.TestCase):
+    backend = sim.get_backend
+
+    def setUp(self):
+        backend = self.__class__.backend([sim.loopback_device() for i in range(3)])
+        self.devs = list(usb.core.find(find_all=True, backend=backend))
+        self.eps = []
+        for d in self.devs:
+            d.set_configuration()
+            # interrupt endpoints
+            d.set_interface_altsetting(0, 1)
+            self.eps.append(d[0][(0,1)][1])
+        self.sel = usb.select.Selector()
+
+    def tearDown(self):
+        self.sel.close()
+        for d in self.devs:
+            usb.util.dispose_resources(d)
+
+    def test_select(self):
+        lengths = []
+        def post(device, endpoint, direction, length, timeout, start, end,
+                 result):
+            if endpoint == 0x81 and isinstance(result, int):
+                lengths.append(result)
+        handle = usb.core.add_transfer_hook(post=post)
+        try:
+            for ep in self.eps:
+                self.sel.register(ep)
+            data = utils.get_array_data1(8)
+            self.devs[1].write(0x01, data)
+            self.assertEqual(self.sel.select(5000), [(self.eps[1], data)])
+        finally:
+            usb.core.remove_transfer_hook(handle)
+        # the selected transfers go through the hooks
+        self.assertEqual(lengths, [8])
+        self.assertEqual(len(self.sel), 3)
+        self.assertRaises(ValueError, self.sel.register, self.eps[0])
+        self.assertRaises(ValueError, self.sel.register, self.devs[0][0][(0,1)][0])
+        self.assertEqual(self.sel.select(0), [])
+        self.devs[1].write(0x01, data)
+        self.assertEqual(self.sel.select(5000), [(self.eps[1], data)])
+        # the endpoint is armed again
+        t = threading.Timer(0.05, self.devs[2].write, (0x01, data))
+        t.start()
+        self.assertEqual(self.sel.select(), [(self.eps[2], data)])
+        t.join()
+        self.sel.unregister(self.eps[0])
+        self.devs[0].write(0x01, data)
+        self.assertEqual(self.sel.select(20), [])
+        # a cancelled transfer running in a worker thread still reads
+        if self.__class__.backend is sim.get_backend:
+            self.assertEqual(self.devs[0].read(0x81, 8), data)
+
+class ThreadedSelectorTest(SelectorTest):
+    backend = _ThreadedBackend
+
+def get_suite():
+    suite = unittest.TestSuite()
+    for t in (SelectorTest, ThreadedSelectorTest):
+        suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(t))
+    return suite
+
+if __name__ == '__main__':
+    utils.run_tests(get_suite())
@@ -0,0 +1,125 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import utils
+import unittest
+import time
+import errno
+import usb.core
+import usb.util
+import usb.shm
+import usb._interop as _interop
+import usb.backend.sim as sim
+
+class ShmTest(unittest.TestCase):
+    def setUp(self):
+        self.dev = usb.core.find(backend=sim.get_backend([sim.loopback_device()]))
+        self.dev.set_configuration()
+        self.ep_out, self.ep_in = self.dev[0][(0,0)]
+        self.ring = usb.shm.Ring(4, 100)
+
+    def tearDown(self):
+        self.ring.close()
+        self.ring.unlink()
+        usb.util.dispose_resources(self.dev)
+
+    def wait_records(self, feed, count):
+        while feed.records < count:
+            time.sleep(0.01)
+
+    def test_ring(self):
+        self.assertRaises(ValueError, usb.shm.feed, self.ep_out, self.ring)
+        self.assertRaises(ValueError, usb.shm.feed, self.ep_in, self.ring, 4)
+        readers = [usb.shm.RingReader(self.ring.name, i, 2) for i in (0, 1)]
+        feed = usb.shm.feed(self.ep_in, self.ring, 2)
+        try:
+            # the slots are 100 bytes, so the transfers read 64 bytes
+            data = utils.get_array_data1(100)
+            self.ep_out.write(data)
+            self.wait_records(feed, 2)
+            record = readers[0].get()
+            self.assertEqual(bytes(record), _interop._tobytes(data[:64]))
+            self.assertEqual(readers[0].seq, 0)
+            self.assertTrue(readers[0].valid())
+            record.release()
+            record = readers[1].get(1)
+            self.assertEqual(bytes(record), _interop._tobytes(data[64:]))
+            self.assertEqual(readers[1].seq, 1)
+            record.release()
+            self.assertEqual(readers[0].get(0.01), None)
+            # record 3 of reader 1 is overwritten, its slot being in use
+            # for record 7
+            for i in range(5):
+                self.ep_out.write(utils.get_array_data2(10 + i))
+                self.wait_records(feed, 3 + i)
+            self.assertFalse(readers[0].valid())
+            record = readers[1].get()
+            self.assertEqual((readers[1].seq, readers[1].lost), (5, 1))
+            self.assertEqual(bytes(record),
+                             _interop._tobytes(utils.get_array_data2(13)))
+            record.release()
+            # reader 0 is lapped, records 2 and 4 are gone
+            record = readers[0].get()
+            self.assertEqual((readers[0].seq, readers[0].lost), (6, 2))
+            record.release()
+        finally:
+            self.assertEqual(feed.stop(), 7)
+            for r in readers:
+                r.close()
+
+    def test_error(self):
+        # ended by a timeout, the feed leaves no view of the ring behind
+        self.ep_out.write(utils.get_array_data1(64))
+        results = []
+        def post(device, endpoint, direction, length, timeout, start, end,
+                 result):
+            # the errors themselves would keep the frames holding the slots
+            if isinstance(result, usb.core.USBError):
+                result = result.errno
+            results.append(result)
+        handle = usb.core.add_transfer_hook(post=post)
+        feed = usb.shm.feed(self.ep_in, self.ring, 2, timeout = 50)
+        # not assertRaises, which clears the frames of the traceback
+        try:
+            feed.wait()
+        except usb.core.USBError:
+            pass
+        usb.core.remove_transfer_hook(handle)
+        # the transfers go through the hooks
+        self.assertEqual(results[:2], [64, errno.ETIMEDOUT])
+        self.assertTrue(isinstance(feed.error, usb.core.USBError))
+        self.assertEqual(feed.records, 1)
+        self.ring.close()
+
+def get_suite():
+    if usb.shm.shared_memory is None:
+        return unittest.TestSuite()
+    return unittest.defaultTestLoader.loadTestsFromTestCase(ShmTest)
+
+if __name__ == '__main__':
+    utils.run_tests(get_suite())
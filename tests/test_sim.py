@@ -0,0 +1,420 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import utils
+import unittest
+import errno
+import os
+import time
+import tempfile
+import struct
+import array
+import threading
+import usb.core
+import usb.util
+import usb._interop as _interop
+import usb.capture
+import usb.backend.sim as sim
+import usb.backend.replay as replay
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class SimBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.sim_dev = sim.loopback_device()
+        self.dev = usb.core.find(backend=sim.get_backend([self.sim_dev]))
+        self.dev.set_configuration()
+
+    def tearDown(self):
+        usb.util.dispose_resources(self.dev)
+
+    def test_descriptors(self):
+        self.assertEqual((self.dev.idVendor, self.dev.idProduct),
+                         (0xfffe, 0x0001))
+        cfg = self.dev[0]
+        self.assertEqual(cfg.wTotalLength, 78)
+        self.assertEqual([i.bAlternateSetting for i in cfg], [0, 1, 2])
+        self.assertEqual([e.bEndpointAddress for e in cfg[(0, 2)]],
+                         [0x01, 0x81])
+        self.assertEqual(self.dev.get_active_configuration().bConfigurationValue,
+                         1)
+
+    def test_loopback(self):
+        for alt in (0, 1):
+            self.dev.set_interface_altsetting(0, alt)
+            data = utils.get_array_data1(32)
+            self.assertEqual(self.dev.write(0x01, data), 32)
+            self.assertEqual(self.dev.read(0x81, 32), data)
+
+    def test_iso(self):
+        self.dev.set_interface_altsetting(0, 2)
+        # isochronous transfers do not wait for data
+        self.assertEqual(len(self.dev.read(0x81, 32)), 0)
+
+    def test_register_file(self):
+        data = utils.get_array_data2(16)
+        self.assertEqual(self.dev.ctrl_transfer(0x40, 0x10, 4, 0, data), 16)
+        self.assertEqual(self.dev.ctrl_transfer(0xc0, 0x11, 4, 0, 16), data)
+        self.assertRaises(usb.core.USBError,
+                          self.dev.ctrl_transfer, 0xc0, 0x12, 0, 0, 1)
+
+    def test_timeout(self):
+        try:
+            self.dev.read(0x81, 32, timeout=10)
+        except usb.core.USBError as e:
+            self.assertEqual(e.errno, errno.ETIMEDOUT)
+        else:
+            self.fail('USBError not raised')
+
+    def test_nak(self):
+        # the read waits until the data is written
+        data = utils.get_array_data1()
+        t = threading.Timer(0.05, self.dev.write, (0x01, data))
+        t.start()
+        self.assertEqual(self.dev.read(0x81, 8, timeout=5000), data)
+        t.join()
+
+    def test_cancel(self):
+        def cancel():
+            while not self.dev.cancel_pending(0x81):
+                time.sleep(0.01)
+        t = threading.Thread(target=cancel)
+        t.start()
+        self.assertRaises(usb.core.USBTransferCancelled,
+                          self.dev.read, 0x81, 8, None, 5000)
+        t.join()
+
+    def test_writev(self):
+        lengths = []
+        def post(device, endpoint, direction, length, timeout, start, end,
+                 result):
+            lengths.append(length)
+        header = utils.get_array_data1(3)
+        payload = utils.get_array_data2(200)
+        ep = self.dev[0][(0,0)][0]
+        handle = usb.core.add_transfer_hook(post=post)
+        try:
+            # wMaxPacketSize is 64
+            self.assertEqual(ep.writev([header, payload, b'\x01\x02']), 205)
+            self.assertEqual(lengths, [64, 128, 13])
+            del lengths[:]
+            self.assertEqual(self.dev.writev(0x01, [payload[:128], b'', payload]),
+                             328)
+            self.assertEqual(lengths, [128, 200])
+            del lengths[:]
+            self.assertEqual(self.dev.writev(0x01, [b'']), 0)
+            self.assertEqual(lengths, [0])
+        finally:
+            usb.core.remove_transfer_hook(handle)
+        data = self.dev.read(0x81, 1000)
+        self.assertEqual(data, header + payload +
+                               _interop.as_array(b'\x01\x02') +
+                               payload[:128] + payload)
+
+    def test_chunks(self):
+        lengths = []
+        def post(device, endpoint, direction, length, timeout, start, end,
+                 result):
+            lengths.append((endpoint, length))
+        self.assertEqual(self.dev.chunk_size, 1 << 20)
+        self.assertRaises(ValueError, setattr, self.dev, 'chunk_size', -1)
+        self.assertRaises(ValueError, setattr, self.dev, 'chunks_in_flight', 0)
+        # rounded down to a multiple of wMaxPacketSize (64)
+        self.dev.chunk_size = 100
+        data = utils.get_array_data1(250) * 2
+        handle = usb.core.add_transfer_hook(post=post)
+        try:
+            self.assertEqual(self.dev.write(0x01, data), 500)
+            self.assertEqual(lengths, [(0x01, 64)] * 7 + [(0x01, 52)])
+            del lengths[:]
+            self.assertEqual(self.dev.read(0x81, 1000), data)
+            # the read stops at the first short piece
+            self.assertEqual(lengths, [(0x81, 64)] * 8)
+        finally:
+            usb.core.remove_transfer_hook(handle)
+        self.dev.write(0x01, data)
+        buff = _interop.as_array([0]) * 512
+        self.assertEqual(self.dev.readinto(0x81, buff), 500)
+        self.assertEqual(buff[:500], data)
+        self.dev.write(0x01, data)
+        buff = bytearray(512)
+        self.assertEqual(self.dev.readinto(0x81, buff), 500)
+        self.assertEqual(bytes(buff[:500]), _interop._tobytes(data))
+        # interpreters without memoryview copy the pieces
+        memoryview_type = _interop._memoryview
+        _interop._memoryview = None
+        try:
+            self.assertEqual(self.dev.writev(0x01, [b'\x00', data]), 501)
+            self.assertEqual(self.dev.read(0x81, 1000),
+                             _interop.as_array([0]) + data)
+        finally:
+            _interop._memoryview = memoryview_type
+        # pipelined when nothing watches the transfers
+        self.dev.chunk_size = 128
+        self.dev.chunks_in_flight = 3
+        data = utils.get_array_data2(250) * 4
+        self.assertEqual(self.dev.write(0x01, data), 1000)
+        self.assertEqual(self.dev.read(0x81, 1000), data)
+        self.dev.chunk_size = None
+        self.assertEqual(self.dev.write(0x01, data), 1000)
+        self.assertEqual(self.dev.read(0x81, 1000), data)
+
+    def test_zlp(self):
+        lengths = []
+        def post(device, endpoint, direction, length, timeout, start, end,
+                 result):
+            lengths.append(length)
+        ep = self.dev[0][(0,0)][0]
+        handle = usb.core.add_transfer_hook(post=post)
+        try:
+            ep.write(utils.get_array_data1(128), zlp=True)
+            ep.write(utils.get_array_data1(100), zlp=True)
+            ep.write(utils.get_array_data1(64))
+            ep.writev([b'\x01' * 60, b'\x02' * 4], zlp=True)
+        finally:
+            usb.core.remove_transfer_hook(handle)
+        self.assertEqual(lengths, [128, 0, 100, 64, 64, 0])
+
+    def test_buffered(self):
+        lengths = []
+        def post(device, endpoint, direction, length, timeout, start, end,
+                 result):
+            lengths.append(length)
+        ep_out, ep_in = self.dev[0][(0,0)]
+        self.assertRaises(ValueError, ep_out.buffered)
+        reader = ep_in.buffered(100)
+        self.assertEqual(reader.transfer_size, 128)
+        ep_out.write(b'abc\ndefgh\r\nij')
+        handle = usb.core.add_transfer_hook(post=post)
+        try:
+            self.assertEqual(reader.read(2), _interop.as_array(b'ab'))
+            self.assertEqual(reader.readline(), _interop.as_array(b'c\n'))
+            self.assertEqual(reader.readline(3, b'\r\n'),
+                             _interop.as_array(b'def'))
+            self.assertEqual(reader.readline(delimiter=b'\r\n'),
+                             _interop.as_array(b'gh\r\n'))
+            self.assertEqual(reader.available, 2)
+            self.assertEqual(lengths, [128])
+            # the data read before a timeout is kept
+            self.assertRaises(usb.core.USBError, reader.read_exact, 4, 10)
+            self.assertEqual(reader.available, 2)
+            ep_out.write(b'kl\nmn')
+            self.assertEqual(reader.read_exact(4), _interop.as_array(b'ijkl'))
+            self.assertEqual(reader.readline(), _interop.as_array(b'\n'))
+            self.assertEqual(reader.read(), _interop.as_array(b'mn'))
+            self.assertEqual(reader.available, 0)
+        finally:
+            usb.core.remove_transfer_hook(handle)
+
+    def test_to_mmap(self):
+        ep = self.dev[0][(0,0)][1]
+        data = utils.get_array_data1(250) * 4
+        self.dev.write(0x01, data)
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            progress = []
+            results = []
+            def post(device, endpoint, direction, length, timeout, start,
+                     end, result):
+                results.append(result)
+            handle = usb.core.add_transfer_hook(post=post)
+            try:
+                cap = usb.capture.to_mmap(ep, path, 1000, 256, 3,
+                                          progress=progress.append)
+                self.assertEqual(cap.wait(), 1000)
+            finally:
+                usb.core.remove_transfer_hook(handle)
+            # the transfers go through the hooks
+            self.assertEqual(sum([r for r in results if isinstance(r, int)]),
+                             1000)
+            self.assertEqual(progress[-1], 1000)
+            self.assertEqual(cap.overruns, 0)
+            f = open(path, 'rb')
+            self.assertEqual(f.read(), _interop._tobytes(data))
+            f.close()
+            # the file holds the last 640 bytes, the oldest at position
+            self.dev.write(0x01, data)
+            cap = usb.capture.to_mmap(ep, path, 640, 128, ring=True)
+            while cap.captured < 1000:
+                time.sleep(0.01)
+            self.assertEqual(cap.stop(), 1000)
+            self.assertEqual((cap.position, cap.overruns), (360, 360))
+            f = open(path, 'rb')
+            contents = f.read()
+            f.close()
+            self.assertEqual(contents[360:] + contents[:360],
+                             _interop._tobytes(data[360:]))
+            # stopped before the end
+            cap = usb.capture.to_mmap(ep, path, 1000)
+            self.assertEqual(cap.stop(), 0)
+            self.assertEqual(os.path.getsize(path), 0)
+            # ended by a timeout, the file still is closed and truncated
+            self.dev.write(0x01, data[:100])
+            cap = usb.capture.to_mmap(ep, path, 1000, 128, timeout=50)
+            self.assertRaises(usb.core.USBError, cap.wait)
+            self.assertEqual(cap.captured, 100)
+            self.assertEqual(os.path.getsize(path), 100)
+        finally:
+            os.remove(path)
+
+    def test_read_array(self):
+        ep_out, ep_in = self.dev[0][(0,0)]
+        ep_out.write(struct.pack('<4h', 1, -2, 300, -400))
+        self.assertEqual(ep_in.read_array('h', 4).tolist(), [1, -2, 300, -400])
+        # a short transfer fills a part of the destination
+        out = array.array('i', [0]) * 4
+        ep_out.write(struct.pack('<2i', 70000, -1) + b'\x01')
+        self.assertEqual(ep_in.read_array(None, out=out), 2)
+        self.assertEqual(out[:2].tolist(), [70000, -1])
+        self.assertRaises(ValueError, ep_in.read_array, 'h')
+        self.assertRaises(ValueError, ep_in.read_array, None, 5, None, out)
+        if numpy is None:
+            return
+        ep_out.write(struct.pack('<3h', 5, -6, 7))
+        data = ep_in.read_array('<i2', 8)
+        self.assertEqual(data.dtype, numpy.dtype('<i2'))
+        self.assertEqual(data.tolist(), [5, -6, 7])
+
+    def test_latency(self):
+        self.sim_dev.latency = 0.02
+        self.sim_dev.bandwidth = 1000
+        start = time.time()
+        self.dev.write(0x01, utils.get_array_data1(20))
+        self.assertTrue(time.time() - start >= 0.04)
+
+    def test_overlap(self):
+        self.sim_dev.latency = 0.05
+        # the latency of the chunks in flight overlaps
+        self.dev.chunk_size = 64
+        self.dev.chunks_in_flight = 4
+        data = utils.get_array_data1(256)
+        start = time.time()
+        self.assertEqual(self.dev.write(0x01, data), 256)
+        elapsed = time.time() - start
+        self.assertTrue(0.05 <= elapsed < 0.15)
+        # handle_events() does not hold the backend while transfers run
+        backend = self.dev._ctx.backend
+        handle = self.dev._ctx.handle
+        done = []
+        t = backend.submit_transfer(handle, 0x81, 0,
+                                    usb.util.ENDPOINT_TYPE_BULK,
+                                    _interop.as_array([0]) * 64, 1000,
+                                    done.append)
+        events = threading.Thread(target=backend.handle_events, args=(1000,))
+        events.start()
+        start = time.time()
+        u = backend.submit_transfer(handle, 0x81, 0,
+                                    usb.util.ENDPOINT_TYPE_BULK,
+                                    _interop.as_array([0]) * 64, 1000)
+        self.assertTrue(time.time() - start < 0.03)
+        events.join()
+        self.assertEqual(done, [t])
+        self.assertEqual(backend.wait_transfer(t), 64)
+        self.assertEqual(backend.wait_transfer(u), 64)
+        self.assertEqual(self.dev.read(0x81, 256), data[128:])
+
+    def test_stats_and_hooks(self):
+        calls = []
+        def post(device, endpoint, direction, length, timeout, start, end,
+                 result):
+            calls.append((endpoint, direction, length, result))
+        handle = usb.core.add_transfer_hook(post=post)
+        try:
+            self.dev.enable_stats()
+            self.dev.write(0x01, utils.get_array_data1())
+            self.dev.read(0x81, 16)
+        finally:
+            usb.core.remove_transfer_hook(handle)
+        self.assertEqual(calls, [(0x01, usb.util.ENDPOINT_OUT, 8, 8),
+                                 (0x81, usb.util.ENDPOINT_IN, 16, 8)])
+        self.assertEqual(self.dev.stats[0x81].short, 1)
+        self.assertEqual(self.dev.stats[0x01].bytes, 8)
+
+    def test_capture_replay(self):
+        fd, path = tempfile.mkstemp('.pcapng')
+        os.close(fd)
+        try:
+            cap = usb.capture.start(path)
+            try:
+                self.dev.write(0x01, utils.get_array_data1())
+                data = self.dev.read(0x81, 8)
+                ctrl = self.dev.ctrl_transfer(0xc0, 0x11, 0, 0, 4)
+            finally:
+                usb.capture.stop()
+            # the device and configuration descriptors, written by the
+            # writer thread, and the three transfers
+            self.assertEqual((cap.packets, cap.dropped), (10, 0))
+            dev = usb.core.find(backend=replay.get_backend(path))
+            self.assertEqual(dev.idProduct, self.dev.idProduct)
+            self.assertEqual(dev.read(0x81, 8), data)
+            self.assertEqual(dev.ctrl_transfer(0xc0, 0x11, 0, 0, 4), ctrl)
+            usb.util.dispose_resources(dev)
+        finally:
+            os.remove(path)
+
+class ForkTest(unittest.TestCase):
+    def test_fork(self):
+        backend = sim.get_backend([sim.loopback_device()])
+        opened = []
+        open_device = backend.open_device
+        def counting_open(dev):
+            opened.append(dev)
+            return open_device(dev)
+        backend.open_device = counting_open
+        dev = usb.core.find(backend=backend)
+        dev.set_configuration()
+        data = utils.get_array_data1(8)
+        dev.write(0x01, data * 2)
+        ctx = dev._ctx
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                # the parent's handle is dropped and a new one opened
+                if ctx.handle is None and dev.read(0x81, 8) == data and \
+                        len(opened) == 2:
+                    status = 0
+            finally:
+                os._exit(status)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        self.assertEqual(len(opened), 1)
+        self.assertEqual(dev.read(0x81, 8), data)
+        usb.util.dispose_resources(dev)
+
+def get_suite():
+    suite = unittest.defaultTestLoader.loadTestsFromTestCase(SimBackendTest)
+    if hasattr(os, 'fork') and hasattr(os, 'register_at_fork'):
+        suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(ForkTest))
+    return suite
+
+if __name__ == '__main__':
+    utils.run_tests(get_suite())
@@ -0,0 +1,99 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import utils
+import unittest
+import errno
+import usb.util
+from usb.core import USBError, USBTransferCancelled
+from usb._stats import DeviceStats, LatencyHistogram
+
+class LatencyHistogramTest(unittest.TestCase):
+    def test_record(self):
+        h = LatencyHistogram()
+        for v in range(1, 1001):
+            h.record(v)
+        self.assertEqual(h.count, 1000)
+        self.assertEqual(h.min, 1)
+        self.assertEqual(h.max, 1000)
+        # the relative error is below 1/16
+        for p, v in ((50, 500), (90, 900), (99, 990)):
+            self.assertTrue(abs(h.percentile(p) - v) <= v / 16.0)
+        self.assertEqual(sum([b[2] for b in h.buckets()]), 1000)
+        for low, high, count in h.buckets():
+            self.assertTrue(low <= high)
+
+    def test_reset(self):
+        h = LatencyHistogram()
+        h.record(10)
+        h.reset()
+        self.assertEqual(h.count, 0)
+        self.assertEqual(h.percentile(50), None)
+        self.assertEqual(h.buckets(), [])
+
+class DeviceStatsTest(unittest.TestCase):
+    def test_counters(self):
+        s = DeviceStats()
+        bulk = usb.util.ENDPOINT_TYPE_BULK
+        s.record(0x81, bulk, 64, 64, 0.001)
+        s.record(0x81, bulk, 64, 10, 0.001)
+        s.record_error(0x81, bulk, USBError('timeout', None, errno.ETIMEDOUT), 1.0)
+        s.record(0x81, bulk, 64, 64, 0.001)
+        s.record_error(0x81, bulk, USBError('io', None, errno.EIO), 0.001)
+        s.record_error(0x81, bulk, USBTransferCancelled(), 0.001)
+        s.record(0, usb.util.ENDPOINT_TYPE_CTRL, 0, 0, 0.0001)
+
+        ep = s[0x81]
+        self.assertEqual(ep.transfers, 6)
+        self.assertEqual(ep.bytes, 138)
+        self.assertEqual(ep.short, 1)
+        self.assertEqual(ep.timeouts, 1)
+        self.assertEqual(ep.errors, 1)
+        self.assertEqual(ep.cancelled, 1)
+        self.assertEqual(ep.retries, 2)
+        self.assertEqual(ep.latency.count, 6)
+        self.assertEqual([e.endpoint for e in s], [0, 0x81])
+
+        snap = s.snapshot()
+        self.assertEqual(snap['endpoints'][0x81]['bytes'], 138)
+        self.assertEqual(snap['types']['bulk']['transfers'], 6)
+        self.assertEqual(snap['types']['control']['transfers'], 1)
+
+        s.reset()
+        self.assertEqual(s[0x81].transfers, 0)
+        # snapshots are not affected by a reset
+        self.assertEqual(snap['endpoints'][0x81]['transfers'], 6)
+
+def get_suite():
+    suite = unittest.TestSuite()
+    for t in (LatencyHistogramTest, DeviceStatsTest):
+        suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(t))
+    return suite
+
+if __name__ == '__main__':
+    utils.run_tests(get_suite())
@@ -0,0 +1,120 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import utils
+import unittest
+import time
+import usb.core
+import usb.util
+import usb._interop as _interop
+import usb.backend._workers as _workers
+import usb.backend.sim as sim
+
+# the simulated backend with threads in place of its asynchronous transfers
+class _ThreadedBackend(_workers.ThreadedTransfers, sim._SimBackend):
+    def close_device(self, dev_handle):
+        self.close_pool(dev_handle)
+        sim._SimBackend.close_device(self, dev_handle)
+
+class ThreadedTransfersTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = _ThreadedBackend([sim.loopback_device()])
+        self.dev = usb.core.find(backend=self.backend)
+        self.dev.set_configuration()
+        self.handle = self.dev._ctx.handle
+
+    def tearDown(self):
+        usb.util.dispose_resources(self.dev)
+
+    def submit(self, ep, data, timeout = 1000, callback = None):
+        return self.backend.submit_transfer(self.handle, ep, 0,
+                                            usb.util.ENDPOINT_TYPE_BULK,
+                                            data, timeout, callback)
+
+    def test_transfer(self):
+        data = utils.get_array_data1()
+        buff = _interop.as_array([0]) * len(data)
+        completed = []
+        read = self.submit(0x81, buff, callback = completed.append)
+        # the write runs in another thread, or the read would time out
+        write = self.submit(0x01, data)
+        self.assertEqual(self.backend.wait_transfer(write), len(data))
+        self.assertEqual(self.backend.wait_transfer(read), len(data))
+        self.assertEqual(buff, data)
+        self.assertEqual(completed, [read])
+
+    def test_order(self):
+        writes = [self.submit(0x01, utils.get_array_data1(4)),
+                  self.submit(0x01, utils.get_array_data2(4))]
+        for t in writes:
+            self.backend.wait_transfer(t)
+        buff = _interop.as_array([0]) * 8
+        self.backend.wait_transfer(self.submit(0x81, buff))
+        self.assertEqual(buff, utils.get_array_data1(4) +
+                               utils.get_array_data2(4))
+
+    def test_cancel(self):
+        buff = _interop.as_array([0]) * 8
+        running = self.submit(0x81, buff, 300)
+        queued = self.submit(0x81, buff, 300)
+        time.sleep(0.05)
+        start = time.time()
+        self.backend.cancel_transfer(queued)
+        self.backend.cancel_transfer(running)
+        self.assertRaises(usb.core.USBTransferCancelled,
+                          self.backend.wait_transfer, running)
+        self.assertRaises(usb.core.USBTransferCancelled,
+                          self.backend.wait_transfer, queued)
+        self.assertTrue(time.time() - start < 0.2)
+
+    def test_close(self):
+        running = self.submit(0x81, _interop.as_array([0]) * 8, 100)
+        self.submit(0x81, _interop.as_array([0]) * 8, 100)
+        time.sleep(0.02)
+        # the running read ends before the device can be closed
+        self.backend.close_pool(self.handle)
+        for thread in running.pool.threads:
+            self.assertFalse(thread.is_alive())
+        self.assertRaises(usb.core.USBError, self.backend.wait_transfer,
+                          running)
+
+    def test_error(self):
+        t = self.submit(0x81, _interop.as_array([0]) * 8, 10)
+        self.assertRaises(usb.core.USBError, self.backend.wait_transfer, t)
+
+    def test_blocking_io(self):
+        # Device I/O does not go through the worker threads
+        self.dev.write(0x01, utils.get_array_data1())
+        self.assertEqual(self.dev.read(0x81, 8), utils.get_array_data1())
+        self.assertFalse(self.dev._ctx.async_transfers)
+
+def get_suite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(ThreadedTransfersTest)
+
+if __name__ == '__main__':
+    utils.run_tests(get_suite())
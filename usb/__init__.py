@@ -38,15 +38,28 @@ Since version 1.0, main PyUSB implementation lives in the 'usb.core'
 module. New applications are encouraged to use it.
 """
 
-import logging
 import os
+import sys
 
 __author__ = 'Wander Lairson Costa'
 
 __all__ = ['legacy', 'core', 'backend', 'util']
 
+# modules loaded on first access, see __getattr__
+_submodules = ('legacy', 'core', 'backend', 'util', 'control')
 
+_log_configured = False
+
+# Called by the modules which log (usb.core and usb._debug, which the
+# backends import) when they load, so applications which only use
+# usb.util do not pay for the logging setup.
 def _setup_log():
+    global _log_configured
+    if _log_configured:
+        return
+    _log_configured = True
+
+    import logging
     from usb import _debug
     logger = logging.getLogger('usb')
     debug_level = os.getenv('PYUSB_DEBUG_LEVEL')
@@ -84,9 +97,24 @@ def _setup_log():
 
         logger.addHandler(NullHandler())
 
-
-_setup_log()
-
-# We import all 'legacy' module symbols to provide compatility
-# with applications that use 0.x versions.
-from usb.legacy import *
+# Since Python 3.7, modules can define __getattr__ (PEP 562), so the
+# submodules and the 'legacy' module symbols, which we export to provide
+# compatibility with applications that use 0.x versions, are only imported
+# when first accessed. Older versions import them right away.
+def __getattr__(name):
+    if name.startswith('_'):
+        raise AttributeError("module 'usb' has no attribute '%s'" % (name,))
+    if name in _submodules:
+        __import__('usb.' + name)
+        return sys.modules['usb.' + name]
+    __import__('usb.legacy')
+    try:
+        value = getattr(sys.modules['usb.legacy'], name)
+    except AttributeError:
+        raise AttributeError("module 'usb' has no attribute '%s'" % (name,))
+    globals()[name] = value
+    return value
+
+if sys.version_info < (3, 7):
+    _setup_log()
+    from usb.legacy import *
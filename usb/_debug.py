@@ -26,52 +26,287 @@
 # NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
 # MODIFICATIONS.
 
+r"""Tracing of backend calls.
+
+Backend methods are marked with the methodtrace() decorator (and free
+functions with the functiontrace() decorator). While tracing is disabled,
+the decorated functions are left untouched, so they cost nothing. Calling
+enable_tracing(True) at any time replaces them by wrappers which write a
+fixed size binary record for each call into a ring buffer:
+
+    timestamp - time.perf_counter() value when the call started.
+    duration - call duration in seconds.
+    function - the index of the function in the function table.
+    endpoint - the endpoint address, or -1 for calls without one.
+    length - the number of bytes requested, or -1 for calls without one.
+    status - the value returned by the call (the number of bytes
+             transferred for I/O calls) or, if it raised an exception,
+             minus the errno value of the exception (-1 if unknown).
+
+Arguments are never formatted, so tracing is cheap enough to be turned on
+in a running process. The records are retrieved with trace_records(), and
+dump_trace() saves them along with the function table to a file that
+load_trace() decodes later. If the logger of the traced function has the
+DEBUG level enabled, a short log message is also emitted for each call.
+"""
+
 __author__ = 'Wander Lairson Costa'
 
-__all__ = ['methodtrace', 'functiontrace']
+__all__ = ['methodtrace', 'functiontrace', 'enable_tracing', 'trace_records',
+           'function_name', 'dump_trace', 'load_trace', 'format_records',
+           'TraceRecord']
 
 import logging
+import struct
+import sys
+import itertools
 import usb._interop as _interop
 
+try:
+    import collections
+    TraceRecord = collections.namedtuple(
+                        'TraceRecord',
+                        'timestamp duration function endpoint length status'
+                    )
+except (ImportError, AttributeError):
+    TraceRecord = tuple
+
+# timestamp, duration, function, endpoint, length, status
+_RECORD = struct.Struct('<dfHhii')
+
+_DUMP_MAGIC = b'PYUSBTRC'
+_DUMP_HEADER = struct.Struct('<8sHHI')
+_DUMP_VERSION = 1
+
+_DEFAULT_CAPACITY = 65536
+
 _enable_tracing = False
+_tracer = None
 
-def enable_tracing(enable):
-    global _enable_tracing
-    _enable_tracing = enable
+# all decorated functions, the position in the list is the function id
+_traced = []
 
-def _trace_function_call(logger, fname, *args, **named_args):
-    logger.debug(
-                # TODO: check if 'f' is a method or a free function
-                fname + '(' + \
-                ', '.join((str(val) for val in args)) + \
-                ', '.join((name + '=' + str(val) for name, val in named_args.items())) + ')'
-            )
+class _Tracer(object):
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * _RECORD.size)
+        self.counter = itertools.count()
+        self.total = 0
+
+    def record(self, start, fid, ep, length, status):
+        # next() on a count object is atomic, so concurrent threads never
+        # get the same slot
+        i = _interop._next(self.counter)
+        _RECORD.pack_into(self.buffer,
+                          (i % self.capacity) * _RECORD.size,
+                          start,
+                          _interop._perf_counter() - start,
+                          fid,
+                          ep,
+                          length,
+                          status)
+        self.total = i + 1
+
+    def records(self):
+        buf = bytes(self.buffer)
+        total = self.total
+        n = min(total, self.capacity)
+        return [TraceRecord(*_RECORD.unpack_from(buf,
+                                ((total - n + i) % self.capacity) * _RECORD.size))
+                    for i in range(n)]
+
+def _arg_index(f, names):
+    code = getattr(f, '__code__', None) or f.func_code
+    argnames = code.co_varnames[:code.co_argcount]
+    for n in names:
+        if n in argnames:
+            return argnames.index(n), n
+    return None, None
+
+def _get_arg(args, named_args, index, name):
+    if index is None:
+        return None
+    if index < len(args):
+        return args[index]
+    return named_args.get(name)
+
+# the length and status fields are 32 bits wide
+def _clamp(value):
+    return max(-0x80000000, min(value, 0x7fffffff))
+
+# the size in bytes of a sequence, or the value of an integer. int() is
+# not tried on sequences, as it parses the contents of bytes-like objects.
+def _size(value):
+    if hasattr(value, '__len__'):
+        return _clamp(len(value) * getattr(value, 'itemsize', 1))
+    return _clamp(int(value))
+
+def _get_length(value):
+    if value is None:
+        return -1
+    try:
+        return _size(value)
+    except (TypeError, ValueError):
+        return -1
+
+def _get_status(value):
+    if value is None:
+        return 0
+    try:
+        return _size(value)
+    except (TypeError, ValueError):
+        return 0
+
+class _TracedFunction(object):
+    def __init__(self, f, logger):
+        self.function = f
+        self.logger = logger
+        self.id = len(_traced)
+        self.name = f.__module__.split('.')[-1] + '.' + \
+                    getattr(f, '__qualname__', f.__name__)
+        self.wrapper = self.__make_wrapper()
+
+    def __make_wrapper(self):
+        f = self.function
+        logger = self.logger
+        fid = self.id
+        name = self.name
+        ep_index, ep_name = _arg_index(f, ('ep', 'endpoint'))
+        len_index, len_name = _arg_index(f, ('size', 'data_or_wLength', 'data'))
 
-# decorator for methods calls tracing
-def methodtrace(logger):
-    def decorator_logging(f):
-        if not _enable_tracing:
-            return f
         def do_trace(*args, **named_args):
-            # this if is just a optimization to avoid unecessary string formatting
-            if logging.DEBUG >= logger.getEffectiveLevel():
-                fn = type(args[0]).__name__ + '.' + f.__name__
-                _trace_function_call(logger, fn, *args[1:], **named_args)
-            return f(*args, **named_args)
+            start = _interop._perf_counter()
+            ep = _get_arg(args, named_args, ep_index, ep_name)
+            if ep is None:
+                ep = -1
+            length = _get_length(_get_arg(args, named_args, len_index, len_name))
+            try:
+                ret = f(*args, **named_args)
+            except Exception:
+                status = -(getattr(sys.exc_info()[1], 'errno', None) or 1)
+                _tracer.record(start, fid, ep, length, status)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug('%s(ep=%d, length=%d) failed: %d',
+                                 name, ep, length, status)
+                raise
+            status = _get_status(ret)
+            _tracer.record(start, fid, ep, length, status)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('%s(ep=%d, length=%d) = %d', name, ep, length, status)
+            return ret
+
         _interop._update_wrapper(do_trace, f)
         return do_trace
-    return decorator_logging
+
+    def install(self, enable):
+        # look for the class (or module) holding the function and replace it
+        if enable:
+            old, new = self.function, self.wrapper
+        else:
+            old, new = self.wrapper, self.function
+        module = sys.modules.get(self.function.__module__)
+        if module is None:
+            return
+        if vars(module).get(self.function.__name__) is old:
+            setattr(module, self.function.__name__, new)
+        for obj in list(vars(module).values()):
+            if isinstance(obj, type) and \
+                    obj.__dict__.get(self.function.__name__) is old:
+                setattr(obj, self.function.__name__, new)
+
+def _register(f, logger):
+    t = _TracedFunction(f, logger)
+    _traced.append(t)
+    # the function is not bound to its class or module yet
+    if _enable_tracing:
+        return t.wrapper
+    return f
+
+def enable_tracing(enable, capacity = None):
+    r"""Turn the tracing of backend calls on or off.
+
+    This can be done at any time. capacity is the maximum number of records
+    kept in the ring buffer. Changing it drops the records collected so far.
+    """
+    global _enable_tracing, _tracer
+    if capacity is None:
+        capacity = _DEFAULT_CAPACITY
+    if _tracer is None or _tracer.capacity != capacity:
+        _tracer = _Tracer(capacity)
+    if bool(enable) != _enable_tracing:
+        _enable_tracing = bool(enable)
+        for t in _traced:
+            t.install(_enable_tracing)
+
+def trace_records():
+    r"""Return the list of TraceRecord objects in the ring buffer, oldest first."""
+    if _tracer is None:
+        return []
+    return _tracer.records()
+
+def function_name(fid):
+    r"""Return the name of the traced function with the given id."""
+    return _traced[fid].name
+
+def dump_trace(f):
+    r"""Write the ring buffer contents to the binary file object f.
+
+    The function table goes along with the records, so the dump can be
+    decoded by load_trace() in another process.
+    """
+    records = trace_records()
+    f.write(_DUMP_HEADER.pack(_DUMP_MAGIC, _DUMP_VERSION, len(_traced), len(records)))
+    for t in _traced:
+        name = t.name.encode('utf-8')
+        f.write(struct.pack('<H', len(name)) + name)
+    for r in records:
+        f.write(_RECORD.pack(*r))
+
+def load_trace(f):
+    r"""Decode a dump written by dump_trace() from the binary file object f.
+
+    Return a tuple with the list of function names, indexed by function id,
+    and the list of TraceRecord objects.
+    """
+    magic, version, nfuncs, nrecords = _DUMP_HEADER.unpack(f.read(_DUMP_HEADER.size))
+    if magic != _DUMP_MAGIC or version != _DUMP_VERSION:
+        raise ValueError('Not a PyUSB trace dump')
+    names = []
+    for i in range(nfuncs):
+        n = struct.unpack('<H', f.read(2))[0]
+        names.append(f.read(n).decode('utf-8'))
+    data = f.read(nrecords * _RECORD.size)
+    records = [TraceRecord(*_RECORD.unpack_from(data, i * _RECORD.size))
+                    for i in range(nrecords)]
+    return names, records
+
+def format_records(names, records):
+    r"""Return a list of strings describing the records, one per record."""
+    lines = []
+    for r in records:
+        lines.append('%.6f %10.1fus %s ep=%d length=%d status=%d' % (
+                        r[0], r[1] * 1e6, names[r[2]], r[3], r[4], r[5]))
+    return lines
 
 # decorator for methods calls tracing
+def methodtrace(logger):
+    def decorator_logging(f):
+        return _register(f, logger)
+    return decorator_logging
+
+# decorator for functions calls tracing
 def functiontrace(logger):
     def decorator_logging(f):
-        if not _enable_tracing:
-            return f
-        def do_trace(*args, **named_args):
-            # this if is just a optimization to avoid unecessary string formatting
-            if logging.DEBUG >= logger.getEffectiveLevel():
-                _trace_function_call(logger, f.__name__, *args, **named_args)
-            return f(*args, **named_args)
-        _interop._update_wrapper(do_trace, f)
-        return do_trace
+        return _register(f, logger)
     return decorator_logging
+
+# the backends import this module, so it is time to set up the logging
+# (this is done last because it may call enable_tracing())
+import usb
+usb._setup_log()
+
+if __name__ == '__main__':
+    # decode a dump: python -m usb._debug trace.bin
+    names, records = load_trace(open(sys.argv[1], 'rb'))
+    for line in format_records(names, records):
+        sys.stdout.write(line + '\n')
@@ -34,7 +34,8 @@
 import sys
 import array
 
-__all__ = ['_reduce', '_set', '_next', '_groupby', '_sorted', '_update_wrapper']
+__all__ = ['_reduce', '_set', '_next', '_groupby', '_sorted', '_update_wrapper',
+           '_perf_counter', '_tobytes']
 
 # we support Python >= 2.3
 assert sys.hexversion >= 0x020300f0
@@ -123,6 +124,149 @@ except (ImportError, AttributeError):
         wrapper.__doc__ = wrapped.__doc__
         wrapper.__dict__ = wrapped.__dict__
 
+# high resolution clock for measuring intervals is available since 3.3 version
+try:
+    import time
+    _perf_counter = time.perf_counter
+except AttributeError:
+    if sys.platform == 'win32':
+        _perf_counter = time.clock
+    else:
+        _perf_counter = time.time
+
+# array.tostring() was renamed to tobytes() in 3.2 version and
+# removed in 3.9 version
+if hasattr(array.array, 'tobytes'):
+    def _tobytes(a):
+        return a.tobytes()
+else:
+    def _tobytes(a):
+        return a.tostring()
+
+# array.fromstring() was renamed to frombytes() in 3.2 version too
+if hasattr(array.array, 'frombytes'):
+    def _frombuffer(a, data):
+        a.frombytes(data)
+else:
+    def _frombuffer(a, data):
+        a.fromstring(str(data))
+
+# Return the exception being handled, dropping its traceback: the frames in
+# the traceback keep their local variables, such as buffer views, alive.
+def _exception():
+    exc = sys.exc_info()[1]
+    e = exc
+    while e is not None:
+        if hasattr(e, '__traceback__'):
+            e.__traceback__ = None
+        e = getattr(e, '__cause__', None) or getattr(e, '__context__', None)
+    if hasattr(sys, 'exc_clear'):
+        sys.exc_clear()
+    return exc
+
+# memoryview is available since 2.7 version, but the arrays of Python 2
+# do not export their buffer through it
+try:
+    _memoryview = memoryview
+except NameError:
+    _memoryview = None
+
+# Return the items start:end of a buffer, to be transferred in place. Where
+# the buffer cannot be viewed, the items are copied, and _release() copies
+# them back.
+def _slice(data, start, end):
+    if _memoryview is not None:
+        try:
+            return _memoryview(data)[start:end]
+        except TypeError:
+            pass
+    return data[start:end]
+
+# Release a slice taken by _slice() from data at start, once count items
+# were read into it.
+def _release(piece, data, start, count):
+    if _memoryview is not None and isinstance(piece, _memoryview):
+        # memoryview.release() is available since 3.2 version
+        if hasattr(piece, 'release'):
+            piece.release()
+    elif count:
+        data[start:start + count] = piece[:count]
+
+# Return the address of the data of a read-only buffer, as ctypes only
+# takes writable ones. This needs the CPython buffer API.
+def _readonly_address(m):
+    import ctypes
+    class Py_buffer(ctypes.Structure):
+        _fields_ = [('buf', ctypes.c_void_p),
+                    ('obj', ctypes.c_void_p),
+                    ('len', ctypes.c_ssize_t),
+                    ('itemsize', ctypes.c_ssize_t),
+                    ('readonly', ctypes.c_int),
+                    ('ndim', ctypes.c_int),
+                    ('format', ctypes.c_char_p),
+                    ('shape', ctypes.c_void_p),
+                    ('strides', ctypes.c_void_p),
+                    ('suboffsets', ctypes.c_void_p),
+                    ('internal', ctypes.c_void_p)]
+    view = Py_buffer()
+    api = ctypes.pythonapi
+    api.PyObject_GetBuffer.argtypes = [ctypes.py_object,
+                                       ctypes.POINTER(Py_buffer),
+                                       ctypes.c_int]
+    api.PyBuffer_Release.argtypes = [ctypes.POINTER(Py_buffer)]
+    # PyBUF_SIMPLE
+    api.PyObject_GetBuffer(m, ctypes.byref(view), 0)
+    # the data lives as long as the object, as for writable buffers
+    address = view.buf
+    api.PyBuffer_Release(ctypes.byref(view))
+    return address
+
+def _has_readonly_address():
+    try:
+        import ctypes
+        return hasattr(ctypes, 'pythonapi') and \
+               hasattr(ctypes.pythonapi, 'PyObject_GetBuffer')
+    except ImportError:
+        return False
+
+# Return the address and the length in bytes of a transfer buffer. Besides
+# arrays, the backends accept any object exporting a buffer (bytearray,
+# mmap, memoryview), so data can be read in place; read-only ones (bytes)
+# can only be written.
+def _buffer_info(data):
+    try:
+        address, length = data.buffer_info()
+        return address, length * data.itemsize
+    except AttributeError:
+        import ctypes
+        m = memoryview(data)
+        length = len(m) * m.itemsize
+        if not length:
+            return 0, 0
+        if m.readonly:
+            return _readonly_address(m), length
+        return ctypes.addressof((ctypes.c_char * length).from_buffer(m)), length
+
+# Return data to be sent in a transfer: arrays as they are, objects
+# exporting a buffer of bytes (bytearray, bytes, mmap, ...) as a memoryview
+# of it, so they are not copied, and anything else converted to an array.
+# memoryview.cast() is available since 3.3 version.
+def _byte_buffer(data):
+    if _memoryview is not None and not isinstance(data, array.array):
+        try:
+            m = _memoryview(data)
+        except TypeError:
+            pass
+        else:
+            if m.itemsize == 1 and hasattr(m, 'cast') and \
+                    (not m.readonly or _has_readonly_address()):
+                try:
+                    return m.cast('B')
+                except TypeError:
+                    # not contiguous
+                    pass
+    return as_array(data)
+
 def as_array(data=None):
     if data is None:
         return array.array('B')
@@ -0,0 +1,292 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+r"""Transfer statistics collected by usb.core.Device.
+
+Statistics are disabled by default. Device.enable_stats() attaches a
+DeviceStats object to the device, available through the Device.stats
+attribute.
+"""
+
+__author__ = 'Wander Lairson Costa'
+
+__all__ = ['DeviceStats', 'EndpointStats', 'LatencyHistogram']
+
+import array
+import errno
+import math
+import usb.util as util
+import usb._interop as _interop
+
+# Latency histogram layout. Values are recorded in microseconds. The first
+# _SUB_BUCKETS values have one bucket each; after that, every power of two
+# range is split in _SUB_BUCKETS linear buckets, which gives a relative
+# error below 1/_SUB_BUCKETS in the whole range (like HdrHistogram does).
+_SUB_BUCKET_BITS = 4
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+# enough buckets for values up to 2**32 microseconds (more than one hour)
+_MAX_SHIFT = 32 - _SUB_BUCKET_BITS
+_NUM_BUCKETS = (_MAX_SHIFT + 2) * _SUB_BUCKETS
+
+_TYPE_NAMES = {
+    util.ENDPOINT_TYPE_CTRL:'control',
+    util.ENDPOINT_TYPE_ISO:'isochronous',
+    util.ENDPOINT_TYPE_BULK:'bulk',
+    util.ENDPOINT_TYPE_INTR:'interrupt'
+}
+
+_ETIMEDOUT = errno.__dict__.get('ETIMEDOUT', None)
+_ECANCELED = errno.__dict__.get('ECANCELED', None)
+
+# int.bit_length() is only available since 2.7 version
+if hasattr(1, 'bit_length'):
+    def _bit_length(value):
+        return value.bit_length()
+else:
+    def _bit_length(value):
+        return math.frexp(value)[1]
+
+def _bucket_index(value):
+    if value < _SUB_BUCKETS:
+        return value
+    shift = _bit_length(value) - _SUB_BUCKET_BITS - 1
+    if shift > _MAX_SHIFT:
+        return _NUM_BUCKETS - 1
+    return (shift << _SUB_BUCKET_BITS) + (value >> shift)
+
+def _bucket_bounds(index):
+    if index < _SUB_BUCKETS:
+        return index, index
+    shift = (index >> _SUB_BUCKET_BITS) - 1
+    sub = index - (shift << _SUB_BUCKET_BITS)
+    return sub << shift, ((sub + 1) << shift) - 1
+
+class LatencyHistogram(object):
+    r"""Log-linear histogram of transfer latencies.
+
+    Latencies are recorded in microseconds with a relative precision
+    better than 6.25%. Recording a value does not allocate memory.
+    """
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = array.array('L', (0,)) * _NUM_BUCKETS
+        self.reset()
+
+    def record(self, usecs):
+        r"""Record a latency value in microseconds."""
+        self.counts[_bucket_index(usecs)] += 1
+        self.count += 1
+        self.total += usecs
+        if usecs > self.max:
+            self.max = usecs
+        if self.min is None or usecs < self.min:
+            self.min = usecs
+
+    def reset(self):
+        r"""Forget all recorded values."""
+        counts = self.counts
+        for i in range(_NUM_BUCKETS):
+            counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def percentile(self, p):
+        r"""Return the latency in microseconds below which p percent of
+        the recorded values fall, or None if nothing was recorded."""
+        if not self.count:
+            return None
+        threshold = self.count * p / 100.0
+        acc = 0
+        counts = self.counts
+        for i in range(_NUM_BUCKETS):
+            acc += counts[i]
+            if acc >= threshold and counts[i]:
+                return min(_bucket_bounds(i)[1], self.max)
+        return self.max
+
+    def buckets(self):
+        r"""Return a list of (low, high, count) tuples for the non-empty
+        buckets, with the bounds in microseconds."""
+        counts = self.counts
+        return [_bucket_bounds(i) + (counts[i],) \
+                    for i in range(_NUM_BUCKETS) if counts[i]]
+
+    def snapshot(self):
+        r"""Return a dictionary with a summary of the histogram."""
+        if self.count:
+            mean = float(self.total) / self.count
+        else:
+            mean = None
+        return {
+                'count':self.count,
+                'min':self.min,
+                'max':self.max,
+                'mean':mean,
+                'p50':self.percentile(50),
+                'p90':self.percentile(90),
+                'p99':self.percentile(99),
+                'p999':self.percentile(99.9),
+                'buckets':self.buckets()
+            }
+
+_COUNTERS = ('transfers', 'bytes', 'short', 'timeouts', 'errors',
+             'cancelled', 'retries')
+
+class EndpointStats(object):
+    r"""Transfer statistics of a single endpoint.
+
+    The counters are available as attributes:
+
+    transfers - number of transfers issued.
+    bytes - number of bytes transferred.
+    short - number of transfers which moved less than the requested
+            number of bytes.
+    timeouts - number of transfers which timed out.
+    errors - number of transfers which failed for other reasons.
+    cancelled - number of transfers cancelled by Device.cancel_pending().
+    retries - number of transfers issued right after a timed out or failed
+              transfer on the same endpoint.
+
+    The latency attribute is a LatencyHistogram object.
+    """
+    __slots__ = ('endpoint', 'type', 'latency', '_failed') + _COUNTERS
+
+    def __init__(self, endpoint, ep_type):
+        self.endpoint = endpoint
+        self.type = ep_type
+        self.latency = LatencyHistogram()
+        self.reset()
+
+    def reset(self):
+        r"""Zero all counters."""
+        for c in _COUNTERS:
+            setattr(self, c, 0)
+        self._failed = False
+        self.latency.reset()
+
+    def snapshot(self):
+        r"""Return a dictionary with the current counter values."""
+        d = dict([(c, getattr(self, c)) for c in _COUNTERS])
+        d['type'] = _TYPE_NAMES[self.type]
+        d['latency'] = self.latency.snapshot()
+        return d
+
+    def _start(self, elapsed):
+        self.transfers += 1
+        if self._failed:
+            self.retries += 1
+        self.latency.record(int(elapsed * 1000000))
+
+class DeviceStats(object):
+    r"""Transfer statistics of a device.
+
+    The statistics are kept by endpoint address; control transfers are
+    accounted to the endpoint 0. You access the EndpointStats object of an
+    endpoint by indexing the DeviceStats object with the endpoint address,
+    and iterate over all endpoints with transfers:
+
+    >>> dev.enable_stats()
+    >>> dev.read(0x81, 64)
+    >>> print dev.stats[0x81].bytes
+    >>> for ep in dev.stats:
+    >>>     print ep.endpoint, ep.transfers
+    """
+    def __init__(self):
+        self._endpoints = {}
+
+    def __getitem__(self, endpoint):
+        return self._endpoints[endpoint]
+
+    def __iter__(self):
+        endpoints = self._endpoints
+        for k in _interop._sorted(endpoints.keys()):
+            yield endpoints[k]
+
+    def record(self, endpoint, ep_type, requested, transferred, elapsed):
+        r"""Account a successful transfer.
+
+        requested and transferred are numbers of bytes and elapsed is the
+        transfer duration in seconds.
+        """
+        try:
+            s = self._endpoints[endpoint]
+        except KeyError:
+            s = self._endpoints[endpoint] = EndpointStats(endpoint, ep_type)
+        s._start(elapsed)
+        s._failed = False
+        s.bytes += transferred
+        if transferred < requested:
+            s.short += 1
+
+    def record_error(self, endpoint, ep_type, exc, elapsed):
+        r"""Account a failed transfer.
+
+        exc is the USBError exception raised by the transfer and elapsed is
+        the transfer duration in seconds.
+        """
+        try:
+            s = self._endpoints[endpoint]
+        except KeyError:
+            s = self._endpoints[endpoint] = EndpointStats(endpoint, ep_type)
+        s._start(elapsed)
+        # cancellation is requested by the application, it is not a failure
+        if _ECANCELED is not None and exc.errno == _ECANCELED:
+            s.cancelled += 1
+            return
+        s._failed = True
+        if _ETIMEDOUT is not None and exc.errno == _ETIMEDOUT:
+            s.timeouts += 1
+        else:
+            s.errors += 1
+
+    def reset(self):
+        r"""Zero the statistics of all endpoints."""
+        for s in self._endpoints.values():
+            s.reset()
+
+    def snapshot(self):
+        r"""Return a copy of the current statistics.
+
+        The return value is a dictionary with two keys: 'endpoints' maps
+        endpoint addresses to the snapshot of the respective EndpointStats
+        object, and 'types' maps transfer type names ('control', 'bulk',
+        'interrupt' and 'isochronous') to the sum of the counters of the
+        endpoints of that type.
+        """
+        endpoints = {}
+        types = {}
+        for s in self:
+            d = s.snapshot()
+            endpoints[s.endpoint] = d
+            t = types.setdefault(d['type'], dict([(c, 0) for c in _COUNTERS]))
+            for c in _COUNTERS:
+                t[c] += d[c]
+        return {'endpoints':endpoints, 'types':types}
@@ -75,9 +75,169 @@ __author__ = 'Wander Lairson Costa'
 
 __all__ = ['IBackend', 'libusb01', 'libusb10', 'openusb']
 
+import os
+import sys
+import logging
+
+_logger = logging.getLogger('usb.backend')
+
 def _not_implemented(func):
     raise NotImplementedError(func.__name__)
 
+class _Prototype(object):
+    r"""The argtypes and restype recorded for a library function."""
+    pass
+
+class _PrototypeTable(object):
+    r"""Record the prototypes of library functions.
+
+    It stands in for the ctypes library object passed to the _setup_prototypes()
+    function of the backends, so setting lib.func.argtypes only records the value.
+    """
+    def __init__(self, prototypes):
+        self._prototypes = prototypes
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._prototypes[name]
+        except KeyError:
+            p = self._prototypes[name] = _Prototype()
+            return p
+
+class _LazyLibrary(object):
+    r"""A ctypes library which binds the function prototypes on first access.
+
+    lib is the ctypes library object and setup_prototypes is a function
+    setting the argtypes and restype of the library functions, as in
+    setup_prototypes(lib). It runs against a _PrototypeTable, so no function
+    is looked up at this point; each one gets its prototype the first time
+    it is accessed, and is cached in the object dictionary afterwards, so
+    later calls cost the same as with the ctypes library object.
+    """
+    def __init__(self, lib, setup_prototypes):
+        self._lib = lib
+        self._prototypes = {}
+        setup_prototypes(_PrototypeTable(self._prototypes))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        # raises AttributeError if the library lacks the function
+        func = getattr(self._lib, name)
+        p = self._prototypes.get(name)
+        if p is not None:
+            for attr in ('argtypes', 'restype', 'errcheck'):
+                if attr in p.__dict__:
+                    setattr(func, attr, p.__dict__[attr])
+        self.__dict__[name] = func
+        return func
+
+def _library_cache_path():
+    path = os.getenv('PYUSB_LIBRARY_CACHE')
+    if path is not None:
+        return path
+    if sys.platform == 'win32':
+        base = os.getenv('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.getenv('XDG_CACHE_HOME') or \
+                os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pyusb', 'libraries')
+
+def _read_library_cache(path):
+    entries = {}
+    try:
+        f = open(path)
+        try:
+            for line in f:
+                key, sep, libname = line.rstrip('\n').partition('\t')
+                if sep and libname:
+                    entries[key] = libname
+        finally:
+            f.close()
+    except (IOError, OSError):
+        pass
+    return entries
+
+def _write_library_cache(path, entries):
+    # the cache is only a hint, failing to write it is harmless
+    tmp = '%s.%d' % (path, os.getpid())
+    try:
+        d = os.path.dirname(path)
+        if d and not os.path.isdir(d):
+            os.makedirs(d)
+        f = open(tmp, 'w')
+        try:
+            for key in sorted(entries):
+                f.write('%s\t%s\n' % (key, entries[key]))
+        finally:
+            f.close()
+        if sys.platform == 'win32' and os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        _logger.debug('Could not write the library cache %s', path, exc_info=True)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+def _load_library(name, candidates, loader, find_library = None):
+    r"""Load the shared library of a backend.
+
+    name is the backend name and candidates are the library names to look
+    for, which are handed to find_library() in turn until it returns
+    something other than None. loader is called with the result and
+    returns the library object; it raises OSError if the library cannot be
+    loaded or is not the right one.
+
+    find_library defaults to ctypes.util.find_library, which may spawn
+    external programs (ldconfig, gcc) and take a noticeable time, so its
+    result is kept in a cache file and looked up there first by later
+    processes. The cache file is given by the PYUSB_LIBRARY_CACHE
+    environment variable (an empty value disables the cache), and defaults
+    to the pyusb/libraries file in the user cache directory. Setting the
+    PYUSB_<NAME>_LIBRARY environment variable (PYUSB_LIBUSB1_LIBRARY, for
+    instance) skips the lookup and loads the library it names.
+    """
+    if find_library is None:
+        libname = os.getenv('PYUSB_%s_LIBRARY' % name.upper())
+        if libname:
+            return loader(libname)
+
+        cache = _library_cache_path()
+        if cache:
+            key = '%s-%s' % (name, sys.platform)
+            entries = _read_library_cache(cache)
+            libname = entries.get(key)
+            if libname is not None:
+                try:
+                    return loader(libname)
+                except OSError:
+                    _logger.debug('Cached library %s is stale', libname)
+
+        import ctypes.util
+        lookup = ctypes.util.find_library
+    else:
+        cache = None
+        lookup = find_library
+
+    for candidate in candidates:
+        libname = lookup(candidate)
+        if libname is not None:
+            break
+    else:
+        raise OSError('USB library could not be found')
+
+    lib = loader(libname)
+
+    if cache:
+        entries[key] = libname
+        _write_library_cache(cache, entries)
+
+    return lib
+
 class IBackend(object):
     r"""Backend interface.
 
@@ -342,6 +502,67 @@ class IBackend(object):
         """
         _not_implemented(self.ctrl_transfer)
 
+    def submit_transfer(self, dev_handle, ep, intf, ep_type, data, timeout,
+                        callback = None):
+        r"""Submit an asynchronous transfer.
+
+        dev_handle is the value returned by the open_device() method.
+        The ep parameter is the bEndpointAddress field of the endpoint and
+        intf is the bInterfaceNumber field of the interface containing it.
+        ep_type is the endpoint type, as returned by the
+        usb.util.endpoint_type() function. The data parameter is an
+        array.array object: for OUT endpoints it holds the data to be sent,
+        for IN endpoints it is the buffer which receives the data, and its
+        size is the number of bytes to read. The data object must not be
+        touched until the transfer completes. The timeout parameter specifies
+        a time limit to the operation in miliseconds.
+
+        If callback is not None, it is called with the transfer handle as its
+        only argument when the transfer completes, from the thread which
+        processes the backend events.
+
+        The method returns an implementation defined handle identifying the
+        transfer, which is passed to the wait_transfer() and
+        cancel_transfer() methods.
+        """
+        _not_implemented(self.submit_transfer)
+
+    def wait_transfer(self, transfer):
+        r"""Wait for an asynchronous transfer to complete.
+
+        transfer is the value returned by the submit_transfer() method.
+        Every transfer must be waited exactly once, which also releases
+        the resources allocated for it.
+
+        The method returns the number of bytes transferred. If the transfer
+        was cancelled by the cancel_transfer() method, it raises the
+        usb.core.USBTransferCancelled exception.
+        """
+        _not_implemented(self.wait_transfer)
+
+    def cancel_transfer(self, transfer):
+        r"""Cancel an asynchronous transfer.
+
+        transfer is the value returned by the submit_transfer() method.
+        The method returns immediately, the cancellation is reported to the
+        thread waiting for the transfer. Cancelling a transfer which has
+        already completed has no effect.
+        """
+        _not_implemented(self.cancel_transfer)
+
+    def handle_events(self, timeout):
+        r"""Process the completion of asynchronous transfers.
+
+        Backends whose transfers only complete while the application waits
+        for them implement this method, which completes the transfers
+        submitted with a callback, calling it, as their data arrives. It
+        returns once at least one transfer completed or after timeout
+        miliseconds, zero meaning just the ones ready. Backends completing
+        transfers by themselves (from their own threads) do not implement
+        it.
+        """
+        _not_implemented(self.handle_events)
+
     def reset_device(self, dev_handle):
         r"""Reset the device."""
         _not_implemented(self.reset_device)
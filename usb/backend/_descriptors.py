@@ -0,0 +1,139 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+# Parsing of raw USB descriptors, shared by the backends which work on
+# descriptor blobs instead of a native library (replay and sim).
+
+import struct
+import usb.util
+
+__author__ = 'Wander Lairson Costa'
+
+class Descriptor(object):
+    def __init__(self, fields, values):
+        for f, v in zip(fields, values):
+            setattr(self, f, v)
+
+DEVICE_FIELDS = ('bLength', 'bDescriptorType', 'bcdUSB', 'bDeviceClass',
+                 'bDeviceSubClass', 'bDeviceProtocol', 'bMaxPacketSize0',
+                 'idVendor', 'idProduct', 'bcdDevice', 'iManufacturer',
+                 'iProduct', 'iSerialNumber', 'bNumConfigurations')
+
+CONFIG_FIELDS = ('bLength', 'bDescriptorType', 'wTotalLength',
+                 'bNumInterfaces', 'bConfigurationValue', 'iConfiguration',
+                 'bmAttributes', 'bMaxPower')
+
+INTERFACE_FIELDS = ('bLength', 'bDescriptorType', 'bInterfaceNumber',
+                    'bAlternateSetting', 'bNumEndpoints', 'bInterfaceClass',
+                    'bInterfaceSubClass', 'bInterfaceProtocol', 'iInterface')
+
+ENDPOINT_FIELDS = ('bLength', 'bDescriptorType', 'bEndpointAddress',
+                   'bmAttributes', 'wMaxPacketSize', 'bInterval', 'bRefresh',
+                   'bSynchAddress')
+
+def _unpack(fmt, data, length):
+    data = data[:length]
+    if hasattr(data, 'tobytes'):
+        data = data.tobytes()
+    elif hasattr(data, 'tostring'):
+        data = data.tostring()
+    return struct.unpack(fmt, data)
+
+def _byte(data, i):
+    v = data[i]
+    if isinstance(v, int):
+        return v
+    return ord(v)
+
+def parse_device(data):
+    r"""Parse a device descriptor blob."""
+    return Descriptor(DEVICE_FIELDS, _unpack('<BBHBBBBHHHBBBB', data, 18))
+
+def parse_configuration(data):
+    r"""Parse a full configuration descriptor blob.
+
+    The interfaces attribute of the returned object is a list, by interface
+    index, of the lists of alternate settings, and the endpoints attribute
+    of each alternate setting is the list of its endpoints.
+    """
+    config = None
+    interfaces = []
+    i = 0
+    while i + 2 <= len(data):
+        length, dtype = _byte(data, i), _byte(data, i + 1)
+        if length < 2:
+            break
+        blob = data[i:i + length]
+        i += length
+        if dtype == usb.util.DESC_TYPE_CONFIG and len(blob) >= 9:
+            config = Descriptor(CONFIG_FIELDS, _unpack('<BBHBBBBB', blob, 9))
+        elif dtype == usb.util.DESC_TYPE_INTERFACE and len(blob) >= 9:
+            intf = Descriptor(INTERFACE_FIELDS, _unpack('<BBBBBBBBB', blob, 9))
+            intf.endpoints = []
+            for alts in interfaces:
+                if alts[0].bInterfaceNumber == intf.bInterfaceNumber:
+                    alts.append(intf)
+                    break
+            else:
+                interfaces.append([intf])
+        elif dtype == usb.util.DESC_TYPE_ENDPOINT and len(blob) >= 7 \
+                and interfaces:
+            if len(blob) >= 9:
+                values = _unpack('<BBBBHBBB', blob, 9)
+            else:
+                values = _unpack('<BBBBHB', blob, 7) + (0, 0)
+            interfaces[-1][-1].endpoints.append(
+                    Descriptor(ENDPOINT_FIELDS, values)
+                )
+    if config is not None:
+        config.interfaces = interfaces
+    return config
+
+def get_configuration(configurations, config):
+    r"""Return the configuration in the config index of a sequence."""
+    try:
+        return configurations[config]
+    except (KeyError, IndexError):
+        raise IndexError('Invalid configuration index ' + str(config))
+
+def get_interface(configurations, intf, alt, config):
+    r"""Return the alternate setting alt of the interface index intf."""
+    cfg = get_configuration(configurations, config)
+    if intf >= len(cfg.interfaces):
+        raise IndexError('Invalid interface index ' + str(intf))
+    alts = cfg.interfaces[intf]
+    if alt >= len(alts):
+        raise IndexError('Invalid alternate setting index ' + str(alt))
+    return alts[alt]
+
+def get_endpoint(configurations, ep, intf, alt, config):
+    r"""Return the endpoint index ep of an interface alternate setting."""
+    i = get_interface(configurations, intf, alt, config)
+    if ep >= len(i.endpoints):
+        raise IndexError('Invalid endpoint index ' + str(ep))
+    return i.endpoints[ep]
@@ -0,0 +1,266 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+r"""Asynchronous transfers on top of synchronous backend calls.
+
+Backends whose library has no asynchronous API inherit from the
+ThreadedTransfers class, which implements the submit_transfer(),
+wait_transfer() and cancel_transfer() methods of the IBackend interface
+by running the synchronous transfer methods (bulk_read(), intr_write(),
+etc.) in worker threads.
+
+Each open device gets a WorkerPool with one thread per endpoint, started
+on the first transfer of the endpoint. The transfers of an endpoint run
+one after the other in the order they were submitted, and the transfers
+of different endpoints run at the same time.
+
+A transfer cancelled before its thread picks it up is never run. A
+transfer already running cannot be interrupted: the thread waiting for
+it gets the USBTransferCancelled exception at once, while the call goes
+on in the background until it completes or times out, and its result is
+dropped. The next transfers of the endpoint wait for it, and so does
+closing the device.
+"""
+
+__author__ = 'Wander Lairson Costa'
+
+__all__ = ['WorkerPool', 'ThreadedTransfers']
+
+import sys
+import threading
+import usb.util
+
+_QUEUED = 0
+_RUNNING = 1
+_DONE = 2
+
+class _Transfer(object):
+    def __init__(self, pool, key, fn, args, callback):
+        self.pool = pool
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.callback = callback
+        self.state = _QUEUED
+        self.cancelled = False
+        self.result = None
+        self.error = None
+
+class WorkerPool(object):
+    r"""Run functions in worker threads, one thread per key.
+
+    The functions submitted with the same key run in order in the same
+    thread. The threads are daemon threads, started on the first
+    submission of each key, and finish when the pool is closed.
+    """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.queues = {}
+        self.threads = []
+        self.closed = False
+
+    def submit(self, key, fn, args, callback = None):
+        r"""Queue the call fn(*args) and return a handle to it.
+
+        callback is called with the handle when the call completes or is
+        cancelled.
+        """
+        t = _Transfer(self, key, fn, args, callback)
+        self.cond.acquire()
+        try:
+            if self.closed:
+                raise ValueError('The worker pool is closed')
+            q = self.queues.get(key)
+            if q is None:
+                q = self.queues[key] = []
+                thread = threading.Thread(target = self.__run, args = (q,))
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+            q.append(t)
+            self.cond.notify_all()
+        finally:
+            self.cond.release()
+        return t
+
+    def wait(self, transfer):
+        r"""Wait for the call and return its result.
+
+        Raises the exception raised by the call, or USBTransferCancelled
+        if it was cancelled.
+        """
+        self.cond.acquire()
+        try:
+            while transfer.state != _DONE:
+                self.cond.wait()
+        finally:
+            self.cond.release()
+        if transfer.cancelled:
+            from usb.core import USBTransferCancelled
+            raise USBTransferCancelled()
+        if transfer.error is not None:
+            raise transfer.error
+        return transfer.result
+
+    def cancel(self, transfer):
+        r"""Cancel the call if it has not completed yet."""
+        self.cond.acquire()
+        try:
+            if transfer.state == _DONE:
+                return
+            if transfer.state == _QUEUED:
+                self.queues[transfer.key].remove(transfer)
+            transfer.cancelled = True
+            transfer.state = _DONE
+            self.cond.notify_all()
+        finally:
+            self.cond.release()
+        self.__complete(transfer)
+
+    def close(self):
+        r"""Cancel the pending calls and wait for the threads to finish.
+
+        A call already running cannot be interrupted, so this returns
+        once it completes or times out.
+        """
+        self.cond.acquire()
+        try:
+            self.closed = True
+            queued = []
+            for q in self.queues.values():
+                queued.extend(q)
+        finally:
+            self.cond.release()
+        for t in queued:
+            self.cancel(t)
+        self.cond.acquire()
+        try:
+            self.cond.notify_all()
+        finally:
+            self.cond.release()
+        # the library handle must outlive the calls using it; a callback
+        # closing the pool runs in one of the threads, though
+        current = threading.current_thread()
+        for thread in self.threads:
+            if thread is not current:
+                thread.join()
+
+    def __run(self, queue):
+        while True:
+            self.cond.acquire()
+            try:
+                while not queue and not self.closed:
+                    self.cond.wait()
+                if not queue:
+                    return
+                t = queue.pop(0)
+                t.state = _RUNNING
+            finally:
+                self.cond.release()
+            try:
+                result, error = t.fn(*t.args), None
+            except Exception:
+                result, error = None, sys.exc_info()[1]
+            self.cond.acquire()
+            try:
+                # a cancelled transfer is already done
+                if t.state == _DONE:
+                    continue
+                t.result = result
+                t.error = error
+                t.state = _DONE
+                self.cond.notify_all()
+            finally:
+                self.cond.release()
+            self.__complete(t)
+
+    def __complete(self, transfer):
+        if transfer.callback is not None:
+            transfer.callback(transfer)
+
+class ThreadedTransfers(object):
+    r"""Asynchronous transfers for backends with synchronous I/O only.
+
+    This is a mixin for IBackend implementations. Subclasses must call
+    close_pool() from their close_device() method.
+    """
+
+    # blocking I/O gains nothing from running in a worker thread, so
+    # usb.core calls the synchronous methods directly
+    threaded_transfers = True
+
+    def submit_transfer(self, dev_handle, ep, intf, ep_type, data, timeout,
+                        callback = None):
+        if usb.util.endpoint_direction(ep) == usb.util.ENDPOINT_OUT:
+            fn_map = {
+                        usb.util.ENDPOINT_TYPE_BULK:self.bulk_write,
+                        usb.util.ENDPOINT_TYPE_INTR:self.intr_write,
+                        usb.util.ENDPOINT_TYPE_ISO:self.iso_write
+                    }
+            args = (dev_handle, ep, intf, data, timeout)
+        else:
+            fn_map = {
+                        usb.util.ENDPOINT_TYPE_BULK:self.bulk_read,
+                        usb.util.ENDPOINT_TYPE_INTR:self.intr_read,
+                        usb.util.ENDPOINT_TYPE_ISO:self.iso_read
+                    }
+            args = (dev_handle, ep, intf, data, len(data), timeout)
+        try:
+            fn = fn_map[ep_type]
+        except KeyError:
+            raise NotImplementedError('Transfer type not supported')
+        return self.__pool(dev_handle).submit(ep, fn, args, callback)
+
+    def wait_transfer(self, transfer):
+        return transfer.pool.wait(transfer)
+
+    def cancel_transfer(self, transfer):
+        transfer.pool.cancel(transfer)
+
+    def handle_events(self, timeout):
+        # the worker threads complete the transfers by themselves
+        raise NotImplementedError('handle_events')
+
+    def close_pool(self, dev_handle):
+        r"""Cancel the pending transfers of the device and stop its threads.
+
+        It returns once the transfer running on each endpoint completes or
+        times out, so the device can be closed afterwards.
+        """
+        pools = self.__dict__.get('_pools')
+        if pools is not None:
+            pool = pools.pop(id(dev_handle), None)
+            if pool is not None:
+                pool.close()
+
+    def __pool(self, dev_handle):
+        pools = self.__dict__.setdefault('_pools', {})
+        pool = pools.get(id(dev_handle))
+        if pool is None:
+            pool = pools.setdefault(id(dev_handle), WorkerPool())
+        return pool
@@ -27,9 +27,9 @@
 # MODIFICATIONS.
 
 from ctypes import *
-import ctypes.util
 import os
 import usb.backend
+import usb.backend._workers as _workers
 import usb.util
 import sys
 from usb.core import USBError
@@ -187,16 +187,13 @@ class _DeviceDescriptor:
         self.port_number = None
 _lib = None
 
-def _load_library():
+def _load_library(find_library=None):
     if sys.platform != 'cygwin':
         candidates = ('usb-0.1', 'usb', 'libusb0')
-        for candidate in candidates:
-            # Workaround for CPython 3.3 issue#16283 / pyusb #14
-            if sys.platform == 'win32':
-                candidate = candidate + '.dll'
-
-            libname = ctypes.util.find_library(candidate)
-            if libname is not None: break
+        # Workaround for CPython 3.3 issue#16283 / pyusb #14
+        if sys.platform == 'win32':
+            candidates = [c + '.dll' for c in candidates]
+        return usb.backend._load_library('libusb0', candidates, CDLL, find_library)
     else:
         # corner cases
         # cygwin predefines library names with 'cyg' instead of 'lib'
@@ -206,7 +203,6 @@ def _load_library():
             _logger.error('Libusb 0 could not be loaded in cygwin', exc_info=True)
 
         raise OSError('USB library could not be found')
-    return CDLL(libname)
 
 def _setup_prototypes(lib):
     # usb_dev_handle *usb_open(struct usb_device *dev);
@@ -392,7 +388,8 @@ def _check(retval):
     raise USBError(errmsg, ret)
 
 # implementation of libusb 0.1.x backend
-class _LibUSB(usb.backend.IBackend):
+# asynchronous transfers run the synchronous ones in worker threads
+class _LibUSB(_workers.ThreadedTransfers, usb.backend.IBackend):
     @methodtrace(_logger)
     def enumerate_devices(self):
         _check(_lib.usb_find_busses())
@@ -438,6 +435,7 @@ class _LibUSB(usb.backend.IBackend):
 
     @methodtrace(_logger)
     def close_device(self, dev_handle):
+        self.close_pool(dev_handle)
         _check(_lib.usb_close(dev_handle))
 
     @methodtrace(_logger)
@@ -556,8 +554,7 @@ class _LibUSB(usb.backend.IBackend):
         _check(_lib.usb_detach_kernel_driver_np(dev_handle, intf))
 
     def __write(self, fn, dev_handle, ep, intf, data, timeout):
-        address, length = data.buffer_info()
-        length *= data.itemsize
+        address, length = _interop._buffer_info(data)
         return int(_check(fn(
                         dev_handle,
                         ep,
@@ -570,8 +567,7 @@ class _LibUSB(usb.backend.IBackend):
         read_into = (data != None)
         if not read_into:
             data = _interop.as_array((0,) * size)
-        address, length = data.buffer_info()
-        length *= data.itemsize
+        address, length = _interop._buffer_info(data)
         ret = int(_check(fn(
                     dev_handle,
                     ep,
@@ -584,12 +580,16 @@ class _LibUSB(usb.backend.IBackend):
         else:
             return data[:ret]
 
-def get_backend():
+def get_backend(find_library=None):
+    r"""Return the libusb 0.1 backend, or None if it is not available.
+
+    find_library works as in usb.backend.libusb1.get_backend().
+    """
     global _lib
     try:
         if _lib is None:
-            _lib = _load_library()
-            _setup_prototypes(_lib)
+            _lib = usb.backend._LazyLibrary(_load_library(find_library),
+                                            _setup_prototypes)
             _lib.usb_init()
         return _LibUSB()
     except Exception:
@@ -27,13 +27,15 @@
 # MODIFICATIONS.
 
 from ctypes import *
-import ctypes.util
+import usb.backend
 import usb.util
 import sys
 import logging
 from usb._debug import methodtrace
 import usb._interop as _interop
 import errno
+import os
+import threading
 
 __author__ = 'Wander Lairson Costa'
 
@@ -76,6 +78,27 @@ LIBUSB_ERROR_NO_MEM = -11
 LIBUSB_ERROR_NOT_SUPPORTED = -12
 LIBUSB_ERROR_OTHER = -99
 
+# transfer types
+LIBUSB_TRANSFER_TYPE_CONTROL = 0
+LIBUSB_TRANSFER_TYPE_ISOCHRONOUS = 1
+LIBUSB_TRANSFER_TYPE_BULK = 2
+LIBUSB_TRANSFER_TYPE_INTERRUPT = 3
+
+# transfer status codes
+LIBUSB_TRANSFER_COMPLETED = 0
+LIBUSB_TRANSFER_ERROR = 1
+LIBUSB_TRANSFER_TIMED_OUT = 2
+LIBUSB_TRANSFER_CANCELLED = 3
+LIBUSB_TRANSFER_STALL = 4
+LIBUSB_TRANSFER_NO_DEVICE = 5
+LIBUSB_TRANSFER_OVERFLOW = 6
+
+# transfer flags
+LIBUSB_TRANSFER_SHORT_NOT_OK = 1 << 0
+LIBUSB_TRANSFER_FREE_BUFFER = 1 << 1
+LIBUSB_TRANSFER_FREE_TRANSFER = 1 << 2
+LIBUSB_TRANSFER_ADD_ZERO_PACKET = 1 << 3
+
 # map return codes to strings
 _str_error = {
     LIBUSB_SUCCESS:'Success (no error)',
@@ -112,6 +135,21 @@ _libusb_errno = {
     LIBUSB_ERROR_OTHER:None
 }
 
+# map transfer status codes to return codes
+_transfer_error = {
+    LIBUSB_TRANSFER_ERROR:LIBUSB_ERROR_IO,
+    LIBUSB_TRANSFER_TIMED_OUT:LIBUSB_ERROR_TIMEOUT,
+    LIBUSB_TRANSFER_STALL:LIBUSB_ERROR_PIPE,
+    LIBUSB_TRANSFER_NO_DEVICE:LIBUSB_ERROR_NO_DEVICE,
+    LIBUSB_TRANSFER_OVERFLOW:LIBUSB_ERROR_OVERFLOW
+}
+
+# map endpoint types to transfer types
+_transfer_type = {
+    usb.util.ENDPOINT_TYPE_BULK:LIBUSB_TRANSFER_TYPE_BULK,
+    usb.util.ENDPOINT_TYPE_INTR:LIBUSB_TRANSFER_TYPE_INTERRUPT
+}
+
 # Data structures
 
 class _libusb_endpoint_descriptor(Structure):
@@ -173,29 +211,49 @@ class _libusb_device_descriptor(Structure):
                 ('iSerialNumber', c_uint8),
                 ('bNumConfigurations', c_uint8)]
 
+class _libusb_iso_packet_descriptor(Structure):
+    _fields_ = [('length', c_uint),
+                ('actual_length', c_uint),
+                ('status', c_int)]
+
+# Windows backend uses stdcall calling convention for callbacks too
+if sys.platform == 'win32':
+    _CALLBACK_FUNC = WINFUNCTYPE
+else:
+    _CALLBACK_FUNC = CFUNCTYPE
+
+# void (*libusb_transfer_cb_fn)(struct libusb_transfer *transfer)
+_libusb_transfer_cb_fn_p = _CALLBACK_FUNC(None, c_void_p)
+
+class _libusb_transfer(Structure):
+    _fields_ = [('dev_handle', c_void_p),
+                ('flags', c_uint8),
+                ('endpoint', c_uint8),
+                ('type', c_uint8),
+                ('timeout', c_uint),
+                ('status', c_int),
+                ('length', c_int),
+                ('actual_length', c_int),
+                ('callback', _libusb_transfer_cb_fn_p),
+                ('user_data', c_void_p),
+                ('buffer', POINTER(c_ubyte)),
+                ('num_iso_packets', c_int),
+                ('iso_packet_desc', _libusb_iso_packet_descriptor * 0)]
+
+class _timeval(Structure):
+    _fields_ = [('tv_sec', c_long),
+                ('tv_usec', c_long)]
+
 _lib = None
 _init = None
 
-_libusb_device_handle = c_void_p
+# incremented in the child process after a fork(), so that objects
+# inherited from the parent can tell they are no longer usable
+_generation = 0
 
-def _load_library():
-    if sys.platform != 'cygwin':
-        candidates = ('usb-1.0', 'libusb-1.0', 'usb')
-        for candidate in candidates:
-            if sys.platform == 'win32':
-                candidate = candidate + '.dll'
-
-            libname = ctypes.util.find_library(candidate)
-            if libname is not None: break
-    else:
-        # corner cases
-        # cygwin predefines library names with 'cyg' instead of 'lib'
-        try:
-            return CDLL('cygusb-1.0.dll')
-        except Exception:
-            _logger.error('Libusb 1.0 could not be loaded in cygwin', exc_info=True)
+_libusb_device_handle = c_void_p
 
-        raise OSError('USB library could not be found')
+def _load(libname):
     # Windows backend uses stdcall calling convention
     if sys.platform == 'win32':
         l = WinDLL(libname)
@@ -208,6 +266,22 @@ def _load_library():
         raise OSError('USB library could not be found')
     return l
 
+def _load_library(find_library=None):
+    if sys.platform != 'cygwin':
+        candidates = ('usb-1.0', 'libusb-1.0', 'usb')
+        if sys.platform == 'win32':
+            candidates = [c + '.dll' for c in candidates]
+        return usb.backend._load_library('libusb1', candidates, _load, find_library)
+    else:
+        # corner cases
+        # cygwin predefines library names with 'cyg' instead of 'lib'
+        try:
+            return CDLL('cygusb-1.0.dll')
+        except Exception:
+            _logger.error('Libusb 1.0 could not be loaded in cygwin', exc_info=True)
+
+        raise OSError('USB library could not be found')
+
 def _setup_prototypes(lib):
     # void libusb_set_debug (libusb_context *ctx, int level)
     lib.libusb_set_debug.argtypes = [c_void_p, c_int]
@@ -385,6 +459,35 @@ def _setup_prototypes(lib):
                     c_uint
                 ]
 
+    # struct libusb_transfer *libusb_alloc_transfer(int iso_packets)
+    lib.libusb_alloc_transfer.argtypes = [c_int]
+    lib.libusb_alloc_transfer.restype = POINTER(_libusb_transfer)
+
+    # void libusb_free_transfer(struct libusb_transfer *transfer)
+    lib.libusb_free_transfer.argtypes = [POINTER(_libusb_transfer)]
+
+    # int libusb_submit_transfer(struct libusb_transfer *transfer)
+    lib.libusb_submit_transfer.argtypes = [POINTER(_libusb_transfer)]
+
+    # int libusb_cancel_transfer(struct libusb_transfer *transfer)
+    lib.libusb_cancel_transfer.argtypes = [POINTER(_libusb_transfer)]
+
+    # int libusb_handle_events_timeout(libusb_context *ctx,
+    #                                  struct timeval *tv)
+    lib.libusb_handle_events_timeout.argtypes = [c_void_p, POINTER(_timeval)]
+
+    try:
+        # int libusb_handle_events_timeout_completed(libusb_context *ctx,
+        #                                            struct timeval *tv,
+        #                                            int *completed)
+        lib.libusb_handle_events_timeout_completed.argtypes = [
+                c_void_p,
+                POINTER(_timeval),
+                POINTER(c_int)
+            ]
+    except AttributeError:
+        pass
+
     # uint8_t libusb_get_bus_number(libusb_device *dev)
     lib.libusb_get_bus_number.argtypes = [c_void_p]
     lib.libusb_get_bus_number.restype = c_uint8
@@ -410,12 +513,38 @@ def _check(retval):
            raise USBError(_str_error[ret], ret, _libusb_errno[ret])
     return retval
 
+# raise the error used for objects inherited across a fork()
+def _check_generation(obj):
+    if obj.generation != _generation:
+        from usb.core import USBError
+        raise USBError('Object inherited from the parent process, '
+                       'find the device again in this process',
+                       LIBUSB_ERROR_NO_DEVICE,
+                       _libusb_errno[LIBUSB_ERROR_NO_DEVICE])
+
 # wrap a device
 class _Device(object):
     def __init__(self, devid):
+        self.generation = _generation
         self.devid = _lib.libusb_ref_device(devid)
     def __del__(self):
-        _lib.libusb_unref_device(self.devid)
+        # the device belongs to the context of the parent process
+        if self.generation == _generation:
+            _lib.libusb_unref_device(self.devid)
+
+# wrap a device handle
+class _DeviceHandle(object):
+    def __init__(self, dev):
+        _check_generation(dev)
+        self.generation = _generation
+        self.__handle = _libusb_device_handle()
+        _check(_lib.libusb_open(dev.devid, byref(self.__handle)))
+    def is_valid(self):
+        return self.generation == _generation
+    def __get_handle(self):
+        _check_generation(self)
+        return self.__handle
+    handle = property(__get_handle)
 
 # wrap a descriptor and keep a reference to another object
 # Thanks to Thomas Reitmayr.
@@ -438,17 +567,139 @@ class _ConfigDescriptor(object):
 # initialize and finalize the library
 class _Initializer(object):
     def __init__(self):
-        _check(_lib.libusb_init(None))
+        self.context = c_void_p()
+        self.abandoned = False
+        _check(_lib.libusb_init(byref(self.context)))
+    def abandon(self):
+        # libusb_exit() would wait for threads that only exist in the
+        # parent process, so the child just forgets about the context
+        self.abandoned = True
     def __del__(self):
-        _lib.libusb_exit(None)
+        if not self.abandoned:
+            _lib.libusb_exit(self.context)
+
+# return the libusb context of the current process, creating it
+# if necessary
+def _get_context():
+    global _init
+    if _init is None:
+        _init = _Initializer()
+    return _init.context
+
+# libusb does not survive a fork(): drop the inherited context and
+# let the child create its own one on first use
+def _after_fork_in_child():
+    global _init, _generation
+    _generation += 1
+    if _init is not None:
+        _init.abandon()
+        _init = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+# handle pending events for at most timeout miliseconds, or until
+# completed.value becomes true
+def _handle_events(timeout, completed = None):
+    tv = _timeval(timeout // 1000, (timeout % 1000) * 1000)
+    if completed is not None and \
+            hasattr(_lib, 'libusb_handle_events_timeout_completed'):
+        _check(_lib.libusb_handle_events_timeout_completed(_get_context(),
+                                                           byref(tv),
+                                                           byref(completed)))
+    else:
+        _check(_lib.libusb_handle_events_timeout(_get_context(), byref(tv)))
+
+# transfers in flight, indexed by the address of the libusb_transfer
+_pending_transfers = {}
+
+def _transfer_callback(transfer):
+    t = _pending_transfers.pop(transfer)
+    t.completed.value = 1
+    if t.callback is not None:
+        t.callback(t)
 
+_transfer_cb = _libusb_transfer_cb_fn_p(_transfer_callback)
+
+# wrap an asynchronous transfer
+class _Transfer(object):
+    def __init__(self, dev_handle, ep, ep_type, data, timeout, callback):
+        try:
+            xfer_type = _transfer_type[ep_type]
+        except KeyError:
+            raise NotImplementedError('Transfer type not supported')
+        self.generation = _generation
+        self.data = data
+        self.callback = callback
+        self.completed = c_int(0)
+        # serializes cancel() against the release of the transfer
+        self.lock = threading.Lock()
+        self.transfer = _lib.libusb_alloc_transfer(0)
+        if not self.transfer:
+            _check(LIBUSB_ERROR_NO_MEM)
+        address, length = _interop._buffer_info(data)
+        t = self.transfer.contents
+        t.dev_handle = dev_handle.handle
+        t.endpoint = ep
+        t.type = xfer_type
+        t.timeout = timeout
+        t.length = length
+        t.buffer = cast(address, POINTER(c_ubyte))
+        t.callback = _transfer_cb
+        t.user_data = None
+        key = addressof(t)
+        _pending_transfers[key] = self
+        try:
+            _check(_lib.libusb_submit_transfer(self.transfer))
+        except:
+            del _pending_transfers[key]
+            self.__free()
+            raise
+    def cancel(self):
+        self.lock.acquire()
+        try:
+            if self.transfer is not None and self.generation == _generation:
+                retval = _lib.libusb_cancel_transfer(self.transfer)
+                # the transfer may have just completed
+                if retval != LIBUSB_ERROR_NOT_FOUND:
+                    _check(retval)
+        finally:
+            self.lock.release()
+    def wait(self):
+        _check_generation(self)
+        while not self.completed.value:
+            _handle_events(60000, self.completed)
+        t = self.transfer.contents
+        status = t.status
+        transferred = t.actual_length
+        self.__free()
+        if status == LIBUSB_TRANSFER_CANCELLED:
+            from usb.core import USBTransferCancelled
+            raise USBTransferCancelled()
+        # do not assume a timeout means no I/O.
+        if status != LIBUSB_TRANSFER_COMPLETED and \
+                not (transferred and status == LIBUSB_TRANSFER_TIMED_OUT):
+            _check(_transfer_error[status])
+        return transferred
+    def __free(self):
+        self.lock.acquire()
+        try:
+            if self.transfer is not None:
+                _lib.libusb_free_transfer(self.transfer)
+                self.transfer = None
+        finally:
+            self.lock.release()
+    def __del__(self):
+        # never free a transfer libusb still owns
+        if self.completed.value and self.generation == _generation:
+            self.__free()
 
 # iterator for libusb devices
 class _DevIterator(object):
     def __init__(self):
         self.dev_list = POINTER(c_void_p)()
         self.num_devs = _check(_lib.libusb_get_device_list(
-                                    None,
+                                    _get_context(),
                                     byref(self.dev_list))
                                 ).value
     def __iter__(self):
@@ -502,37 +753,38 @@ class _LibUSB(usb.backend.IBackend):
 
     @methodtrace(_logger)
     def open_device(self, dev):
-        handle = _libusb_device_handle()
-        _check(_lib.libusb_open(dev.devid, byref(handle)))
-        return handle
+        return _DeviceHandle(dev)
 
     @methodtrace(_logger)
     def close_device(self, dev_handle):
-        _lib.libusb_close(dev_handle)
+        # handles inherited from the parent process are just dropped
+        if dev_handle.is_valid():
+            _lib.libusb_close(dev_handle.handle)
 
     @methodtrace(_logger)
     def set_configuration(self, dev_handle, config_value):
-        _check(_lib.libusb_set_configuration(dev_handle, config_value))
+        _check(_lib.libusb_set_configuration(dev_handle.handle, config_value))
 
     @methodtrace(_logger)
     def get_configuration(self, dev_handle):
         config = c_int()
-        _check(_lib.libusb_get_configuration(dev_handle, byref(config)))
+        _check(_lib.libusb_get_configuration(dev_handle.handle, byref(config)))
         return config.value
 
     @methodtrace(_logger)
     def set_interface_altsetting(self, dev_handle, intf, altsetting):
-        _check(_lib.libusb_set_interface_alt_setting(dev_handle,
+        _check(_lib.libusb_set_interface_alt_setting(dev_handle.handle,
                                                      intf,
                                                      altsetting))
 
     @methodtrace(_logger)
     def claim_interface(self, dev_handle, intf):
-        _check(_lib.libusb_claim_interface(dev_handle, intf))
+        _check(_lib.libusb_claim_interface(dev_handle.handle, intf))
 
     @methodtrace(_logger)
     def release_interface(self, dev_handle, intf):
-        _check(_lib.libusb_release_interface(dev_handle, intf))
+        if dev_handle.is_valid():
+            _check(_lib.libusb_release_interface(dev_handle.handle, intf))
 
     @methodtrace(_logger)
     def bulk_write(self, dev_handle, ep, intf, data, timeout):
@@ -599,7 +851,7 @@ class _LibUSB(usb.backend.IBackend):
         addr, length = buff.buffer_info()
         length *= buff.itemsize
 
-        ret = _check(_lib.libusb_control_transfer(dev_handle,
+        ret = _check(_lib.libusb_control_transfer(dev_handle.handle,
                                                   bmRequestType,
                                                   bRequest,
                                                   wValue,
@@ -614,27 +866,44 @@ class _LibUSB(usb.backend.IBackend):
         else:
             return buff[:ret.value]
 
+    @methodtrace(_logger)
+    def submit_transfer(self, dev_handle, ep, intf, ep_type, data, timeout,
+                        callback = None):
+        return _Transfer(dev_handle, ep, ep_type, data, timeout, callback)
+
+    @methodtrace(_logger)
+    def wait_transfer(self, transfer):
+        return transfer.wait()
+
+    @methodtrace(_logger)
+    def cancel_transfer(self, transfer):
+        transfer.cancel()
+
+    @methodtrace(_logger)
+    def handle_events(self, timeout):
+        # the callbacks run in this thread, from libusb
+        _handle_events(timeout)
+
     @methodtrace(_logger)
     def reset_device(self, dev_handle):
-        _check(_lib.libusb_reset_device(dev_handle))
+        _check(_lib.libusb_reset_device(dev_handle.handle))
 
     @methodtrace(_logger)
     def is_kernel_driver_active(self, dev_handle, intf):
-        return bool(_check(_lib.libusb_kernel_driver_active(dev_handle, intf)))
+        return bool(_check(_lib.libusb_kernel_driver_active(dev_handle.handle, intf)))
 
     @methodtrace(_logger)
     def detach_kernel_driver(self, dev_handle, intf):
-        _check(_lib.libusb_detach_kernel_driver(dev_handle, intf))
+        _check(_lib.libusb_detach_kernel_driver(dev_handle.handle, intf))
 
     @methodtrace(_logger)
     def attach_kernel_driver(self, dev_handle, intf):
-        _check(_lib.libusb_attach_kernel_driver(dev_handle, intf))
+        _check(_lib.libusb_attach_kernel_driver(dev_handle.handle, intf))
 
     def __write(self, fn, dev_handle, ep, intf, data, timeout):
-        address, length = data.buffer_info()
-        length *= data.itemsize
+        address, length = _interop._buffer_info(data)
         transferred = c_int()
-        retval = fn(dev_handle,
+        retval = fn(dev_handle.handle,
                   ep,
                   cast(address, POINTER(c_ubyte)),
                   length,
@@ -650,10 +919,9 @@ class _LibUSB(usb.backend.IBackend):
         read_into = (data != None)
         if not read_into:
             data = _interop.as_array((0,) * size)
-        address, length = data.buffer_info()
-        length *= data.itemsize
+        address, length = _interop._buffer_info(data)
         transferred = c_int()
-        retval = fn(dev_handle,
+        retval = fn(dev_handle.handle,
                   ep,
                   cast(address, POINTER(c_ubyte)),
                   length,
@@ -668,13 +936,20 @@ class _LibUSB(usb.backend.IBackend):
         else:
             return data[:transferred.value]
 
-def get_backend():
-    global _lib, _init
+def get_backend(find_library=None):
+    r"""Return the libusb 1.0 backend, or None if it is not available.
+
+    find_library is called with the candidate library names in turn and
+    returns the name of the library to load, or None. It replaces the
+    cached ctypes.util.find_library lookup (see usb.backend._load_library).
+    The library is loaded only once, by the first successful call.
+    """
+    global _lib
     try:
         if _lib is None:
-            _lib = _load_library()
-            _setup_prototypes(_lib)
-            _init = _Initializer()
+            _lib = usb.backend._LazyLibrary(_load_library(find_library),
+                                            _setup_prototypes)
+        _get_context()
         return _LibUSB()
     except Exception:
         _logger.error('Error loading libusb 1.0 backend', exc_info=True)
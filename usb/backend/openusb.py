@@ -27,12 +27,15 @@
 # MODIFICATIONS.
 
 from ctypes import *
-import ctypes.util
+import usb.backend
 import usb.util
+import usb._interop as _interop
 from usb._debug import methodtrace
 import logging
 import errno
+import os
 import sys
+import threading
 
 __author__ = 'Wander Lairson Costa'
 
@@ -240,19 +243,44 @@ _openusb_busid = c_uint64
 _openusb_handle = c_uint64
 _openusb_dev_handle = c_uint64
 
+# openusb_transfer_type_t
+_USB_TYPE_CONTROL = 1
+_USB_TYPE_INTERRUPT = 2
+_USB_TYPE_BULK = 3
+_USB_TYPE_ISOCHRONOUS = 4
+
+class _openusb_request_handle(Structure):
+    class _req(Union):
+        _fields_ = [('ctrl', POINTER(_openusb_ctrl_request)),
+                    ('intr', POINTER(_openusb_intr_request)),
+                    ('bulk', POINTER(_openusb_bulk_request)),
+                    ('isoc', POINTER(_openusb_isoc_request))]
+
+_openusb_request_cb = CFUNCTYPE(c_int32, POINTER(_openusb_request_handle))
+
+_openusb_request_handle._fields_ = [
+                ('dev', _openusb_dev_handle),
+                ('interface', c_uint8),
+                ('endpoint', c_uint8),
+                ('type', c_int),
+                ('req', _openusb_request_handle._req),
+                ('cb', _openusb_request_cb),
+                ('arg', c_void_p)
+            ]
+
 _lib = None
 _ctx = None
 
-def _load_library():
+# incremented in the child process after a fork(), so that handles
+# inherited from the parent can tell they are no longer usable
+_generation = 0
+
+def _load_library(find_library=None):
     candidate = 'openusb'
     # Workaround for CPython 3.3 issue#16283 / pyusb #14
     if sys.platform == 'win32':
         candidate = candidate + '.dll'
-
-    libname = ctypes.util.find_library(candidate)
-    if libname is None:
-        raise OSError('USB library could not be found')
-    return CDLL(libname)
+    return usb.backend._load_library('openusb', (candidate,), CDLL, find_library)
 
 def _setup_prototypes(lib):
     # int32_t openusb_init(uint32_t flags , openusb_handle_t *handle);
@@ -482,6 +510,14 @@ def _setup_prototypes(lib):
 
     lib.openusb_isoc_xfer.restype = c_int32
 
+    # int32_t openusb_xfer_aio(openusb_request_handle_t handle);
+    lib.openusb_xfer_aio.argtypes = [POINTER(_openusb_request_handle)]
+    lib.openusb_xfer_aio.restype = c_int32
+
+    # int32_t openusb_abort(openusb_request_handle_t phdl);
+    lib.openusb_abort.argtypes = [POINTER(_openusb_request_handle)]
+    lib.openusb_abort.restype = c_int32
+
 def _check(retval):
     ret = retval.value
     if ret != 0:
@@ -492,15 +528,192 @@ def _check(retval):
 class _Context(object):
     def __init__(self):
         self.handle = _openusb_handle()
+        self.abandoned = False
         _check(_lib.openusb_init(0, byref(self.handle)))
+    def abandon(self):
+        # openusb_fini() would tear down the event thread of the
+        # parent process, so the child just forgets about the context
+        self.abandoned = True
     def __del__(self):
-        _lib.openusb_fini(self.handle)
+        if not self.abandoned:
+            _lib.openusb_fini(self.handle)
+
+# return the OpenUSB context of the current process, creating it
+# if necessary
+def _get_context():
+    global _ctx
+    if _ctx is None:
+        _ctx = _Context()
+    return _ctx
+
+# OpenUSB does not survive a fork(): drop the inherited context and
+# let the child create its own one on first use
+def _after_fork_in_child():
+    global _ctx, _generation
+    _generation += 1
+    if _ctx is not None:
+        _ctx.abandon()
+        _ctx = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+# wrap a device handle
+class _DeviceHandle(object):
+    def __init__(self, dev):
+        self.generation = _generation
+        self.__handle = _openusb_dev_handle()
+        _check(_lib.openusb_open_device(_get_context().handle,
+                                        dev,
+                                        0,
+                                        byref(self.__handle)))
+    def is_valid(self):
+        return self.generation == _generation
+    def __get_handle(self):
+        if not self.is_valid():
+            from usb.core import USBError
+            raise USBError('Handle inherited from the parent process, '
+                           'find the device again in this process',
+                           OPENUSB_INVALID_HANDLE,
+                           _openusb_errno[OPENUSB_INVALID_HANDLE])
+        return self.__handle
+    handle = property(__get_handle)
+
+_transfer_type = {
+        usb.util.ENDPOINT_TYPE_BULK:(_USB_TYPE_BULK, _openusb_bulk_request, 'bulk'),
+        usb.util.ENDPOINT_TYPE_INTR:(_USB_TYPE_INTERRUPT, _openusb_intr_request, 'intr')
+    }
+
+# transfers in flight, indexed by the address of their request handle
+_pending_transfers = {}
+
+# request handles and structures of completed transfers, kept for reuse
+# by the next ones (indexed by the endpoint type)
+_free_requests = {}
+_MAX_FREE_REQUESTS = 16
+_free_requests_lock = threading.Lock()
+
+def _alloc_request(ep_type):
+    _free_requests_lock.acquire()
+    try:
+        free = _free_requests.get(ep_type)
+        if free:
+            return free.pop()
+    finally:
+        _free_requests_lock.release()
+    xfer_type, req_type, field = _transfer_type[ep_type]
+    handle = _openusb_request_handle()
+    request = req_type()
+    setattr(handle.req, field, pointer(request))
+    handle.cb = _request_cb
+    return handle, request
+
+def _release_request(ep_type, handle, request):
+    _free_requests_lock.acquire()
+    try:
+        free = _free_requests.setdefault(ep_type, [])
+        if len(free) < _MAX_FREE_REQUESTS:
+            free.append((handle, request))
+    finally:
+        _free_requests_lock.release()
+
+# called from the OpenUSB event thread when a request completes
+def _request_complete(handle):
+    transfer = _pending_transfers.get(addressof(handle.contents))
+    if transfer is not None:
+        transfer.complete()
+    return OPENUSB_SUCCESS
+
+_request_cb = _openusb_request_cb(_request_complete)
+
+class _Transfer(object):
+    def __init__(self, dev_handle, ep, intf, ep_type, data, timeout, callback):
+        if ep_type not in _transfer_type:
+            raise NotImplementedError('Transfer type not supported')
+        self.ep_type = ep_type
+        self.generation = _generation
+        self.data = data
+        self.callback = callback
+        self.completed = False
+        self.cond = threading.Condition()
+        self.handle, self.request = _alloc_request(ep_type)
+        h = self.handle
+        h.dev = dev_handle.handle
+        h.interface = intf
+        h.endpoint = ep
+        h.type = _transfer_type[ep_type][0]
+        r = self.request
+        address, length = _interop._buffer_info(data)
+        r.payload = cast(address, POINTER(c_uint8))
+        r.length = length
+        r.timeout = timeout
+        r.flags = 0
+        r.result.status = 0
+        r.result.transfered_bytes = 0
+        r.next = None
+        self.key = addressof(h)
+        _pending_transfers[self.key] = self
+        retval = _lib.openusb_xfer_aio(byref(h))
+        if retval != OPENUSB_SUCCESS:
+            self.__free()
+            _check(c_int32(retval))
+    def complete(self):
+        self.cond.acquire()
+        try:
+            self.completed = True
+            self.cond.notify_all()
+        finally:
+            self.cond.release()
+        if self.callback is not None:
+            self.callback(self)
+    def cancel(self):
+        self.cond.acquire()
+        try:
+            if not self.completed and self.handle is not None and \
+                    self.generation == _generation:
+                # the request may complete meanwhile, so errors do not matter
+                _lib.openusb_abort(byref(self.handle))
+        finally:
+            self.cond.release()
+    def wait(self):
+        if self.generation != _generation:
+            from usb.core import USBError
+            raise USBError('Transfer submitted in the parent process',
+                           OPENUSB_INVALID_HANDLE,
+                           _openusb_errno[OPENUSB_INVALID_HANDLE])
+        self.cond.acquire()
+        try:
+            while not self.completed:
+                self.cond.wait()
+        finally:
+            self.cond.release()
+        status = self.request.result.status
+        transferred = self.request.result.transfered_bytes
+        self.__free()
+        if status == OPENUSB_IO_CANCELED:
+            from usb.core import USBTransferCancelled
+            raise USBTransferCancelled()
+        # do not assume a timeout means no I/O.
+        if status != OPENUSB_SUCCESS and \
+                not (transferred and status == OPENUSB_IO_TIMEOUT):
+            _check(c_int32(status))
+        return transferred
+    def __free(self):
+        self.cond.acquire()
+        try:
+            if self.handle is not None:
+                del _pending_transfers[self.key]
+                _release_request(self.ep_type, self.handle, self.request)
+                self.handle = self.request = None
+                self.data = None
+        finally:
+            self.cond.release()
 
 class _BusIterator(object):
     def __init__(self):
         self.buslist = POINTER(openusb_busid)()
         num_busids = c_uint32()
-        _check(_lib.openusb_get_busid_list(_ctx.handle,
+        _check(_lib.openusb_get_busid_list(_get_context().handle,
                                            byref(self.buslist),
                                            byref(num_busids)))
         self.num_busids = num_busids.value
@@ -514,7 +727,7 @@ class _DevIterator(object):
     def __init__(self, busid):
         self.devlist = POINTER(_openusb_devid)()
         num_devids = c_uint32()
-        _check(_lib.openusb_get_devids_by_bus(_ctx.handle,
+        _check(_lib.openusb_get_devids_by_bus(_get_context().handle,
                                               busid,
                                               byref(self.devlist),
                                               byref(num_devids)))
@@ -535,7 +748,7 @@ class _OpenUSB(usb.backend.IBackend):
     @methodtrace(_logger)
     def get_device_descriptor(self, dev):
         desc = _usb_device_desc()
-        _check(_lib.openusb_parse_device_desc(_ctx.handle,
+        _check(_lib.openusb_parse_device_desc(_get_context().handle,
                                               dev,
                                               None,
                                               0,
@@ -548,7 +761,7 @@ class _OpenUSB(usb.backend.IBackend):
     @methodtrace(_logger)
     def get_configuration_descriptor(self, dev, config):
         desc = _usb_config_desc()
-        _check(_lib.openusb_parse_config_desc(_ctx.handle,
+        _check(_lib.openusb_parse_config_desc(_get_context().handle,
                                               dev,
                                               None,
                                               0,
@@ -559,7 +772,7 @@ class _OpenUSB(usb.backend.IBackend):
     @methodtrace(_logger)
     def get_interface_descriptor(self, dev, intf, alt, config):
         desc = _usb_interface_desc()
-        _check(_lib.openusb_parse_interface_desc(_ctx.handle,
+        _check(_lib.openusb_parse_interface_desc(_get_context().handle,
                                                  dev,
                                                  None,
                                                  0,
@@ -572,7 +785,7 @@ class _OpenUSB(usb.backend.IBackend):
     @methodtrace(_logger)
     def get_endpoint_descriptor(self, dev, ep, intf, alt, config):
         desc = _usb_endpoint_desc()
-        _check(_lib.openusb_parse_endpoint_desc(_ctx.handle,
+        _check(_lib.openusb_parse_endpoint_desc(_get_context().handle,
                                                 dev,
                                                 None,
                                                 0,
@@ -585,43 +798,44 @@ class _OpenUSB(usb.backend.IBackend):
 
     @methodtrace(_logger)
     def open_device(self, dev):
-        handle = _openusb_dev_handle()
-        _check(_lib.openusb_open_device(_ctx.handle, dev, 0, byref(handle)))
-        return handle
+        return _DeviceHandle(dev)
 
     @methodtrace(_logger)
     def close_device(self, dev_handle):
-        _lib.openusb_close_device(dev_handle)
+        # handles inherited from the parent process are just dropped
+        if dev_handle.is_valid():
+            _lib.openusb_close_device(dev_handle.handle)
 
     @methodtrace(_logger)
     def set_configuration(self, dev_handle, config_value):
-        _check(_lib.openusb_set_configuration(dev_handle, config_value))
+        _check(_lib.openusb_set_configuration(dev_handle.handle, config_value))
 
     @methodtrace(_logger)
     def get_configuration(self, dev_handle):
         config = c_uint8()
-        _check(_lib.openusb_get_configuration(dev_handle, byref(config)))
+        _check(_lib.openusb_get_configuration(dev_handle.handle, byref(config)))
         return config.value
 
     @methodtrace(_logger)
     def set_interface_altsetting(self, dev_handle, intf, altsetting):
-        _check(_lib.set_altsetting(dev_handle, intf, altsetting))
+        _check(_lib.set_altsetting(dev_handle.handle, intf, altsetting))
 
     @methodtrace(_logger)
     def claim_interface(self, dev_handle, intf):
-        _check(_lib.openusb_claim_interface(dev_handle, intf, 0))
+        _check(_lib.openusb_claim_interface(dev_handle.handle, intf, 0))
 
     @methodtrace(_logger)
     def release_interface(self, dev_handle, intf):
-        _lib.openusb_release_interface(dev_handle, intf)
+        if dev_handle.is_valid():
+            _lib.openusb_release_interface(dev_handle.handle, intf)
 
     @methodtrace(_logger)
     def bulk_write(self, dev_handle, ep, intf, data, timeout):
         request = _openusb_bulk_request()
         memset(byref(request), 0, sizeof(request))
-        request.payload, request.length = data.buffer_info()
+        request.payload, request.length = _interop._buffer_info(data)
         request.timeout = timeout
-        _check(_lib.openusb_bulk_xfer(dev_handle, intf, ep, byref(request)))
+        _check(_lib.openusb_bulk_xfer(dev_handle.handle, intf, ep, byref(request)))
         return request.transfered_bytes.value
 
     @methodtrace(_logger)
@@ -633,10 +847,10 @@ class _OpenUSB(usb.backend.IBackend):
             data = array.array('B', '\x00' * size)
 
         memset(byref(request), 0, sizeof(request))
-        request.payload = data.buffer_info()[0]
+        request.payload = _interop._buffer_info(data)[0]
         request.length = size
         request.timeout = timeout
-        _check(_lib.openusb_bulk_xfer(dev_handle, intf, ep, byref(request)))
+        _check(_lib.openusb_bulk_xfer(dev_handle.handle, intf, ep, byref(request)))
 
         if read_into:
             return request.transfered_bytes.value
@@ -647,10 +861,10 @@ class _OpenUSB(usb.backend.IBackend):
     def intr_write(self, dev_handle, ep, intf, data, timeout):
         request = _openusb_intr_request()
         memset(byref(request), 0, sizeof(request))
-        payload, request.length = data.buffer_info()
+        payload, request.length = _interop._buffer_info(data)
         request.payload = cast(payload, POINTER(c_uint8))
         request.timeout = timeout
-        _check(_lib.openusb_intr_xfer(dev_handle, intf, ep, byref(request)))
+        _check(_lib.openusb_intr_xfer(dev_handle.handle, intf, ep, byref(request)))
         return request.transfered_bytes.value
 
     @methodtrace(_logger)
@@ -662,11 +876,11 @@ class _OpenUSB(usb.backend.IBackend):
             data = array.array('B', '\x00' * size)
 
         memset(byref(request), 0, sizeof(request))
-        payload = data.buffer_info()[0]
+        payload = _interop._buffer_info(data)[0]
         request.length = size
         request.payload = cast(payload, POINTER(c_uint8))
         request.timeout = timeout
-        _check(_lib.openusb_intr_xfer(dev_handle, intf, ep, byref(request)))
+        _check(_lib.openusb_intr_xfer(dev_handle.handle, intf, ep, byref(request)))
 
         if read_into:
             return request.transfered_bytes.value
@@ -708,24 +922,41 @@ class _OpenUSB(usb.backend.IBackend):
         payload, request.length = buffer.buffer_info()
         request.payload = cast(payload, POINTER(c_uint8))
 
-        ret = _check(_lib.openusb_ctrl_xfer(dev_handle, 0, 0, byref(request)))
+        ret = _check(_lib.openusb_ctrl_xfer(dev_handle.handle, 0, 0, byref(request)))
 
         if direction == ENDPOINT_OUT:
             ret
         else:
             buffer[:ret]
 
+    @methodtrace(_logger)
+    def submit_transfer(self, dev_handle, ep, intf, ep_type, data, timeout,
+                        callback = None):
+        return _Transfer(dev_handle, ep, intf, ep_type, data, timeout, callback)
+
+    @methodtrace(_logger)
+    def wait_transfer(self, transfer):
+        return transfer.wait()
+
+    @methodtrace(_logger)
+    def cancel_transfer(self, transfer):
+        transfer.cancel()
+
     @methodtrace(_logger)
     def reset_device(self, dev_handle):
-        _check(_lib.openusb_reset(dev_handle))
+        _check(_lib.openusb_reset(dev_handle.handle))
+
+def get_backend(find_library=None):
+    r"""Return the OpenUSB backend, or None if it is not available.
 
-def get_backend():
+    find_library works as in usb.backend.libusb1.get_backend().
+    """
     try:
-        global _lib, _ctx
+        global _lib
         if _lib is None:
-            _lib = _load_library()
-            _setup_prototypes(_lib)
-            _ctx = _Context()
+            _lib = usb.backend._LazyLibrary(_load_library(find_library),
+                                            _setup_prototypes)
+        _get_context()
         return _OpenUSB()
     except Exception:
         _logger.error('Error loading OpenUSB backend', exc_info=True)
@@ -0,0 +1,486 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+r"""usb.backend.replay - Backend replaying captured USB traffic.
+
+This backend loads a capture of USB traffic, in pcapng or pcap format with
+one of the Linux usbmon link types (LINKTYPE_USB_LINUX or
+LINKTYPE_USB_LINUX_MMAPPED), and behaves like the devices found in it. Such
+files are produced by usb.capture, Wireshark or tcpdump on a usbmon
+interface.
+
+Devices are enumerated from the device and configuration descriptors found
+in the GET_DESCRIPTOR requests of the capture. Control requests are answered
+with the recorded responses to the same setup packet, in the recorded order,
+repeating the last one when they are exhausted; requests never seen in the
+capture stall. Bulk and interrupt reads return the recorded data of the
+endpoint, in order, and time out when there is nothing left to read. Writes
+are accepted and report the recorded status. Isochronous transfers are not
+supported.
+
+>>> import usb.core
+>>> import usb.backend.replay
+>>> backend = usb.backend.replay.get_backend('traffic.pcapng')
+>>> dev = usb.core.find(backend=backend)
+"""
+
+import struct
+import time
+import os
+import errno
+import threading
+import usb.backend
+import usb.util
+import usb.backend._descriptors as _descriptors
+from usb.core import USBError
+from usb._debug import methodtrace
+import usb._interop as _interop
+import logging
+
+__author__ = 'Wander Lairson Costa'
+
+__all__ = ['get_backend']
+
+_logger = logging.getLogger('usb.backend.replay')
+
+LINKTYPE_USB_LINUX = 189
+LINKTYPE_USB_LINUX_MMAPPED = 220
+
+_PCAP_MAGIC = 0xa1b2c3d4
+_PCAP_MAGIC_NSEC = 0xa1b23c4d
+_PCAPNG_SECTION_HEADER = 0x0A0D0D0A
+_PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+_PCAPNG_INTERFACE_DESCRIPTION = 0x00000001
+_PCAPNG_SIMPLE_PACKET = 0x00000003
+_PCAPNG_ENHANCED_PACKET = 0x00000006
+
+_USBMON_HEADER_SIZE = {
+    LINKTYPE_USB_LINUX:48,
+    LINKTYPE_USB_LINUX_MMAPPED:64
+}
+
+# usbmon transfer types
+_USBMON_ISO = 0
+_USBMON_INTR = 1
+_USBMON_CTRL = 2
+_USBMON_BULK = 3
+
+_GET_DESCRIPTOR = 0x06
+_SET_CONFIGURATION = 0x09
+
+# struct usbmon_packet, up to the setup packet
+_usbmon_header = '%sQBBBBHccqiiII8s'
+
+# A completed transfer: the submission and completion timestamps, the setup
+# packet (for control transfers), the data sent or received and the status.
+class _Record(object):
+    __slots__ = ('start', 'end', 'setup', 'data', 'length', 'status')
+
+    def __init__(self, start, end, setup, data, length, status):
+        self.start = start
+        self.end = end
+        self.setup = setup
+        self.data = data
+        self.length = length
+        self.status = status
+
+def _packets(f):
+    r"""Yield the (linktype, byteorder, timestamp, data) of each packet."""
+    head = f.read(4)
+    if len(head) < 4:
+        return
+    if struct.unpack('<I', head)[0] == _PCAPNG_SECTION_HEADER:
+        for p in _pcapng_packets(f, head):
+            yield p
+    else:
+        for p in _pcap_packets(f, head):
+            yield p
+
+def _pcap_packets(f, head):
+    for bo in ('<', '>'):
+        magic = struct.unpack(bo + 'I', head)[0]
+        if magic in (_PCAP_MAGIC, _PCAP_MAGIC_NSEC):
+            break
+    else:
+        raise ValueError('Not a pcap or pcapng file')
+    if magic == _PCAP_MAGIC_NSEC:
+        resolution = 1e-9
+    else:
+        resolution = 1e-6
+    linktype = struct.unpack(bo + 'HHiIII', f.read(20))[5]
+    hdr = struct.Struct(bo + 'IIII')
+    while True:
+        h = f.read(hdr.size)
+        if len(h) < hdr.size:
+            break
+        sec, frac, caplen, origlen = hdr.unpack(h)
+        yield linktype, bo, sec + frac * resolution, f.read(caplen)
+
+def _pcapng_packets(f, head):
+    bo = '<'
+    interfaces = []
+    while True:
+        if head is None:
+            head = f.read(4)
+            if len(head) < 4:
+                break
+        rest = f.read(4)
+        if len(rest) < 4:
+            break
+        if struct.unpack('<I', head)[0] == _PCAPNG_SECTION_HEADER:
+            # a new section, which may change the byte order
+            magic = f.read(4)
+            if struct.unpack('<I', magic)[0] == _PCAPNG_BYTE_ORDER_MAGIC:
+                bo = '<'
+            else:
+                bo = '>'
+            length = struct.unpack(bo + 'I', rest)[0]
+            body = magic + f.read(length - 12)
+            interfaces = []
+        else:
+            length = struct.unpack(bo + 'I', rest)[0]
+            body = f.read(length - 8)
+        btype = struct.unpack(bo + 'I', head)[0]
+        head = None
+        # the body ends with the repeated block length
+        body = body[:-4]
+        if btype == _PCAPNG_INTERFACE_DESCRIPTION:
+            linktype = struct.unpack(bo + 'H', body[:2])[0]
+            interfaces.append((linktype, _if_tsresol(body[8:], bo)))
+        elif btype == _PCAPNG_ENHANCED_PACKET:
+            ifid, high, low, caplen = struct.unpack(bo + 'IIII', body[:16])
+            linktype, resolution = interfaces[ifid]
+            ts = ((high << 32) | low) * resolution
+            yield linktype, bo, ts, body[20:20 + caplen]
+        elif btype == _PCAPNG_SIMPLE_PACKET:
+            linktype, resolution = interfaces[0]
+            yield linktype, bo, None, body[4:]
+
+def _if_tsresol(options, bo):
+    r"""Return the timestamp resolution, in seconds, of an interface."""
+    while len(options) >= 4:
+        code, length = struct.unpack(bo + 'HH', options[:4])
+        if code == 0:
+            break
+        if code == 9:
+            v = ord(options[4:5])
+            if v & 0x80:
+                return 2.0 ** -(v & 0x7f)
+            return 10.0 ** -v
+        options = options[4 + length + (4 - length % 4) % 4:]
+    return 1e-6
+
+class _ReplayDevice(object):
+    def __init__(self, bus, address):
+        self.bus = bus
+        self.address = address
+        self.port_number = None
+        self.descriptor = None
+        self.configurations = {}
+        # control responses by setup packet and data transfers by endpoint
+        self.control = {}
+        self.transfers = {}
+        self.lock = threading.Lock()
+
+    def add(self, epnum, xfer_type, record):
+        if xfer_type == _USBMON_CTRL:
+            self.control.setdefault(record.setup[:4], []).append(record)
+            self.__check_descriptor(record)
+        elif xfer_type != _USBMON_ISO:
+            self.transfers.setdefault(epnum, []).append(record)
+
+    def __check_descriptor(self, record):
+        bmRequestType, bRequest, wValue, wIndex = record.setup[:4]
+        data = record.data
+        if bmRequestType != 0x80 or bRequest != _GET_DESCRIPTOR \
+                or record.status or len(data) < 2 or data[1] != wValue >> 8:
+            return
+        if wValue >> 8 == usb.util.DESC_TYPE_DEVICE:
+            if self.descriptor is None and len(data) >= 18:
+                self.descriptor = _descriptors.parse_device(data)
+        elif wValue >> 8 == usb.util.DESC_TYPE_CONFIG and len(data) >= 9:
+            index = wValue & 0xff
+            total = data[2] | (data[3] << 8)
+            if index not in self.configurations and len(data) >= total:
+                self.configurations[index] = _descriptors.parse_configuration(
+                                                    data[:total])
+
+    def next(self, queue, last = False):
+        r"""Pop the next record of a queue.
+
+        If last is True, the last record is never popped, so it is repeated.
+        """
+        self.lock.acquire()
+        try:
+            if not queue:
+                return None
+            if last and len(queue) == 1:
+                return queue[0]
+            return queue.pop(0)
+        finally:
+            self.lock.release()
+
+def _load(path):
+    devices = {}
+    pending = {}
+    f = open(path, 'rb')
+    try:
+        for linktype, bo, ts, packet in _packets(f):
+            hdr_size = _USBMON_HEADER_SIZE.get(linktype)
+            if hdr_size is None or len(packet) < hdr_size:
+                continue
+            urb_id, kind, xfer_type, epnum, devnum, busnum, flag_setup, \
+                flag_data, ts_sec, ts_usec, status, length, len_cap, \
+                setup = struct.unpack(_usbmon_header % (bo,), packet[:48])
+            if ts is None:
+                ts = ts_sec + ts_usec * 1e-6
+            data = packet[hdr_size:hdr_size + len_cap]
+            key = (urb_id, busnum, devnum, epnum)
+            if kind == ord('S'):
+                if flag_setup == b'\x00':
+                    setup = struct.unpack('<BBHHH', setup)
+                else:
+                    setup = None
+                pending[key] = (ts, setup, data)
+            elif kind == ord('C') and key in pending:
+                start, setup, out_data = pending.pop(key)
+                if xfer_type == _USBMON_CTRL and setup is None:
+                    continue
+                if epnum & usb.util.ENDPOINT_IN:
+                    data = _interop.as_array(data)
+                else:
+                    data = _interop.as_array(out_data)
+                dev = devices.get((busnum, devnum))
+                if dev is None:
+                    dev = devices[(busnum, devnum)] = _ReplayDevice(busnum,
+                                                                    devnum)
+                dev.add(epnum,
+                        xfer_type,
+                        _Record(start, ts, setup, data, length, status))
+    finally:
+        f.close()
+
+    result = []
+    for key in sorted(devices.keys()):
+        dev = devices[key]
+        if dev.descriptor is None:
+            _logger.warning('No device descriptor for device %d:%d in %s',
+                            key[0], key[1], path)
+            continue
+        result.append(dev)
+    return result
+
+def _check_status(status):
+    if status < 0:
+        raise USBError(os.strerror(-status), status, -status)
+
+class _ReplayBackend(usb.backend.IBackend):
+    def __init__(self, devices, timing, speed):
+        self.devices = devices
+        self.timing = timing
+        self.speed = speed
+        # completion time of the last transfer replayed
+        self.__last_end = None
+
+    # sleep for the idle time before the transfer and then for its duration
+    def __delay(self, record):
+        if self.timing and record.end is not None and record.start is not None:
+            delay = record.end - record.start
+            if self.__last_end is not None:
+                delay += max(0, record.start - self.__last_end)
+            self.__last_end = max(record.end, self.__last_end or record.end)
+            delay /= self.speed
+            if delay > 0:
+                time.sleep(delay)
+
+    @methodtrace(_logger)
+    def enumerate_devices(self):
+        return iter(self.devices)
+
+    @methodtrace(_logger)
+    def get_device_descriptor(self, dev):
+        desc = dev.descriptor
+        desc.bus = dev.bus
+        desc.address = dev.address
+        desc.port_number = dev.port_number
+        return desc
+
+    @methodtrace(_logger)
+    def get_configuration_descriptor(self, dev, config):
+        return _descriptors.get_configuration(dev.configurations, config)
+
+    @methodtrace(_logger)
+    def get_interface_descriptor(self, dev, intf, alt, config):
+        return _descriptors.get_interface(dev.configurations, intf, alt, config)
+
+    @methodtrace(_logger)
+    def get_endpoint_descriptor(self, dev, ep, intf, alt, config):
+        return _descriptors.get_endpoint(dev.configurations,
+                                         ep,
+                                         intf,
+                                         alt,
+                                         config)
+
+    @methodtrace(_logger)
+    def open_device(self, dev):
+        if dev.configurations:
+            dev.current_configuration = \
+                dev.configurations[min(dev.configurations)].bConfigurationValue
+        else:
+            dev.current_configuration = 0
+        return dev
+
+    @methodtrace(_logger)
+    def close_device(self, dev_handle):
+        pass
+
+    @methodtrace(_logger)
+    def set_configuration(self, dev_handle, config_value):
+        dev_handle.current_configuration = config_value
+
+    @methodtrace(_logger)
+    def get_configuration(self, dev_handle):
+        return dev_handle.current_configuration
+
+    @methodtrace(_logger)
+    def set_interface_altsetting(self, dev_handle, intf, altsetting):
+        pass
+
+    @methodtrace(_logger)
+    def claim_interface(self, dev_handle, intf):
+        pass
+
+    @methodtrace(_logger)
+    def release_interface(self, dev_handle, intf):
+        pass
+
+    @methodtrace(_logger)
+    def bulk_write(self, dev_handle, ep, intf, data, timeout):
+        return self.__write(dev_handle, ep, data)
+
+    @methodtrace(_logger)
+    def bulk_read(self, dev_handle, ep, intf, data, size, timeout):
+        return self.__read(dev_handle, ep, data, size, timeout)
+
+    @methodtrace(_logger)
+    def intr_write(self, dev_handle, ep, intf, data, timeout):
+        return self.__write(dev_handle, ep, data)
+
+    @methodtrace(_logger)
+    def intr_read(self, dev_handle, ep, intf, data, size, timeout):
+        return self.__read(dev_handle, ep, data, size, timeout)
+
+    @methodtrace(_logger)
+    def ctrl_transfer(self,
+                      dev_handle,
+                      bmRequestType,
+                      bRequest,
+                      wValue,
+                      wIndex,
+                      data_or_wLength,
+                      timeout):
+        queue = dev_handle.control.get((bmRequestType, bRequest, wValue, wIndex))
+        record = None
+        if queue is not None:
+            record = dev_handle.next(queue, True)
+        if record is None:
+            if bmRequestType == 0x00 and bRequest == _SET_CONFIGURATION:
+                dev_handle.current_configuration = wValue
+                return 0
+            raise USBError(os.strerror(errno.EPIPE), None, errno.EPIPE)
+
+        self.__delay(record)
+        _check_status(record.status)
+
+        if usb.util.ctrl_direction(bmRequestType) == usb.util.CTRL_OUT:
+            if data_or_wLength is None:
+                return 0
+            return len(data_or_wLength) * data_or_wLength.itemsize
+        else:
+            return record.data[:data_or_wLength]
+
+    @methodtrace(_logger)
+    def reset_device(self, dev_handle):
+        pass
+
+    @methodtrace(_logger)
+    def is_kernel_driver_active(self, dev_handle, intf):
+        return False
+
+    @methodtrace(_logger)
+    def detach_kernel_driver(self, dev_handle, intf):
+        pass
+
+    @methodtrace(_logger)
+    def attach_kernel_driver(self, dev_handle, intf):
+        pass
+
+    def __write(self, dev_handle, ep, data):
+        queue = dev_handle.transfers.get(ep)
+        record = None
+        if queue is not None:
+            record = dev_handle.next(queue)
+        length = len(data) * data.itemsize
+        if record is None:
+            return length
+        self.__delay(record)
+        _check_status(record.status)
+        return min(length, record.length)
+
+    def __read(self, dev_handle, ep, data, size, timeout):
+        queue = dev_handle.transfers.get(ep)
+        record = None
+        if queue is not None:
+            record = dev_handle.next(queue)
+        if record is None:
+            if self.timing and timeout:
+                time.sleep(timeout / 1000.0)
+            raise USBError(os.strerror(errno.ETIMEDOUT),
+                           None,
+                           errno.ETIMEDOUT)
+        self.__delay(record)
+        _check_status(record.status)
+        recorded = record.data[:size]
+        if data is None:
+            return recorded
+        n = len(recorded)
+        if getattr(data, 'typecode', 'B') == recorded.typecode:
+            data[:n] = recorded
+        else:
+            memoryview(data).cast('B')[:n] = recorded.tobytes()
+        return n
+
+def get_backend(path, timing = False, speed = 1.0):
+    r"""Return a backend replaying the traffic captured in a file.
+
+    path is the name of a pcapng or pcap file with usbmon packets. If timing
+    is True, every transfer takes as long as it took in the capture, divided
+    by speed, and reads with nothing left to replay block for their timeout
+    before failing.
+    """
+    return _ReplayBackend(_load(path), timing, speed)
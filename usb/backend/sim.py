@@ -0,0 +1,838 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+r"""usb.backend.sim - In-process simulated devices.
+
+This backend talks to simulated devices living in the Python process, so
+PyUSB can be exercised, tested and benchmarked without hardware. A device
+is defined by its descriptor blobs plus handlers for its endpoints:
+
+Loopback - data written to the OUT endpoint is read back from the IN one.
+Sink - accepts and counts everything written to it.
+Source - produces an endless stream of data.
+RegisterFile - a bank of registers, accessed through vendor control
+               requests or through the endpoints.
+
+Endpoint handlers implement a write(data) method, which receives an
+array.array('B') and returns the number of bytes accepted, and a
+read(size) method, which returns up to size bytes. Either may return None
+to NAK the transfer: the backend retries it whenever another transfer
+completes on the same device, until the timeout expires. Handlers may also
+raise usb.core.USBError to report an error, for example a stall.
+
+Standard control requests are answered by the backend from the
+descriptors. Other requests are passed to the control callable of the
+device, which receives bmRequestType, bRequest, wValue, wIndex and
+data_or_wLength and returns the data read, the number of bytes written or
+None to stall the request.
+
+Every transfer takes latency seconds plus the time needed to move its data
+at bandwidth bytes per second. Bulk and interrupt transfers are also
+available through the asynchronous interface, where a transfer moves its
+data as soon as it is submitted and its endpoint stops NAKing, and
+completes its duration later, so the latency of the transfers in flight
+overlaps. Isochronous transfers never NAK: when a handler has nothing to
+transfer, they complete empty.
+
+>>> import usb.core
+>>> import usb.backend.sim as sim
+>>> backend = sim.get_backend([sim.loopback_device(latency=0.001)])
+>>> dev = usb.core.find(backend=backend)
+"""
+
+import struct
+import time
+import errno
+import os
+import threading
+import array
+import usb.backend
+import usb.util
+import usb.backend._descriptors as _descriptors
+from usb.core import USBError, USBTransferCancelled
+from usb._debug import methodtrace
+import usb._interop as _interop
+import logging
+
+__author__ = 'Wander Lairson Costa'
+
+__all__ = ['get_backend', 'SimDevice', 'Loopback', 'Sink', 'Source',
+           'RegisterFile', 'loopback_device']
+
+_logger = logging.getLogger('usb.backend.sim')
+
+# standard requests
+_GET_STATUS = 0x00
+_CLEAR_FEATURE = 0x01
+_SET_FEATURE = 0x03
+_GET_DESCRIPTOR = 0x06
+_GET_CONFIGURATION = 0x08
+_SET_CONFIGURATION = 0x09
+_GET_INTERFACE = 0x0a
+_SET_INTERFACE = 0x0b
+
+_ENDPOINT_HALT = 0x00
+
+# how often the asynchronous transfers waiting on a NAK are retried, in
+# seconds
+_POLL_INTERVAL = 0.001
+
+def _error(err):
+    return USBError(os.strerror(err), None, err)
+
+def _as_bytes(data):
+    r"""Return an array.array('B') with the bytes of an array or string."""
+    if isinstance(data, array.array):
+        if data.typecode == 'B':
+            return data
+        try:
+            return array.array('B', memoryview(data).cast('B').tobytes())
+        except (NameError, AttributeError, TypeError):
+            return array.array('B', data.tostring())
+    return _interop.as_array(data)
+
+class Loopback(object):
+    r"""Endpoint handler returning the data written to it.
+
+    The same object is usually assigned to an OUT and an IN endpoint. If
+    capacity is not None, writes NAK while capacity bytes are waiting to be
+    read.
+    """
+    def __init__(self, capacity = None):
+        self.capacity = capacity
+        self.buffer = array.array('B')
+
+    def write(self, data):
+        n = len(data)
+        if self.capacity is not None:
+            n = min(n, self.capacity - len(self.buffer))
+            if n <= 0 and len(data):
+                return None
+        self.buffer.extend(data[:n])
+        return n
+
+    def read(self, size):
+        if not len(self.buffer):
+            return None
+        data = self.buffer[:size]
+        del self.buffer[:size]
+        return data
+
+class Sink(object):
+    r"""Endpoint handler discarding the data written to it.
+
+    The received attribute counts the bytes written.
+    """
+    def __init__(self):
+        self.received = 0
+
+    def write(self, data):
+        self.received += len(data)
+        return len(data)
+
+    def read(self, size):
+        return None
+
+class Source(object):
+    r"""Endpoint handler producing data.
+
+    Reads return the pattern bytes over and over, by default the sequence
+    0 to 255. The sent attribute counts the bytes read.
+    """
+    def __init__(self, pattern = None):
+        if pattern is None:
+            pattern = range(256)
+        pattern = _as_bytes(pattern)
+        self.pattern = pattern * (1 + 4096 // len(pattern))
+        self.period = len(pattern)
+        self.sent = 0
+
+    def write(self, data):
+        return None
+
+    def read(self, size):
+        data = array.array('B')
+        while len(data) < size:
+            offset = (self.sent + len(data)) % self.period
+            data.extend(self.pattern[offset:offset + size - len(data)])
+        self.sent += size
+        return data
+
+class RegisterFile(object):
+    r"""A bank of byte registers.
+
+    As a control handler, the write_request vendor request writes its data
+    to the registers starting at wValue, and the read_request vendor request
+    reads wLength registers starting at wValue. As an endpoint handler, the
+    first byte written is the register address and the rest is written
+    from there on; reads return the registers from the last address written.
+    """
+    def __init__(self, size = 256, read_request = 0x11, write_request = 0x10):
+        self.registers = array.array('B', [0]) * size
+        self.read_request = read_request
+        self.write_request = write_request
+        self.address = 0
+
+    def __call__(self, bmRequestType, bRequest, wValue, wIndex,
+                 data_or_wLength):
+        if bmRequestType & 0x60 != usb.util.CTRL_TYPE_VENDOR:
+            return None
+        if usb.util.ctrl_direction(bmRequestType) == usb.util.CTRL_OUT:
+            if bRequest != self.write_request:
+                return None
+            if data_or_wLength is None:
+                return 0
+            return self.__write(wValue, _as_bytes(data_or_wLength))
+        if bRequest != self.read_request:
+            return None
+        return self.__read(wValue, data_or_wLength)
+
+    def write(self, data):
+        if not len(data):
+            return 0
+        self.address = data[0]
+        self.__write(self.address, data[1:])
+        return len(data)
+
+    def read(self, size):
+        return self.__read(self.address, size)
+
+    def __write(self, address, data):
+        if address + len(data) > len(self.registers):
+            raise _error(errno.EPIPE)
+        self.registers[address:address + len(data)] = data
+        return len(data)
+
+    def __read(self, address, size):
+        return self.registers[address:address + size]
+
+class SimDevice(object):
+    r"""A simulated device.
+
+    device_descriptor and configurations are the device descriptor blob and
+    the list of full configuration descriptor blobs (bytes or sequences of
+    integers). endpoints maps endpoint addresses to their handlers and
+    control is the handler of the non-standard control requests. strings
+    maps string descriptor indexes to strings. latency is the duration, in
+    seconds, of every transfer and bandwidth the data rate, in bytes per
+    second, or None for no limit.
+    """
+    def __init__(self,
+                 device_descriptor,
+                 configurations,
+                 endpoints = None,
+                 control = None,
+                 strings = None,
+                 latency = 0.0,
+                 bandwidth = None,
+                 bus = 1,
+                 address = None,
+                 port_number = None):
+        self.descriptor = _descriptors.parse_device(
+                                _as_bytes(device_descriptor))
+        self.device_descriptor = _as_bytes(device_descriptor)
+        self.configuration_blobs = [_as_bytes(c) for c in configurations]
+        self.configurations = [_descriptors.parse_configuration(c)
+                               for c in self.configuration_blobs]
+        self.endpoints = dict(endpoints or {})
+        self.control = control
+        self.strings = dict(strings or {})
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.bus = bus
+        self.address = address
+        self.port_number = port_number
+
+        if self.configurations:
+            self.current_configuration = \
+                self.configurations[0].bConfigurationValue
+        else:
+            self.current_configuration = 0
+        self.altsettings = {}
+        self.halted = set()
+        self.cond = threading.Condition()
+        # when the data of the transfers in flight is all moved
+        self.__bus_free = 0.0
+
+    def duration(self, length):
+        r"""Return how long a transfer of length bytes takes, in seconds."""
+        d = self.latency
+        if self.bandwidth:
+            d += float(length) / self.bandwidth
+        return d
+
+    def io(self, ep, iso, data, size, timeout, transfer = None, block = True):
+        r"""Perform a transfer on an endpoint.
+
+        For OUT endpoints, data is an array with the data to write and the
+        number of bytes written is returned. For IN endpoints, the data read
+        is returned as an array. If block is False and the endpoint NAKs,
+        None is returned instead of waiting.
+        """
+        started = self.start(ep, iso, data, size, timeout, transfer, block)
+        if started is None:
+            return None
+        ret, end = started
+        remaining = end - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
+        return ret
+
+    def start(self, ep, iso, data, size, timeout, transfer = None,
+              block = True):
+        r"""Move the data of a transfer without waiting for it to complete.
+
+        The arguments are those of io(). The return value is a tuple with
+        the result of io() and the time, as given by time.time(), when the
+        transfer completes, or None if block is False and the endpoint NAKs.
+        The latency of transfers in flight together overlaps, while their
+        data is moved one after the other.
+        """
+        handler = self.endpoints.get(ep)
+        if handler is None:
+            raise _error(errno.EPIPE)
+        if timeout:
+            deadline = time.time() + timeout / 1000.0
+        else:
+            deadline = None
+        out = usb.util.endpoint_direction(ep) == usb.util.ENDPOINT_OUT
+        self.cond.acquire()
+        try:
+            while True:
+                if transfer is not None and transfer.cancelled:
+                    raise USBTransferCancelled()
+                if ep in self.halted:
+                    raise _error(errno.EPIPE)
+                if out:
+                    ret = handler.write(data)
+                else:
+                    ret = handler.read(size)
+                if ret is not None:
+                    break
+                if iso:
+                    if out:
+                        ret = 0
+                    else:
+                        ret = array.array('B')
+                    break
+                # NAK, wait for something to change
+                if not block:
+                    return None
+                if deadline is None:
+                    self.cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise _error(errno.ETIMEDOUT)
+                    self.cond.wait(remaining)
+            if out:
+                length = ret
+            else:
+                ret = _as_bytes(ret)[:size]
+                length = len(ret)
+            end = max(time.time(), self.__bus_free)
+            if self.bandwidth:
+                end += float(length) / self.bandwidth
+            self.__bus_free = end
+            self.cond.notify_all()
+        finally:
+            self.cond.release()
+        return ret, end + self.latency
+
+    def ctrl(self, bmRequestType, bRequest, wValue, wIndex, data_or_wLength):
+        r"""Perform a control request."""
+        ret = self.__standard_request(bmRequestType,
+                                      bRequest,
+                                      wValue,
+                                      wIndex,
+                                      data_or_wLength)
+        if ret is None and self.control is not None:
+            self.cond.acquire()
+            try:
+                ret = self.control(bmRequestType,
+                                   bRequest,
+                                   wValue,
+                                   wIndex,
+                                   data_or_wLength)
+                self.cond.notify_all()
+            finally:
+                self.cond.release()
+        if ret is None:
+            raise _error(errno.EPIPE)
+
+        if usb.util.ctrl_direction(bmRequestType) == usb.util.CTRL_IN:
+            ret = _as_bytes(ret)[:data_or_wLength or 0]
+            length = len(ret)
+        else:
+            length = ret
+        d = self.duration(length)
+        if d > 0:
+            time.sleep(d)
+        return ret
+
+    def __standard_request(self, bmRequestType, bRequest, wValue, wIndex,
+                           data_or_wLength):
+        if bmRequestType & 0x60 != usb.util.CTRL_TYPE_STANDARD:
+            return None
+        recipient = bmRequestType & 0x1f
+        if bmRequestType & 0x80:
+            if bRequest == _GET_DESCRIPTOR:
+                return self.__get_descriptor(wValue >> 8, wValue & 0xff)
+            elif bRequest == _GET_CONFIGURATION:
+                return [self.current_configuration]
+            elif bRequest == _GET_INTERFACE:
+                return [self.altsettings.get(wIndex, 0)]
+            elif bRequest == _GET_STATUS:
+                if recipient == usb.util.CTRL_RECIPIENT_ENDPOINT:
+                    status = int(wIndex in self.halted)
+                elif recipient == usb.util.CTRL_RECIPIENT_DEVICE and \
+                        self.configurations:
+                    status = (self.configurations[0].bmAttributes >> 6) & 1
+                else:
+                    status = 0
+                return [status, 0]
+        else:
+            if bRequest == _SET_CONFIGURATION:
+                self.set_configuration(wValue)
+                return 0
+            elif bRequest == _SET_INTERFACE:
+                self.altsettings[wIndex] = wValue
+                return 0
+            elif bRequest in (_SET_FEATURE, _CLEAR_FEATURE) and \
+                    recipient == usb.util.CTRL_RECIPIENT_ENDPOINT and \
+                    wValue == _ENDPOINT_HALT:
+                self.cond.acquire()
+                try:
+                    if bRequest == _SET_FEATURE:
+                        self.halted.add(wIndex)
+                    else:
+                        self.halted.discard(wIndex)
+                    self.cond.notify_all()
+                finally:
+                    self.cond.release()
+                return 0
+        return None
+
+    def __get_descriptor(self, desc_type, desc_index):
+        if desc_type == usb.util.DESC_TYPE_DEVICE:
+            return self.device_descriptor
+        elif desc_type == usb.util.DESC_TYPE_CONFIG:
+            if desc_index < len(self.configuration_blobs):
+                return self.configuration_blobs[desc_index]
+        elif desc_type == usb.util.DESC_TYPE_STRING:
+            if desc_index == 0:
+                # supported languages: US English
+                return [4, usb.util.DESC_TYPE_STRING, 0x09, 0x04]
+            if desc_index in self.strings:
+                s = self.strings[desc_index].encode('utf-16-le')
+                return _as_bytes(struct.pack('<BB', 2 + len(s),
+                                             usb.util.DESC_TYPE_STRING) + s)
+        return None
+
+    def set_configuration(self, config_value):
+        if config_value and config_value not in \
+                [c.bConfigurationValue for c in self.configurations]:
+            raise _error(errno.EINVAL)
+        self.current_configuration = config_value
+        self.altsettings.clear()
+
+class _Transfer(object):
+    def __init__(self, dev, ep, ep_type, data, timeout, callback):
+        self.dev = dev
+        self.ep = ep
+        self.iso = ep_type == usb.util.ENDPOINT_TYPE_ISO
+        self.data = data
+        if timeout:
+            self.deadline = time.time() + timeout / 1000.0
+        else:
+            self.deadline = None
+        self.callback = callback
+        self.cancelled = False
+        # set once the data is moved, with the time the transfer completes
+        self.started = False
+        self.end = None
+        self.result = None
+        self.error = None
+        # set once the transfer is reported complete
+        self.done = False
+
+class _SimBackend(usb.backend.IBackend):
+    def __init__(self, devices):
+        self.devices = list(devices)
+        # the transfers in flight, in submission order
+        self.transfers = []
+        self.lock = threading.Lock()
+        for i, dev in enumerate(self.devices):
+            if dev.address is None:
+                dev.address = i + 1
+
+    @methodtrace(_logger)
+    def enumerate_devices(self):
+        return iter(self.devices)
+
+    @methodtrace(_logger)
+    def get_device_descriptor(self, dev):
+        desc = dev.descriptor
+        desc.bus = dev.bus
+        desc.address = dev.address
+        desc.port_number = dev.port_number
+        return desc
+
+    @methodtrace(_logger)
+    def get_configuration_descriptor(self, dev, config):
+        return _descriptors.get_configuration(dev.configurations, config)
+
+    @methodtrace(_logger)
+    def get_interface_descriptor(self, dev, intf, alt, config):
+        return _descriptors.get_interface(dev.configurations, intf, alt, config)
+
+    @methodtrace(_logger)
+    def get_endpoint_descriptor(self, dev, ep, intf, alt, config):
+        return _descriptors.get_endpoint(dev.configurations,
+                                         ep,
+                                         intf,
+                                         alt,
+                                         config)
+
+    @methodtrace(_logger)
+    def open_device(self, dev):
+        return dev
+
+    @methodtrace(_logger)
+    def close_device(self, dev_handle):
+        pass
+
+    @methodtrace(_logger)
+    def set_configuration(self, dev_handle, config_value):
+        dev_handle.set_configuration(config_value)
+
+    @methodtrace(_logger)
+    def get_configuration(self, dev_handle):
+        return dev_handle.current_configuration
+
+    @methodtrace(_logger)
+    def set_interface_altsetting(self, dev_handle, intf, altsetting):
+        dev_handle.altsettings[intf] = altsetting
+
+    @methodtrace(_logger)
+    def claim_interface(self, dev_handle, intf):
+        pass
+
+    @methodtrace(_logger)
+    def release_interface(self, dev_handle, intf):
+        pass
+
+    @methodtrace(_logger)
+    def bulk_write(self, dev_handle, ep, intf, data, timeout):
+        return dev_handle.io(ep, False, _as_bytes(data), None, timeout)
+
+    @methodtrace(_logger)
+    def bulk_read(self, dev_handle, ep, intf, data, size, timeout):
+        return self.__read(dev_handle, ep, False, data, size, timeout)
+
+    @methodtrace(_logger)
+    def intr_write(self, dev_handle, ep, intf, data, timeout):
+        return dev_handle.io(ep, False, _as_bytes(data), None, timeout)
+
+    @methodtrace(_logger)
+    def intr_read(self, dev_handle, ep, intf, data, size, timeout):
+        return self.__read(dev_handle, ep, False, data, size, timeout)
+
+    @methodtrace(_logger)
+    def iso_write(self, dev_handle, ep, intf, data, timeout):
+        return dev_handle.io(ep, True, _as_bytes(data), None, timeout)
+
+    @methodtrace(_logger)
+    def iso_read(self, dev_handle, ep, intf, data, size, timeout):
+        return self.__read(dev_handle, ep, True, data, size, timeout)
+
+    @methodtrace(_logger)
+    def ctrl_transfer(self,
+                      dev_handle,
+                      bmRequestType,
+                      bRequest,
+                      wValue,
+                      wIndex,
+                      data_or_wLength,
+                      timeout):
+        return dev_handle.ctrl(bmRequestType,
+                               bRequest,
+                               wValue,
+                               wIndex,
+                               data_or_wLength)
+
+    @methodtrace(_logger)
+    def submit_transfer(self, dev_handle, ep, intf, ep_type, data, timeout,
+                        callback = None):
+        t = _Transfer(dev_handle, ep, ep_type, data, timeout, callback)
+        self.lock.acquire()
+        try:
+            self.transfers.append(t)
+            self.__progress()
+        finally:
+            self.lock.release()
+        return t
+
+    @methodtrace(_logger)
+    def wait_transfer(self, transfer):
+        while not transfer.done:
+            self.lock.acquire()
+            try:
+                self.__progress()
+            finally:
+                self.lock.release()
+            if not transfer.started:
+                # NAK, wait for another transfer on the device
+                dev = transfer.dev
+                dev.cond.acquire()
+                try:
+                    if not transfer.cancelled:
+                        dev.cond.wait(_POLL_INTERVAL)
+                finally:
+                    dev.cond.release()
+                continue
+            remaining = transfer.end - time.time()
+            if remaining > 0:
+                time.sleep(remaining)
+            self.lock.acquire()
+            try:
+                completed = self.__complete(transfer)
+            finally:
+                self.lock.release()
+            if completed and transfer.callback is not None:
+                transfer.callback(transfer)
+        if transfer.error is not None:
+            # not kept, as its traceback holds the frames holding the buffer
+            try:
+                raise transfer.error
+            finally:
+                transfer.error = None
+        return transfer.result
+
+    @methodtrace(_logger)
+    def handle_events(self, timeout):
+        deadline = time.time() + timeout / 1000.0
+        while True:
+            completed = []
+            self.lock.acquire()
+            try:
+                self.__progress()
+                now = time.time()
+                for t in list(self.transfers):
+                    if t.callback is not None and t.started and t.end <= now:
+                        self.__complete(t)
+                        completed.append(t)
+            finally:
+                self.lock.release()
+            for t in completed:
+                t.callback(t)
+            remaining = deadline - time.time()
+            if completed or remaining <= 0:
+                return
+            # the devices have a condition each, so poll them
+            time.sleep(min(remaining, _POLL_INTERVAL))
+
+    # start the transfers whose endpoint stopped NAKing, in order, with
+    # the lock held; the time they take is not spent here
+    def __progress(self):
+        now = time.time()
+        naking = set()
+        for t in self.transfers:
+            if t.started or (t.dev, t.ep) in naking:
+                continue
+            try:
+                started = self.__start(t)
+            except USBError:
+                # raised again by wait_transfer(), without the frames
+                # holding the buffer
+                t.error = _interop._exception()
+                started = (None, now)
+            if started is None:
+                if t.deadline is None or now < t.deadline:
+                    naking.add((t.dev, t.ep))
+                    continue
+                started = (None, now)
+                t.error = _error(errno.ETIMEDOUT)
+            t.result, t.end = started
+            t.started = True
+
+    def __start(self, transfer):
+        dev = transfer.dev
+        data = transfer.data
+        if usb.util.endpoint_direction(transfer.ep) == usb.util.ENDPOINT_OUT:
+            return dev.start(transfer.ep, transfer.iso, _as_bytes(data), None,
+                             0, transfer, False)
+        started = dev.start(transfer.ep,
+                            transfer.iso,
+                            None,
+                            len(data) * data.itemsize,
+                            0,
+                            transfer,
+                            False)
+        if started is None:
+            return None
+        ret, end = started
+        return _copy(data, ret), end
+
+    # with the lock held, return whether the transfer was still in flight
+    def __complete(self, transfer):
+        if transfer.done:
+            return False
+        transfer.done = True
+        self.transfers.remove(transfer)
+        return True
+
+    @methodtrace(_logger)
+    def cancel_transfer(self, transfer):
+        dev = transfer.dev
+        dev.cond.acquire()
+        try:
+            transfer.cancelled = True
+            dev.cond.notify_all()
+        finally:
+            dev.cond.release()
+
+    @methodtrace(_logger)
+    def reset_device(self, dev_handle):
+        dev_handle.halted.clear()
+        dev_handle.altsettings.clear()
+
+    @methodtrace(_logger)
+    def is_kernel_driver_active(self, dev_handle, intf):
+        return False
+
+    @methodtrace(_logger)
+    def detach_kernel_driver(self, dev_handle, intf):
+        pass
+
+    @methodtrace(_logger)
+    def attach_kernel_driver(self, dev_handle, intf):
+        pass
+
+    def __read(self, dev_handle, ep, iso, data, size, timeout):
+        ret = dev_handle.io(ep, iso, None, size, timeout)
+        if data is None:
+            return ret
+        return _copy(data, ret)
+
+# copy the data read into the caller's buffer, returning its length
+def _copy(buff, data):
+    n = len(data)
+    # memoryviews of bytes as well
+    if getattr(buff, 'typecode', 'B') == 'B':
+        buff[:n] = data
+    else:
+        memoryview(buff).cast('B')[:n] = data.tobytes()
+    return n
+
+def loopback_device(idVendor = 0xfffe,
+                    idProduct = 0x0001,
+                    wMaxPacketSize = 64,
+                    **kwargs):
+    r"""Return a SimDevice modeled after the PyUSB test board.
+
+    The device has one configuration with one interface whose alternate
+    settings 0, 1 and 2 have a pair of bulk, interrupt and isochronous
+    endpoints, respectively, at the addresses 0x01 and 0x81, which loop
+    the data back. Vendor requests 0x10 and 0x11 write and read a 256 byte
+    register file, and the string descriptors 1, 2 and 3 are the
+    manufacturer, product and serial number. The remaining keyword
+    arguments are passed to SimDevice.
+    """
+    device = struct.pack('<BBHBBBBHHHBBBB',
+                         18,
+                         usb.util.DESC_TYPE_DEVICE,
+                         0x0200,
+                         0,
+                         0,
+                         0,
+                         64,
+                         idVendor,
+                         idProduct,
+                         0x0001,
+                         1,
+                         2,
+                         3,
+                         1)
+
+    body = b''
+    for alt, ep_type in enumerate((usb.util.ENDPOINT_TYPE_BULK,
+                                   usb.util.ENDPOINT_TYPE_INTR,
+                                   usb.util.ENDPOINT_TYPE_ISO)):
+        if ep_type == usb.util.ENDPOINT_TYPE_BULK:
+            interval = 0
+        else:
+            interval = 1
+        body += struct.pack('<BBBBBBBBB',
+                            9,
+                            usb.util.DESC_TYPE_INTERFACE,
+                            0,
+                            alt,
+                            2,
+                            0xff,
+                            0,
+                            0,
+                            0)
+        for address in (0x01, 0x81):
+            body += struct.pack('<BBBBHB',
+                                7,
+                                usb.util.DESC_TYPE_ENDPOINT,
+                                address,
+                                ep_type,
+                                wMaxPacketSize,
+                                interval)
+
+    config = struct.pack('<BBHBBBBB',
+                         9,
+                         usb.util.DESC_TYPE_CONFIG,
+                         9 + len(body),
+                         1,
+                         1,
+                         0,
+                         0xc0,
+                         50) + body
+
+    loopback = Loopback()
+
+    return SimDevice(device,
+                     [config],
+                     endpoints = {0x01:loopback, 0x81:loopback},
+                     control = RegisterFile(),
+                     strings = {1:u'PyUSB',
+                                2:u'Simulated Device',
+                                3:u'0001'},
+                     **kwargs)
+
+def get_backend(devices = None):
+    r"""Return a backend for a list of SimDevice objects.
+
+    If devices is None, the backend has a single loopback_device().
+    """
+    if devices is None:
+        devices = [loopback_device()]
+    return _SimBackend(devices)
@@ -0,0 +1,618 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+r"""usb.capture - Capture of USB traffic to pcapng files.
+
+This module exports:
+
+start() - start capturing the transfers done through usb.core.Device.
+stop() - stop the current capture.
+Capture - the class representing a capture in progress.
+to_mmap() - stream the data of an IN endpoint into a memory mapped file.
+MmapCapture - the class representing a to_mmap() capture.
+
+Every setup packet and data payload passing through the write(), read(),
+readinto() and ctrl_transfer() methods of usb.core.Device objects is
+recorded, with timestamps, in a pcapng file using the Linux usbmon memory
+mapped link type (LINKTYPE_USB_LINUX_MMAPPED). The files can be opened with
+Wireshark or any other tool which understands usbmon captures. No special
+privileges are required, since the capture happens inside PyUSB.
+
+Each transfer produces a submission ('S') and a completion ('C') event.
+The first time a device shows up in the capture, its device and
+configuration descriptors are recorded as GET_DESCRIPTOR requests, so the
+file is self-contained and can be fed to the usb.backend.replay backend.
+The transfer path only copies the payload and queues it; the records are
+built and written by a background thread, so the capture does not stall the
+I/O. If the writer cannot keep up and the queue fills, events are dropped
+and counted in the Capture.dropped attribute.
+
+>>> import usb.capture
+>>> cap = usb.capture.start('traffic.pcapng')
+>>> # ... do some I/O ...
+>>> usb.capture.stop()
+
+to_mmap() does not record the traffic, but the data read from an endpoint,
+for long captures of streaming devices. The transfers read straight into
+the pages of the file mapping, so the data is never copied by Python.
+"""
+
+__author__ = 'Wander Lairson Costa'
+
+__all__ = ['start', 'stop', 'Capture', 'to_mmap', 'MmapCapture',
+           'LINKTYPE_USB_LINUX_MMAPPED']
+
+import struct
+import threading
+import time
+import errno
+import mmap
+import array
+import usb.core as core
+import usb.util as util
+import usb._interop as _interop
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+LINKTYPE_USB_LINUX_MMAPPED = 220
+
+# pcapng block types
+_BT_SECTION_HEADER = 0x0A0D0D0A
+_BT_INTERFACE_DESCRIPTION = 0x00000001
+_BT_ENHANCED_PACKET = 0x00000006
+
+_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+# struct usbmon_packet, in host byte order, as the pcapng section
+_USBMON_HEADER = struct.Struct('=QBBBBHccqiiII8siiII')
+
+# usbmon transfer types
+_usbmon_xfer_type = {
+    util.ENDPOINT_TYPE_ISO:0,
+    util.ENDPOINT_TYPE_INTR:1,
+    util.ENDPOINT_TYPE_CTRL:2,
+    util.ENDPOINT_TYPE_BULK:3
+}
+
+_DEFAULT_QUEUE_SIZE = 65536
+_DEFAULT_BUFFER_SIZE = 1 << 20
+
+# to_mmap() transfer size, in packets, and number of transfers in flight
+_DEFAULT_MMAP_PACKETS = 256
+_DEFAULT_MMAP_TRANSFERS = 4
+
+def _pad(length):
+    return (4 - length % 4) % 4
+
+def _to_bytes(data, length):
+    try:
+        return memoryview(data).cast('B')[:length].tobytes()
+    except (NameError, AttributeError, TypeError):
+        if hasattr(data, 'tobytes'):
+            return data.tobytes()[:length]
+        return data.tostring()[:length]
+
+def _descriptors(device):
+    yield util.DESC_TYPE_DEVICE << 8, struct.pack('<BBHBBBBHHHBBBB',
+                                             18,
+                                             util.DESC_TYPE_DEVICE,
+                                             device.bcdUSB,
+                                             device.bDeviceClass,
+                                             device.bDeviceSubClass,
+                                             device.bDeviceProtocol,
+                                             device.bMaxPacketSize0,
+                                             device.idVendor,
+                                             device.idProduct,
+                                             device.bcdDevice,
+                                             device.iManufacturer,
+                                             device.iProduct,
+                                             device.iSerialNumber,
+                                             device.bNumConfigurations)
+
+    for cfg in device:
+        body = []
+        for intf in cfg:
+            body.append(struct.pack('<BBBBBBBBB',
+                                    9,
+                                    util.DESC_TYPE_INTERFACE,
+                                    intf.bInterfaceNumber,
+                                    intf.bAlternateSetting,
+                                    intf.bNumEndpoints,
+                                    intf.bInterfaceClass,
+                                    intf.bInterfaceSubClass,
+                                    intf.bInterfaceProtocol,
+                                    intf.iInterface))
+            for ep in intf:
+                body.append(struct.pack('<BBBBHB',
+                                        7,
+                                        util.DESC_TYPE_ENDPOINT,
+                                        ep.bEndpointAddress,
+                                        ep.bmAttributes,
+                                        ep.wMaxPacketSize,
+                                        ep.bInterval))
+        body = b''.join(body)
+        yield (util.DESC_TYPE_CONFIG << 8) | cfg.index, \
+              struct.pack('<BBHBBBBB',
+                          9,
+                          util.DESC_TYPE_CONFIG,
+                          9 + len(body),
+                          cfg.bNumInterfaces,
+                          cfg.bConfigurationValue,
+                          cfg.iConfiguration,
+                          cfg.bmAttributes,
+                          cfg.bMaxPower) + body
+
+def _section_header_block():
+    length = 28
+    return struct.pack('=IIIHHqI',
+                       _BT_SECTION_HEADER,
+                       length,
+                       _BYTE_ORDER_MAGIC,
+                       1,
+                       0,
+                       -1,
+                       length)
+
+def _interface_description_block(snaplen):
+    length = 20
+    return struct.pack('=IIHHII',
+                       _BT_INTERFACE_DESCRIPTION,
+                       length,
+                       LINKTYPE_USB_LINUX_MMAPPED,
+                       0,
+                       snaplen,
+                       length)
+
+def _enhanced_packet_block(timestamp, packet, orig_len):
+    usecs = int(timestamp * 1000000)
+    caplen = len(packet)
+    length = 32 + caplen + _pad(caplen)
+    return struct.pack('=IIIIIII',
+                       _BT_ENHANCED_PACKET,
+                       length,
+                       0,
+                       (usecs >> 32) & 0xffffffff,
+                       usecs & 0xffffffff,
+                       caplen,
+                       orig_len) + \
+           packet + b'\x00' * _pad(caplen) + struct.pack('=I', length)
+
+class Capture(object):
+    r"""A capture in progress.
+
+    Capture objects are created by the start() function. The packets
+    attribute is the number of events queued so far and dropped is the
+    number of events lost because the writer thread could not keep up.
+    """
+
+    def __init__(self, path, snaplen = 0, queue_size = _DEFAULT_QUEUE_SIZE):
+        self.path = path
+        self.snaplen = snaplen
+        self.packets = 0
+        self.dropped = 0
+        self.__urb_id = 0
+        self.__devices = _interop._set()
+        self.__lock = threading.Lock()
+        self.__queue = queue.Queue(queue_size)
+        # wall clock time of the monotonic clock origin
+        self.__time_offset = time.time() - _interop._perf_counter()
+        self.__file = open(path, 'wb', _DEFAULT_BUFFER_SIZE)
+        self.__file.write(_section_header_block())
+        self.__file.write(_interface_description_block(snaplen))
+        self.__thread = threading.Thread(target=self.__writer,
+                                         name='usb.capture writer')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        r"""Stop the capture, flush the pending events and close the file."""
+        if self.__thread is None:
+            return
+        if core._capture is self:
+            core._capture = None
+        self.__queue.put(None)
+        self.__thread.join()
+        self.__thread = None
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def submit(self, device, endpoint, ep_type, direction, length, setup, data):
+        r"""Record the submission of a transfer and return its URB id.
+
+        This method is called by usb.core.Device.
+        """
+        self.__lock.acquire()
+        try:
+            self.__urb_id += 1
+            urb_id = self.__urb_id
+            key = (device.bus, device.address)
+            new_device = key not in self.__devices
+            self.__devices.add(key)
+        finally:
+            self.__lock.release()
+        # the writer thread reads the descriptors, off the transfer path
+        if new_device and \
+                not self.__put((b'D', device, _interop._perf_counter())):
+            self.__lock.acquire()
+            try:
+                self.__devices.discard(key)
+            finally:
+                self.__lock.release()
+        if data is not None:
+            data = _to_bytes(data, length)
+        self.__put((b'S', urb_id, device.bus, device.address, endpoint, ep_type,
+                    direction, _interop._perf_counter(), 0, length, setup, data))
+        return urb_id
+
+    def complete(self, urb_id, device, endpoint, ep_type, direction, result,
+                 data):
+        r"""Record the completion of a transfer.
+
+        result is the number of bytes transferred or the USBError raised.
+        data is the buffer holding the data read for IN transfers.
+        This method is called by usb.core.Device.
+        """
+        if isinstance(result, core.USBError):
+            status = -(result.errno or errno.EIO)
+            length = 0
+        else:
+            status = 0
+            length = result
+        if data is not None and length:
+            data = _to_bytes(data, length)
+        else:
+            data = None
+        self.__put((b'C', urb_id, device.bus, device.address, endpoint, ep_type,
+                    direction, _interop._perf_counter(), status, length, None,
+                    data))
+
+    # the GET_DESCRIPTOR requests of the descriptors of a new device, timed
+    # when it was first seen
+    def __descriptor_events(self, device, timestamp):
+        try:
+            descriptors = list(_descriptors(device))
+        except (core.USBError, IndexError):
+            return []
+        events = []
+        for wValue, desc in descriptors:
+            self.__lock.acquire()
+            try:
+                self.__urb_id += 1
+                urb_id = self.__urb_id
+            finally:
+                self.__lock.release()
+            setup = (util.CTRL_IN, 6, wValue, 0, len(desc))
+            events.append((b'S', urb_id, device.bus, device.address, 0,
+                           util.ENDPOINT_TYPE_CTRL, util.ENDPOINT_IN,
+                           timestamp, 0, len(desc), setup, None))
+            events.append((b'C', urb_id, device.bus, device.address, 0,
+                           util.ENDPOINT_TYPE_CTRL, util.ENDPOINT_IN,
+                           timestamp, 0, len(desc), None, desc))
+        return events
+
+    def __put(self, event):
+        try:
+            self.__queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        if event[0] != b'D':
+            self.packets += 1
+        return True
+
+    def __writer(self):
+        get = self.__queue.get
+        write = self.__file.write
+        while True:
+            event = get()
+            if event is None:
+                break
+            if event[0] == b'D':
+                for e in self.__descriptor_events(event[1], event[2]):
+                    write(self.__format(e))
+                    self.packets += 1
+                continue
+            write(self.__format(event))
+        self.__file.flush()
+
+    def __format(self, event):
+        kind, urb_id, bus, address, endpoint, ep_type, direction, \
+            timestamp, status, length, setup, data = event
+        timestamp += self.__time_offset
+        secs = int(timestamp)
+        usecs = int((timestamp - secs) * 1000000)
+
+        if setup is not None:
+            flag_setup = b'\x00'
+            setup_bytes = struct.pack('<BBHHH', *setup)
+        else:
+            flag_setup = b'-'
+            setup_bytes = b'\x00' * 8
+
+        if data is not None:
+            flag_data = b'\x00'
+        elif direction == util.ENDPOINT_IN:
+            flag_data = b'<'
+            data = b''
+        else:
+            flag_data = b'>'
+            data = b''
+
+        orig_len = len(data)
+        if self.snaplen:
+            data = data[:max(self.snaplen - _USBMON_HEADER.size, 0)]
+
+        # the endpoint direction is part of the endpoint number for control
+        # endpoints too
+        epnum = (endpoint & 0x7f) | direction
+
+        header = _USBMON_HEADER.pack(urb_id,
+                                     ord(kind),
+                                     _usbmon_xfer_type[ep_type],
+                                     epnum,
+                                     address or 0,
+                                     bus or 0,
+                                     flag_setup,
+                                     flag_data,
+                                     secs,
+                                     usecs,
+                                     status,
+                                     length,
+                                     len(data),
+                                     setup_bytes,
+                                     0,
+                                     0,
+                                     0,
+                                     0)
+
+        return _enhanced_packet_block(timestamp,
+                                      header + data,
+                                      _USBMON_HEADER.size + orig_len)
+
+def start(path, snaplen = 0, queue_size = _DEFAULT_QUEUE_SIZE):
+    r"""Start capturing the USB traffic to a pcapng file.
+
+    path is the output file name, which is overwritten. If snaplen is not
+    zero, packets are truncated to snaplen bytes (including the 64 bytes
+    usbmon header). queue_size is the maximum number of events waiting to
+    be written.
+
+    Only one capture can be active at a time; starting a new one stops the
+    current capture. The function returns the new Capture object, which can
+    also be used as a context manager.
+    """
+    stop()
+    cap = Capture(path, snaplen, queue_size)
+    core._capture = cap
+    return cap
+
+def stop():
+    r"""Stop the current capture, if any."""
+    cap = core._capture
+    if cap is not None:
+        cap.stop()
+
+class MmapCapture(object):
+    r"""A capture of an IN endpoint into a memory mapped file.
+
+    MmapCapture objects are created by the to_mmap() function. The captured
+    attribute is the number of bytes read so far, and overruns the number
+    of bytes lost: the data which did not fit in the file or, in ring
+    mode, the older data overwritten. error is the USBError which ended
+    the capture, if any.
+    """
+
+    def __init__(self, endpoint, path, size, transfer_size = None,
+                 transfers = _DEFAULT_MMAP_TRANSFERS, timeout = 0,
+                 ring = False, progress = None):
+        if util.endpoint_direction(endpoint.bEndpointAddress) != util.ENDPOINT_IN:
+            raise ValueError('Not an IN endpoint')
+        if size < 1:
+            raise ValueError('Invalid file size')
+        if transfers < 1:
+            raise ValueError('At least one transfer must be in flight')
+        packet = (endpoint.wMaxPacketSize & 0x7ff) or 1
+        if transfer_size is None:
+            transfer_size = packet * _DEFAULT_MMAP_PACKETS
+        self.endpoint = endpoint
+        self.path = path
+        self.size = size
+        self.transfer_size = max(packet, transfer_size - transfer_size % packet)
+        self.transfers = transfers
+        self.timeout = timeout
+        self.ring = ring
+        self.progress = progress
+        self.captured = 0
+        self.overruns = 0
+        self.error = None
+        self.__packet = packet
+        self.__stopped = False
+        self.__file = open(path, 'w+b')
+        self.__file.truncate(size)
+        self.__mmap = mmap.mmap(self.__file.fileno(), size)
+        self.__thread = threading.Thread(target=self.__run,
+                                         name='usb.capture mmap')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __get_position(self):
+        if self.ring:
+            return self.captured % self.size
+        return self.captured
+
+    position = property(
+                    __get_position,
+                    doc = 'File offset where the next byte goes. In ring mode, '
+                          'the oldest byte is there once the file wrapped'
+                )
+
+    def wait(self, timeout = None):
+        r"""Wait for the capture to end and return the number of bytes read.
+
+        If the capture ended with an error, it is raised. If timeout (in
+        seconds) elapses first, the capture keeps running.
+        """
+        self.__thread.join(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.captured
+
+    def stop(self):
+        r"""Stop the capture and close the file.
+
+        The file is truncated to the data read, unless in ring mode. On
+        backends without asynchronous transfers, the transfer in progress
+        cannot be cancelled, so this waits for it to end: with no timeout,
+        until the device sends data.
+        """
+        self.__stopped = True
+        self.endpoint.cancel_pending()
+        return self.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __run(self):
+        view = memoryview(self.__mmap)
+        try:
+            try:
+                self.__capture(view)
+            except core.USBTransferCancelled:
+                pass
+            except core.USBError:
+                self.error = _interop._exception()
+        finally:
+            # the views must be gone before the mapping is closed
+            if hasattr(view, 'release'):
+                view.release()
+            del view
+            self.__mmap.flush()
+            self.__mmap.close()
+            if not self.ring:
+                self.__file.truncate(min(self.captured, self.size))
+            self.__file.close()
+
+    def __capture(self, view):
+        # stream offset of the next transfer, and whether the transfers in
+        # flight must end before it is known
+        self.__offset = 0
+        self.__resync = False
+        def fill(pending):
+            if self.__resync:
+                if pending:
+                    return None
+                self.__resync = False
+                self.__offset = self.captured
+            offset = self.__offset
+            if not self.ring and offset >= self.size:
+                return None
+            buff = self.__buffer(view, offset)
+            self.__offset += len(buff)
+            return offset, buff
+        core._read_stream(self.endpoint, self.transfers, self.timeout,
+                          lambda: self.__stopped, fill, self.__done)
+
+    def __done(self, offset, buff, n):
+        self.__deliver(offset, buff, n)
+        # the transfers queued after a short one read the data to the wrong
+        # place; let them end and start over from there
+        if n < len(buff):
+            self.__resync = True
+        if self.progress is not None:
+            self.progress(self.captured)
+        return self.ring or self.captured < self.size
+
+    # the buffer of the transfer reading the data at the stream offset
+    def __buffer(self, view, offset):
+        pos = offset % self.size
+        length = min(self.transfer_size, self.size - pos)
+        if length >= self.__packet:
+            length -= length % self.__packet
+            return view[pos:pos + length]
+        # less than a packet left before the end of the file: the device
+        # may send a whole one, so it goes to a temporary buffer
+        return _interop.as_array([0]) * self.__packet
+
+    def __deliver(self, offset, buff, n):
+        if offset == self.captured and not isinstance(buff, array.array):
+            # read in place
+            self.captured += n
+        else:
+            data = _to_bytes(buff, n)
+            while data:
+                pos = self.__get_position()
+                if pos >= self.size:
+                    self.overruns += len(data)
+                    break
+                k = min(len(data), self.size - pos)
+                self.__mmap[pos:pos + k] = data[:k]
+                data = data[k:]
+                self.captured += k
+        if self.ring:
+            self.overruns = max(0, self.captured - self.size)
+
+def to_mmap(endpoint, path, size, transfer_size = None,
+            transfers = _DEFAULT_MMAP_TRANSFERS, timeout = 0, ring = False,
+            progress = None):
+    r"""Stream the data read from an IN endpoint into a memory mapped file.
+
+    endpoint is the usb.core.Endpoint object to read from, and path the
+    file name, which is overwritten. A background thread reads up to size
+    bytes into the file, keeping transfers transfers of transfer_size bytes
+    (256 packets by default, rounded down to a multiple of wMaxPacketSize)
+    in flight if the backend supports asynchronous transfers. The transfers
+    read straight into the file mapping, and are seen by the statistics,
+    the transfer hooks and the packet capture as those of read() are.
+
+    If ring is True, the capture goes on when the file is full, overwriting
+    the oldest data, until it is stopped. timeout is the time limit of each
+    transfer, in miliseconds; the default, zero, waits forever. Backends
+    without asynchronous transfers, such as libusb 0.1, cannot interrupt a
+    transfer to stop the capture, so give them a timeout. If given,
+    progress is called from the capture thread with the number of bytes
+    read after each transfer.
+
+    The function returns the new MmapCapture object, which can also be used
+    as a context manager.
+
+    >>> cap = usb.capture.to_mmap(ep, 'stream.bin', 1 << 30)
+    >>> cap.wait()
+    """
+    return MmapCapture(endpoint, path, size, transfer_size, transfers,
+                       timeout, ring, progress)
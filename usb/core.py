@@ -34,23 +34,69 @@ Device - a class representing a USB device.
 Configuration - a class representing a configuration descriptor.
 Interface - a class representing an interface descriptor.
 Endpoint - a class representing an endpoint descriptor.
+USBError - the exception raised on USB errors.
+USBTransferCancelled - the exception raised when a transfer is cancelled.
 find() - a function to find USB devices.
+add_transfer_hook() - register functions called around every transfer.
+remove_transfer_hook() - unregister functions added by add_transfer_hook().
 """
 
 __author__ = 'Wander Lairson Costa'
 
-__all__ = ['Device', 'Configuration', 'Interface', 'Endpoint', 'find']
+__all__ = ['Device', 'Configuration', 'Interface', 'Endpoint', 'find',
+           'USBError', 'USBTransferCancelled', 'BufferedReader',
+           'add_transfer_hook', 'remove_transfer_hook']
 
+import usb
 import usb.util as util
 import copy
 import operator
 import usb._interop as _interop
 import logging
+import errno
+import threading
+import sys
+import os
+import array
+import usb._stats as _stats
 
 _logger = logging.getLogger('usb.core')
 
+usb._setup_log()
+
 _DEFAULT_TIMEOUT = 1000
 
+# read ahead size of BufferedReader, in packets
+_DEFAULT_READ_AHEAD = 64
+
+# bulk transfers larger than this are split, and at most this many pieces
+# are in flight, which stays within the default usbfs memory limit (16 MB)
+_DEFAULT_CHUNK_SIZE = 1 << 20
+_DEFAULT_CHUNKS_IN_FLIGHT = 4
+
+# (pre, post) pairs registered through add_transfer_hook(). The tuple is
+# replaced, never changed in place, so it can be iterated without locking.
+_transfer_hooks = ()
+_transfer_hooks_lock = threading.Lock()
+
+# the active usb.capture.Capture object, if any
+_capture = None
+
+# _ResourceManager objects with an open device handle
+_open_resources = _interop._set()
+
+# the child of a fork() must not touch the handles and the capture of the
+# parent: it opens its own handles on first use
+def _after_fork_in_child():
+    global _capture
+    _capture = None
+    for ctx in list(_open_resources):
+        ctx.abandon()
+    _open_resources.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
 def _set_attr(input, output, fields):
     for f in fields:
        setattr(output, f, getattr(input, f))
@@ -64,16 +110,39 @@ class _ResourceManager(object):
         self._claimed_intf = _interop._set()
         self._alt_set = {}
         self._ep_type_map = {}
+        self._ep_size_map = {}
+        # (bInterfaceNumber, endpoint type) of the transfers, indexed by the
+        # endpoint address and the interface argument
+        self._transfer_map = {}
+        self._packet_size_map = {}
+        # False once we know the backend lacks asynchronous transfers. When
+        # it emulates them with threads, blocking I/O is better off without.
+        self.async_transfers = not getattr(backend, 'threaded_transfers', False)
+        # transfers in flight, indexed by the endpoint address
+        self._pending = {}
+        self._pending_lock = threading.Lock()
 
     def managed_open(self):
         if self.handle is None:
             self.handle = self.backend.open_device(self.dev)
+            _open_resources.add(self)
         return self.handle
 
     def managed_close(self):
         if self.handle is not None:
             self.backend.close_device(self.handle)
             self.handle = None
+            _open_resources.discard(self)
+
+    # forget the handle without closing it, as it belongs to the parent
+    # process; the device is opened again on first use
+    def abandon(self):
+        self.handle = None
+        self._active_cfg_index = None
+        self._claimed_intf.clear()
+        self._alt_set.clear()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
 
     def managed_set_configuration(self, device, config):
         if config is None:
@@ -97,6 +166,9 @@ class _ResourceManager(object):
         # after changing configuration, our alternate setting and endpoint type caches
         # are not valid anymore
         self._ep_type_map.clear()
+        self._ep_size_map.clear()
+        self._transfer_map.clear()
+        self._packet_size_map.clear()
         self._alt_set.clear()
 
     def managed_claim_interface(self, device, intf):
@@ -140,6 +212,8 @@ class _ResourceManager(object):
             alt = i.bAlternateSetting
         self.backend.set_interface_altsetting(self.handle, i.bInterfaceNumber, alt)
         self._alt_set[i.bInterfaceNumber] = alt
+        self._transfer_map.clear()
+        self._packet_size_map.clear()
 
     def get_interface(self, device, intf):
         # TODO: check the viability of issuing a GET_INTERFACE
@@ -181,6 +255,84 @@ class _ResourceManager(object):
             self._ep_type_map[key] = etype
             return etype
 
+    def get_max_packet_size(self, device, address, intf):
+        # cached by the arguments too, like prepare_transfer()
+        try:
+            return self._packet_size_map[(address, intf)]
+        except (KeyError, TypeError):
+            pass
+        i = self.get_interface(device, intf)
+        key = (address, i.bInterfaceNumber, i.bAlternateSetting)
+        try:
+            size = self._ep_size_map[key]
+        except KeyError:
+            e = util.find_descriptor(i, bEndpointAddress=address)
+            # bits 11 and 12 tell the number of additional transactions
+            # per microframe of high-bandwidth endpoints
+            size = e.wMaxPacketSize & 0x7ff
+            self._ep_size_map[key] = size
+        if not isinstance(intf, Interface):
+            self._packet_size_map[(address, intf)] = size
+        return size
+
+    def prepare_transfer(self, device, endpoint, intf):
+        # finding the interface and the endpoint type takes several
+        # descriptor lookups, so the result is cached for the next transfers
+        key = (endpoint, intf)
+        try:
+            intf_number, ep_type = self._transfer_map[key]
+        except (KeyError, TypeError):
+            i = self.get_interface(device, intf)
+            ep_type = self.get_endpoint_type(device, endpoint, i)
+            intf_number = i.bInterfaceNumber
+            if not isinstance(intf, Interface):
+                self._transfer_map[key] = (intf_number, ep_type)
+        self.managed_claim_interface(device, intf_number)
+        return intf_number, ep_type
+
+    def managed_transfer(self, endpoint, intf, ep_type, data, timeout):
+        # submit the transfer asynchronously and wait for it, so that
+        # another thread is able to cancel it through cancel_pending()
+        transfer = self.managed_submit(endpoint, intf, ep_type, data, timeout)
+        return self.managed_wait(endpoint, transfer)
+
+    def managed_submit(self, endpoint, intf, ep_type, data, timeout,
+                       callback = None):
+        self._pending_lock.acquire()
+        try:
+            transfer = self.backend.submit_transfer(self.handle, endpoint,
+                                                    intf, ep_type, data,
+                                                    timeout, callback)
+            self._pending.setdefault(endpoint, []).append(transfer)
+        finally:
+            self._pending_lock.release()
+        return transfer
+
+    def managed_wait(self, endpoint, transfer):
+        try:
+            return self.backend.wait_transfer(transfer)
+        finally:
+            self._pending_lock.acquire()
+            try:
+                self._pending[endpoint].remove(transfer)
+            finally:
+                self._pending_lock.release()
+
+    def cancel_pending(self, endpoint):
+        self._pending_lock.acquire()
+        try:
+            if endpoint is None:
+                transfers = []
+                for t in self._pending.values():
+                    transfers.extend(t)
+            else:
+                transfers = list(self._pending.get(endpoint, ()))
+            for t in transfers:
+                self.backend.cancel_transfer(t)
+        finally:
+            self._pending_lock.release()
+        return len(transfers)
+
     def release_all_interfaces(self, device):
         claimed = copy.copy(self._claimed_intf)
         for i in claimed:
@@ -191,6 +343,9 @@ class _ResourceManager(object):
         if close_handle:
             self.managed_close()
         self._ep_type_map.clear()
+        self._ep_size_map.clear()
+        self._transfer_map.clear()
+        self._packet_size_map.clear()
         self._alt_set.clear()
         self._active_cfg_index = None
 
@@ -212,6 +367,18 @@ class USBError(IOError):
         IOError.__init__(self, errno, strerror)
         self.backend_error_code = error_code
 
+class USBTransferCancelled(USBError):
+    r"""Exception raised when a transfer is cancelled.
+
+    A thread blocked in a transfer gets this exception when another
+    thread cancels the transfer through the Device.cancel_pending()
+    method.
+    """
+
+    def __init__(self, strerror = 'Transfer cancelled', error_code = None):
+        USBError.__init__(self, strerror, error_code,
+                          errno.__dict__.get('ECANCELED', None))
+
 class Endpoint(object):
     r"""Represent an endpoint object.
 
@@ -273,7 +440,7 @@ class Endpoint(object):
                 )
             )
 
-    def write(self, data, timeout = None):
+    def write(self, data, timeout = None, zlp = False):
         r"""Write data to the endpoint.
         
         The parameter data contains the data to be sent to the endpoint and
@@ -284,7 +451,16 @@ class Endpoint(object):
 
         For details, see the Device.write() method.
         """
-        return self.device.write(self.bEndpointAddress, data, self.interface, timeout)
+        return self.device.write(self.bEndpointAddress, data, self.interface,
+                                 timeout, zlp)
+
+    def writev(self, buffers, timeout = None, zlp = False):
+        r"""Write a sequence of buffers to the endpoint.
+
+        For details, see the Device.writev() method.
+        """
+        return self.device.writev(self.bEndpointAddress, buffers, self.interface,
+                                  timeout, zlp)
 
     def read(self, size, timeout = None):
         r"""Read data from the endpoint.
@@ -312,6 +488,146 @@ class Endpoint(object):
         """
         return self.device.readinto(self.bEndpointAddress, buffer, self.interface, timeout)
 
+    def read_array(self, dtype, count = None, timeout = None, out = None):
+        r"""Read typed data from the endpoint.
+
+        For details, see the Device.read_array() method.
+        """
+        return self.device.read_array(self.bEndpointAddress, dtype, count,
+                                      self.interface, timeout, out)
+
+    def cancel_pending(self):
+        r"""Cancel the transfers in flight on the endpoint.
+
+        For details, see the Device.cancel_pending() method.
+        """
+        return self.device.cancel_pending(self.bEndpointAddress)
+
+    def buffered(self, transfer_size = None):
+        r"""Return a BufferedReader object reading from the endpoint.
+
+        For details, see the BufferedReader class.
+        """
+        return BufferedReader(self, transfer_size)
+
+class BufferedReader(object):
+    r"""Read ahead reader of an IN endpoint.
+
+    Devices sending small records pay the cost of a whole transfer for
+    each read() call of a few bytes. A BufferedReader object asks the
+    device for transfer_size bytes at once and serves the following
+    reads from what it got, so most of them do no I/O at all.
+
+    transfer_size is rounded up to a multiple of the endpoint
+    wMaxPacketSize, as the device may send full packets at any time. It
+    defaults to 64 packets.
+
+    The data is returned as array.array('B') objects, as the Endpoint
+    read() method does. The timeout parameter of the methods applies to
+    each transfer issued. If a transfer fails, the data read so far stays
+    in the buffer for the next call.
+
+    Do not read from the endpoint by other means while using the
+    object, as the data it holds would come out of order.
+    """
+    def __init__(self, endpoint, transfer_size = None):
+        r"""Initialize the BufferedReader object.
+
+        endpoint is the Endpoint object to read from.
+        """
+        if util.endpoint_direction(endpoint.bEndpointAddress) != util.ENDPOINT_IN:
+            raise ValueError('Not an IN endpoint')
+        size = (endpoint.wMaxPacketSize & 0x7ff) or 1
+        if transfer_size is None:
+            transfer_size = size * _DEFAULT_READ_AHEAD
+        elif transfer_size < 1:
+            raise ValueError('Invalid transfer size')
+        self.endpoint = endpoint
+        self.transfer_size = -(-transfer_size // size) * size
+        self.__buffer = _interop.as_array([0]) * self.transfer_size
+        # the unread data is self.__data[self.__pos:self.__end]
+        self.__data = self.__buffer
+        self.__pos = self.__end = 0
+        # the contents of self.__data as a string, for readline()
+        self.__str = None
+
+    def __get_available(self):
+        return self.__end - self.__pos
+
+    available = property(
+                    __get_available,
+                    doc = 'Number of bytes read from the device and not '
+                          'returned yet'
+                )
+
+    def read(self, size = -1, timeout = None):
+        r"""Read up to size bytes.
+
+        If the buffer is empty, one transfer is issued and its data is
+        returned (up to size bytes). Otherwise no I/O is done. A negative
+        size returns all the available data.
+        """
+        if self.__pos == self.__end:
+            self.__fill(timeout)
+        return self.__take(size)
+
+    def read_exact(self, size, timeout = None):
+        r"""Read exactly size bytes, issuing transfers as needed."""
+        while self.__end - self.__pos < size:
+            self.__fill(timeout)
+        return self.__take(size)
+
+    def readline(self, size = -1, delimiter = b'\n', timeout = None):
+        r"""Read up to and including the next delimiter.
+
+        If size is not negative, at most size bytes are returned, even if
+        the delimiter has not been found yet.
+        """
+        start = self.__pos
+        while True:
+            if self.__str is None:
+                self.__str = _interop._tobytes(self.__data)
+            i = self.__str.find(delimiter, start, self.__end)
+            if i >= 0:
+                n = i + len(delimiter) - self.__pos
+                if size < 0 or n <= size:
+                    return self.__take(n)
+            if size >= 0 and self.__end - self.__pos >= size:
+                return self.__take(size)
+            # the delimiter may span the data already seen and the next one
+            start = max(self.__pos, self.__end - len(delimiter) + 1)
+            start -= self.__pos
+            self.__fill(timeout)
+            start += self.__pos
+
+    def __take(self, size):
+        if size < 0 or size > self.__end - self.__pos:
+            size = self.__end - self.__pos
+        data = self.__data[self.__pos:self.__pos + size]
+        self.__pos += size
+        return data
+
+    def __fill(self, timeout):
+        if self.__pos == self.__end:
+            # empty, the transfer goes straight into the buffer
+            self.__data = self.__buffer
+            self.__pos = self.__end = 0
+            self.__str = None
+            self.__end = self.endpoint.readinto(self.__buffer, timeout)
+        else:
+            # keep the unread data apart in case the transfer fails
+            if self.__data is self.__buffer:
+                self.__data = self.__data[self.__pos:self.__end]
+            else:
+                del self.__data[:self.__pos]
+            self.__pos = 0
+            self.__end = len(self.__data)
+            self.__str = None
+            n = self.endpoint.readinto(self.__buffer, timeout)
+            self.__data.extend(self.__buffer[:n])
+            self.__end += n
+            self.__str = None
+
 class Interface(object):
     r"""Represent an interface object.
 
@@ -505,6 +821,9 @@ class Device(object):
     Timeout values for the write, read and ctrl_transfer methods are specified in
     miliseconds. If the parameter is omitted, Device.default_timeout value will
     be used instead. This property can be set by the user at anytime.
+
+    The stats attribute is None unless transfer statistics were enabled
+    with the enable_stats() method.
     """
 
     def __init__(self, dev, backend):
@@ -518,6 +837,9 @@ class Device(object):
         """
         self._ctx = _ResourceManager(dev, backend)
         self.__default_timeout = _DEFAULT_TIMEOUT
+        self.__chunk_size = _DEFAULT_CHUNK_SIZE
+        self.__chunks_in_flight = _DEFAULT_CHUNKS_IN_FLIGHT
+        self.stats = None
 
         desc = backend.get_device_descriptor(dev)
 
@@ -608,7 +930,8 @@ class Device(object):
         self._ctx.backend.reset_device(self._ctx.handle)
         self._ctx.dispose(self, True)
 
-    def write(self, endpoint, data, interface = None, timeout = None):
+    def write(self, endpoint, data, interface = None, timeout = None,
+              zlp = False):
         r"""Write data to the endpoint.
 
         This method is used to send data to the device. The endpoint parameter
@@ -619,31 +942,66 @@ class Device(object):
         set_interface_altsetting() method.
 
         The data parameter should be a sequence like type convertible to
-        array type (see array module).
+        array type (see array module). Arrays and writable buffers of bytes,
+        like bytearray objects, are sent without being copied.
 
         The timeout is specified in miliseconds.
 
+        Bulk writes larger than the chunk_size property are split in pieces
+        of chunk_size bytes, and up to chunks_in_flight pieces are queued at
+        once if the backend supports asynchronous transfers. A timeout then
+        applies to each piece.
+
+        If zlp is True and the length of the data is a multiple of the
+        endpoint wMaxPacketSize, a zero length packet follows the data, to
+        mark the end of the transfer for devices expecting it.
+
         The method returns the number of bytes written.
         """
-        backend = self._ctx.backend
-
-        fn_map = {
-                    util.ENDPOINT_TYPE_BULK:backend.bulk_write,
-                    util.ENDPOINT_TYPE_INTR:backend.intr_write,
-                    util.ENDPOINT_TYPE_ISO:backend.iso_write
-                }
-
-        intf = self._ctx.get_interface(self, interface)
-        fn = fn_map[self._ctx.get_endpoint_type(self, endpoint, intf)]
-        self._ctx.managed_claim_interface(self, intf)
-
-        return fn(
-                self._ctx.handle,
-                endpoint,
-                intf.bInterfaceNumber,
-                _interop.as_array(data),
-                self.__get_timeout(timeout)
-            )
+        intf, ep_type = self.__prepare_transfer(endpoint, interface)
+        timeout = self.__get_timeout(timeout)
+        data = _interop._byte_buffer(data)
+        written = self.__write(endpoint, interface, intf, ep_type, data, timeout)
+        if zlp and written == len(data) * data.itemsize:
+            self.__write_zlp(endpoint, interface, intf, ep_type, written, timeout)
+        return written
+
+    def writev(self, endpoint, buffers, interface = None, timeout = None,
+               zlp = False):
+        r"""Write a sequence of buffers to the endpoint.
+
+        This method sends the concatenation of the buffers in the sequence
+        as if it were passed to the write() method, without building it
+        first. The endpoint, interface, timeout and zlp parameters are the
+        same of the write() method, but the timeout applies to each transfer
+        issued.
+
+        The data goes out in one or more transfers, whose lengths are
+        multiple of the endpoint wMaxPacketSize except for the last one, so
+        the device sees the same packets it would get from write(): there
+        is no short packet before the end of the data, and a zero length
+        packet only if the sequence is empty. Small buffers are coalesced
+        in packets, and array.array('B') buffers starting on a packet
+        boundary are sent without being copied. No byte is copied more
+        than once.
+
+        The method returns the number of bytes written. It stops at the
+        first transfer writing less than its length.
+        """
+        intf, ep_type = self.__prepare_transfer(endpoint, interface)
+        timeout = self.__get_timeout(timeout)
+        # with no packet size known, the buffers go out as they are
+        size = self._ctx.get_max_packet_size(self, endpoint, interface) or 1
+        written = 0
+        for data in _writev_transfers(buffers, size):
+            length = len(data) * data.itemsize
+            ret = self.__write(endpoint, interface, intf, ep_type, data, timeout)
+            written += ret
+            if ret < length:
+                return written
+        if zlp:
+            self.__write_zlp(endpoint, interface, intf, ep_type, written, timeout)
+        return written
 
     def read(self, endpoint, size, interface = None, timeout = None):
         r"""Read data from the endpoint.
@@ -658,28 +1016,23 @@ class Device(object):
 
         The timeout is specified in miliseconds.
 
+        Bulk reads larger than the chunk_size property are split in pieces
+        of chunk_size bytes, read one after the other until one of them is
+        short (the device ended the transfer). A timeout then applies to
+        each piece.
+
         The method returns an array object with the data read.
         """
-        backend = self._ctx.backend
-
-        fn_map = {
-                    util.ENDPOINT_TYPE_BULK:backend.bulk_read,
-                    util.ENDPOINT_TYPE_INTR:backend.intr_read,
-                    util.ENDPOINT_TYPE_ISO:backend.iso_read
-                }
-
-        intf = self._ctx.get_interface(self, interface)
-        fn = fn_map[self._ctx.get_endpoint_type(self, endpoint, intf)]
-        self._ctx.managed_claim_interface(self, intf)
-
-        return fn(
-                self._ctx.handle,
-                endpoint,
-                intf.bInterfaceNumber,
-                None,
-                size,
-                self.__get_timeout(timeout)
-            )
+        intf, ep_type = self.__prepare_transfer(endpoint, interface)
+        timeout = self.__get_timeout(timeout)
+        chunk = self.__get_chunk_size(endpoint, interface, ep_type, size)
+        if chunk is None:
+            buff = _interop.as_array([0]) * size
+            ret = self.__transfer(endpoint, intf, ep_type, buff, timeout)
+            del buff[ret:]
+            return buff
+        return self.__chunked_read(endpoint, intf, ep_type, size, None,
+                                   timeout, chunk)
 
     def readinto(self, endpoint, buffer, interface = None, timeout = None):
         r"""Read data from the endpoint into a specified buffer.
@@ -694,31 +1047,92 @@ class Device(object):
         as explained in the set_interface_altsetting() method. The sizek
         parameters tells how many bytes you want to read.
 
-        The timeout is specified in miliseconds.
+        The timeout is specified in miliseconds. Large reads are split as
+        explained in the read() method.
 
         The method returns the number of bytes actually read.
         """
-        backend = self._ctx.backend
-
-        fn_map = {
-                    util.ENDPOINT_TYPE_BULK:backend.bulk_read,
-                    util.ENDPOINT_TYPE_INTR:backend.intr_read,
-                    util.ENDPOINT_TYPE_ISO:backend.iso_read,
-                }
-
-        intf = self._ctx.get_interface(self, interface)
-        fn = fn_map[self._ctx.get_endpoint_type(self, endpoint, intf)]
-        self._ctx.managed_claim_interface(self, intf)
-
-        return fn(
-                self._ctx.handle,
-                endpoint,
-                intf.bInterfaceNumber,
-                buffer,
-                len(buffer),
-                self.__get_timeout(timeout)
-            )
-
+        intf, ep_type = self.__prepare_transfer(endpoint, interface)
+        timeout = self.__get_timeout(timeout)
+        chunk = self.__get_chunk_size(endpoint, interface, ep_type, len(buffer))
+        if chunk is None or getattr(buffer, 'typecode', 'B') != 'B' or \
+                getattr(buffer, 'itemsize', 1) != 1:
+            return self.__transfer(endpoint, intf, ep_type, buffer, timeout)
+        return self.__chunked_read(endpoint, intf, ep_type, len(buffer), buffer,
+                                   timeout, chunk)
+
+    def read_array(self, endpoint, dtype, count = None, interface = None,
+                   timeout = None, out = None):
+        r"""Read typed data from the endpoint.
+
+        The data is read in place into an array of count items of dtype.
+        dtype is either an array module typecode ('h', 'i', ...), giving an
+        array.array, or anything numpy.dtype() accepts ('<i2', numpy.int32,
+        ...), giving a numpy array; NumPy is only imported in this case.
+        The USB data is taken as little endian for array.array objects (the
+        items are swapped on big endian hosts), and as dtype says for numpy
+        arrays.
+
+        If out is given, it is the destination array (an array.array or a
+        contiguous numpy array), dtype is ignored and count defaults to
+        len(out). The method then returns the number of items read.
+        Otherwise, it returns a new array with the items read.
+
+        In both cases, less than count items means the device ended the
+        transfer early. A trailing partial item is not counted. The
+        endpoint, interface and timeout parameters are the same of the
+        read() method.
+        """
+        if out is None:
+            if count is None:
+                raise ValueError('Either count or out must be given')
+            dest = _new_array(dtype, count)
+        else:
+            dest = out
+            if count is None:
+                count = len(out)
+            elif count > len(out):
+                raise ValueError('count is larger than the destination')
+        itemsize = dest.itemsize
+        try:
+            buff = memoryview(dest).cast('B')[:count * itemsize]
+        except (NameError, AttributeError):
+            buff = dest
+        except TypeError:
+            raise ValueError('The destination must be contiguous')
+        n = self.readinto(endpoint, buff, interface, timeout) // itemsize
+        del buff
+        if isinstance(dest, array.array) and itemsize > 1 and \
+                sys.byteorder == 'big':
+            if n == len(dest):
+                dest.byteswap()
+            else:
+                items = dest[:n]
+                items.byteswap()
+                dest[:n] = items
+        if out is not None:
+            return n
+        if isinstance(dest, array.array):
+            del dest[n:]
+            return dest
+        return dest[:n]
+
+    def cancel_pending(self, endpoint = None):
+        r"""Cancel the transfers in flight on the endpoint.
+
+        This method is meant to be called from another thread to stop the
+        threads blocked in the write(), read() and readinto() methods.
+        The endpoint parameter is the bEndpointAddress field of the endpoint.
+        If you do not provide one, the transfers of all endpoints are
+        cancelled. The blocked threads get the USBTransferCancelled exception.
+
+        Only transfers already in flight are affected. Cancellation requires
+        a backend supporting asynchronous transfers (see the
+        IBackend.submit_transfer() method), otherwise this method does nothing.
+
+        The method returns the number of transfers cancelled.
+        """
+        return self._ctx.cancel_pending(endpoint)
 
 
     def ctrl_transfer(self, bmRequestType, bRequest, wValue=0, wIndex=0,
@@ -744,22 +1158,61 @@ class Device(object):
         """
         if util.ctrl_direction(bmRequestType) == util.CTRL_OUT:
             a = _interop.as_array(data_or_wLength)
+            requested = len(a) * a.itemsize
         elif data_or_wLength is None:
-            a = 0
+            a = requested = 0
         else:
-            a = data_or_wLength
+            a = requested = data_or_wLength
 
         self._ctx.managed_open()
 
-        return self._ctx.backend.ctrl_transfer(
-                                    self._ctx.handle,
+        backend = self._ctx.backend
+        timeout = self.__get_timeout(timeout)
+
+        if self.stats is None and not _transfer_hooks and _capture is None:
+            return backend.ctrl_transfer(self._ctx.handle,
+                                         bmRequestType,
+                                         bRequest,
+                                         wValue,
+                                         wIndex,
+                                         a,
+                                         timeout)
+
+        return self.__instrumented(backend.ctrl_transfer,
+                                   (self._ctx.handle,
                                     bmRequestType,
                                     bRequest,
                                     wValue,
                                     wIndex,
                                     a,
-                                    self.__get_timeout(timeout)
-                                )
+                                    timeout),
+                                   0,
+                                   util.ENDPOINT_TYPE_CTRL,
+                                   util.ctrl_direction(bmRequestType),
+                                   requested,
+                                   timeout,
+                                   a,
+                                   (bmRequestType,
+                                    bRequest,
+                                    wValue,
+                                    wIndex,
+                                    requested))
+
+    def enable_stats(self, enable = True):
+        r"""Enable or disable the collection of transfer statistics.
+
+        When enabled, the stats attribute is a DeviceStats object (see the
+        usb._stats module) which counts, per endpoint, the transfers, bytes,
+        short transfers, timeouts, errors and retries of the write(), read(),
+        readinto() and ctrl_transfer() methods and of the stream readers
+        (see add_transfer_hook()), along with a latency histogram. Enabling statistics which are already enabled keeps the
+        current values; call stats.reset() to zero them. When disabled, the
+        stats attribute is None.
+        """
+        if not enable:
+            self.stats = None
+        elif self.stats is None:
+            self.stats = _stats.DeviceStats()
 
     def is_kernel_driver_active(self, interface):
         r"""Determine if there is kernel driver associated with the interface.
@@ -798,6 +1251,230 @@ class Device(object):
     def __del__(self):
         self._ctx.dispose(self)
 
+    def __prepare_transfer(self, endpoint, interface):
+        return self._ctx.prepare_transfer(self, endpoint, interface)
+
+    # all bulk, interrupt and isochronous I/O goes through here. The data
+    # parameter is the payload for OUT endpoints and the buffer to fill
+    # for IN endpoints. Return the number of bytes transferred.
+    def __transfer(self, endpoint, intf, ep_type, data, timeout):
+        if self.stats is None and not _transfer_hooks and _capture is None:
+            return self.__backend_transfer(endpoint, intf, ep_type, data, timeout)
+        return self.__instrumented(self.__backend_transfer,
+                                   (endpoint, intf, ep_type, data, timeout),
+                                   endpoint,
+                                   ep_type,
+                                   util.endpoint_direction(endpoint),
+                                   len(data) * data.itemsize,
+                                   timeout,
+                                   data)
+
+    # run a transfer function updating the statistics, calling the hooks
+    # and feeding the capture. data is the transfer buffer, or None for
+    # control transfers without one, and setup is the control request.
+    def __instrumented(self, fn, args, endpoint, ep_type, direction, length,
+                       timeout, data, setup = None):
+        probe = _TransferProbe(self, endpoint, ep_type, direction, length,
+                               timeout, data, setup, _interop._perf_counter())
+        try:
+            ret = fn(*args)
+        except USBError:
+            probe.failed(sys.exc_info()[1])
+            raise
+        probe.completed(ret)
+        return ret
+
+    # Asynchronous transfers for the stream readers (usb.capture, usb.shm,
+    # usb.select), seen by the statistics, hooks and capture like the
+    # synchronous ones. _submit() returns the handle to give to _wait() and
+    # _cancel(). It raises NotImplementedError if the backend lacks them.
+    def _submit(self, endpoint, intf, ep_type, data, timeout, callback = None):
+        start = _interop._perf_counter()
+        try:
+            transfer = self._ctx.managed_submit(endpoint, intf, ep_type, data,
+                                                timeout, callback)
+        except USBError:
+            probe = self.__probe(endpoint, ep_type, data, timeout, start)
+            if probe is not None:
+                probe.failed(sys.exc_info()[1])
+            raise
+        # the probe starts once the backend took the transfer, not to
+        # report the ones it cannot submit
+        return _AsyncTransfer(transfer, endpoint,
+                              self.__probe(endpoint, ep_type, data, timeout,
+                                           start))
+
+    def _wait(self, handle):
+        probe = handle.probe
+        try:
+            ret = self._ctx.managed_wait(handle.endpoint, handle.transfer)
+        except USBError:
+            if probe is not None:
+                probe.failed(sys.exc_info()[1])
+            raise
+        if probe is not None:
+            probe.completed(ret)
+        return ret
+
+    def _cancel(self, handle):
+        self._ctx.backend.cancel_transfer(handle.transfer)
+
+    def __probe(self, endpoint, ep_type, data, timeout, start):
+        if self.stats is None and not _transfer_hooks and _capture is None:
+            return None
+        return _TransferProbe(self, endpoint, ep_type,
+                              util.endpoint_direction(endpoint),
+                              len(data) * data.itemsize, timeout, data, None,
+                              start)
+
+    def __backend_transfer(self, endpoint, intf, ep_type, data, timeout):
+        if self._ctx.async_transfers and \
+                (ep_type == util.ENDPOINT_TYPE_BULK or \
+                 ep_type == util.ENDPOINT_TYPE_INTR):
+            try:
+                return self._ctx.managed_transfer(endpoint,
+                                                  intf,
+                                                  ep_type,
+                                                  data,
+                                                  timeout)
+            except NotImplementedError:
+                self._ctx.async_transfers = False
+
+        backend = self._ctx.backend
+
+        if util.endpoint_direction(endpoint) == util.ENDPOINT_OUT:
+            fn_map = {
+                        util.ENDPOINT_TYPE_BULK:backend.bulk_write,
+                        util.ENDPOINT_TYPE_INTR:backend.intr_write,
+                        util.ENDPOINT_TYPE_ISO:backend.iso_write
+                    }
+            return fn_map[ep_type](self._ctx.handle, endpoint, intf, data, timeout)
+        else:
+            fn_map = {
+                        util.ENDPOINT_TYPE_BULK:backend.bulk_read,
+                        util.ENDPOINT_TYPE_INTR:backend.intr_read,
+                        util.ENDPOINT_TYPE_ISO:backend.iso_read
+                    }
+            return fn_map[ep_type](self._ctx.handle,
+                                   endpoint,
+                                   intf,
+                                   data,
+                                   len(data),
+                                   timeout)
+
+    # the size of the pieces of a bulk transfer of length bytes, or None
+    # if it must not be split
+    def __get_chunk_size(self, endpoint, interface, ep_type, length):
+        if not self.__chunk_size or length <= self.__chunk_size or \
+                ep_type != util.ENDPOINT_TYPE_BULK:
+            return None
+        size = self._ctx.get_max_packet_size(self, endpoint, interface)
+        if not size:
+            return self.__chunk_size
+        return max(size, self.__chunk_size - self.__chunk_size % size)
+
+    def __write(self, endpoint, interface, intf, ep_type, data, timeout):
+        length = len(data) * data.itemsize
+        chunk = self.__get_chunk_size(endpoint, interface, ep_type, length)
+        if chunk is None:
+            return self.__transfer(endpoint, intf, ep_type, data, timeout)
+        if data.itemsize != 1:
+            data = _interop.as_array(_interop._tobytes(data))
+        # queued pieces cannot be seen by the statistics and hooks
+        if self.__chunks_in_flight > 1 and self._ctx.async_transfers and \
+                self.stats is None and not _transfer_hooks and _capture is None:
+            try:
+                return self.__pipelined_write(endpoint, intf, ep_type, data,
+                                              timeout, chunk)
+            except NotImplementedError:
+                self._ctx.async_transfers = False
+        written = 0
+        for offset in range(0, length, chunk):
+            piece = data[offset:offset + chunk]
+            ret = self.__transfer(endpoint, intf, ep_type, piece, timeout)
+            written += ret
+            if ret < len(piece):
+                break
+        return written
+
+    def __pipelined_write(self, endpoint, intf, ep_type, data, timeout, chunk):
+        ctx = self._ctx
+        length = len(data)
+        queued = []
+        offset = written = 0
+        error = None
+        done = False
+        while queued or (offset < length and not done):
+            while not done and offset < length and \
+                    len(queued) < self.__chunks_in_flight:
+                piece = data[offset:offset + chunk]
+                try:
+                    t = ctx.managed_submit(endpoint, intf, ep_type, piece, timeout)
+                except USBError:
+                    error = sys.exc_info()[1]
+                    done = True
+                    break
+                queued.append((t, len(piece)))
+                offset += len(piece)
+            if not queued:
+                break
+            t, n = queued.pop(0)
+            try:
+                ret = ctx.managed_wait(endpoint, t)
+            except USBError:
+                ret = None
+                if not done:
+                    error = sys.exc_info()[1]
+            if not done:
+                if ret is not None:
+                    written += ret
+                if ret is None or ret < n:
+                    # drop the pieces after a failed or short one
+                    done = True
+                    for t, n in queued:
+                        ctx.backend.cancel_transfer(t)
+        # as the backends do, a timeout is not an error if data was sent
+        if error is not None and \
+                not (written and error.errno == errno.ETIMEDOUT):
+            raise error
+        return written
+
+    def __chunked_read(self, endpoint, intf, ep_type, size, buffer, timeout,
+                       chunk):
+        if buffer is None:
+            result = _interop.as_array([0]) * size
+        else:
+            result = buffer
+        read = 0
+        while read < size:
+            # the pieces are read in place through views of the result
+            piece = _interop._slice(result, read, read + chunk)
+            length = len(piece)
+            ret = 0
+            try:
+                ret = self.__transfer(endpoint, intf, ep_type, piece, timeout)
+            except USBError:
+                # keep what was read before a timeout
+                if read and sys.exc_info()[1].errno == errno.ETIMEDOUT:
+                    break
+                raise
+            finally:
+                # the array cannot be resized while exported
+                _interop._release(piece, result, read, ret)
+                piece = None
+            read += ret
+            if ret < length:
+                break
+        if buffer is None:
+            del result[read:]
+            return result
+        return read
+
+    def __write_zlp(self, endpoint, interface, intf, ep_type, length, timeout):
+        size = self._ctx.get_max_packet_size(self, endpoint, interface)
+        if length and size and length % size == 0:
+            self.__transfer(endpoint, intf, ep_type, _interop.as_array(), timeout)
+
     def __get_timeout(self, timeout):
         if timeout is not None:
             return timeout
@@ -817,6 +1494,275 @@ class Device(object):
                         doc = 'Default timeout for transfer I/O functions'
                     )
 
+    def __set_chunk_size(self, size):
+        if size is not None and size < 0:
+            raise ValueError('Chunk size cannot be a negative value')
+        self.__chunk_size = size
+
+    def __get_chunk_size_prop(self):
+        return self.__chunk_size
+
+    chunk_size = property(
+                    __get_chunk_size_prop,
+                    __set_chunk_size,
+                    doc = 'Size of the pieces of large bulk transfers, rounded '
+                          'down to a multiple of wMaxPacketSize (None or 0 '
+                          'disables the splitting)'
+                )
+
+    def __set_chunks_in_flight(self, count):
+        if count < 1:
+            raise ValueError('At least one chunk must be in flight')
+        self.__chunks_in_flight = count
+
+    def __get_chunks_in_flight(self):
+        return self.__chunks_in_flight
+
+    chunks_in_flight = property(
+                        __get_chunks_in_flight,
+                        __set_chunks_in_flight,
+                        doc = 'Maximum number of pieces of a large bulk write '
+                              'queued at once'
+                    )
+
+# a new array of count items for Device.read_array()
+def _new_array(dtype, count):
+    if isinstance(dtype, str) and len(dtype) == 1 and dtype in array.typecodes:
+        return array.array(dtype, [0]) * count
+    import numpy
+    return numpy.empty(count, dtype)
+
+# split the data of the buffers in transfers whose lengths are multiple of
+# size, except for the last one
+def _writev_transfers(buffers, size):
+    arrays = []
+    for b in buffers:
+        if not (isinstance(b, array.array) and b.typecode == 'B'):
+            b = _interop.as_array(b)
+        if len(b):
+            arrays.append(b)
+    if not arrays:
+        # a zero length packet, as write() would send
+        yield _interop.as_array()
+        return
+    last = len(arrays) - 1
+    pending = _interop.as_array()
+    for i, a in enumerate(arrays):
+        if len(a) < size:
+            pending.extend(a)
+            continue
+        offset = 0
+        if len(pending):
+            # complete the packet with the head of the buffer
+            offset = (size - len(pending) % size) % size
+            pending.extend(a[:offset])
+            yield pending
+            pending = _interop.as_array()
+        if offset == 0 and (i == last or len(a) % size == 0):
+            yield a
+            continue
+        end = len(a) - (len(a) - offset) % size
+        if i == last:
+            end = len(a)
+        if end > offset:
+            # a view, not to copy the bulk of the buffer
+            yield _interop._slice(a, offset, end)
+        pending = a[end:]
+    if len(pending):
+        yield pending
+
+# Read an IN endpoint continuously, with up to transfers transfers in flight
+# if the backend supports asynchronous transfers. fill(pending) returns the
+# (key, buffer) pair of the next transfer, or None not to queue one now,
+# pending being the number of transfers in flight. done(key, buffer, n) gets
+# the transfers in order and returns False to stop, as does stopped().
+def _read_stream(endpoint, transfers, timeout, stopped, fill, done):
+    device = endpoint.device
+    address = endpoint.bEndpointAddress
+    intf, ep_type = device._ctx.prepare_transfer(device, address,
+                                                 endpoint.interface)
+    asynchronous = device._ctx.async_transfers
+    # transfer (None if synchronous), key and buffer
+    queued = []
+    try:
+        while not stopped():
+            limit = asynchronous and transfers or 1
+            while len(queued) < limit:
+                item = fill(len(queued))
+                if item is None:
+                    break
+                key, buff = item
+                t = None
+                if asynchronous:
+                    try:
+                        t = device._submit(address, intf, ep_type, buff, timeout)
+                    except NotImplementedError:
+                        # read synchronously once the others completed
+                        asynchronous = False
+                        limit = 1
+                queued.append((t, key, buff))
+                # stopped() may have been set after the last cancellation
+                if stopped():
+                    return
+            if not queued:
+                break
+            t, key, buff = queued.pop(0)
+            if t is None:
+                n = device.readinto(address, buff, endpoint.interface, timeout)
+            else:
+                n = device._wait(t)
+            if not done(key, buff, n):
+                break
+    finally:
+        for t, key, buff in queued:
+            if t is not None:
+                device._cancel(t)
+        for t, key, buff in queued:
+            if t is not None:
+                try:
+                    device._wait(t)
+                except USBError:
+                    pass
+
+# an asynchronous transfer submitted through Device._submit()
+class _AsyncTransfer(object):
+    __slots__ = ('transfer', 'endpoint', 'probe')
+
+    def __init__(self, transfer, endpoint, probe):
+        self.transfer = transfer
+        self.endpoint = endpoint
+        self.probe = probe
+
+# Update the statistics, call the hooks and feed the capture for a transfer
+# started at start. The pre hooks are called and the submission captured
+# on creation, and failed() or completed() ends the transfer.
+class _TransferProbe(object):
+    def __init__(self, device, endpoint, ep_type, direction, length, timeout,
+                 data, setup, start):
+        self.device = device
+        self.endpoint = endpoint
+        self.ep_type = ep_type
+        self.direction = direction
+        self.length = length
+        self.timeout = timeout
+        self.data = data
+        self.start = start
+        self.stats = device.stats
+        self.hooks = _transfer_hooks
+        self.capture = _capture
+        for pre, post in self.hooks:
+            if pre is not None:
+                _call_hook(pre, device, endpoint, direction, length, timeout,
+                           start)
+        if self.capture is not None:
+            if direction == util.ENDPOINT_OUT:
+                payload = data
+            else:
+                payload = None
+            self.urb_id = self.capture.submit(device, endpoint, ep_type,
+                                              direction, length, setup,
+                                              payload)
+
+    def failed(self, exc):
+        end = _interop._perf_counter()
+        if self.stats is not None:
+            self.stats.record_error(self.endpoint, self.ep_type, exc,
+                                    end - self.start)
+        if self.capture is not None:
+            self.capture.complete(self.urb_id, self.device, self.endpoint,
+                                  self.ep_type, self.direction, exc, None)
+        self.__post(end, exc)
+
+    def completed(self, ret):
+        end = _interop._perf_counter()
+        # IN control transfers return the data read
+        if hasattr(ret, 'itemsize'):
+            transferred = len(ret) * ret.itemsize
+        else:
+            transferred = ret
+        if self.stats is not None:
+            self.stats.record(self.endpoint, self.ep_type, self.length,
+                              transferred, end - self.start)
+        if self.capture is not None:
+            if self.direction == util.ENDPOINT_IN:
+                if hasattr(ret, 'itemsize'):
+                    payload = ret
+                else:
+                    payload = self.data
+            else:
+                payload = None
+            self.capture.complete(self.urb_id, self.device, self.endpoint,
+                                  self.ep_type, self.direction, transferred,
+                                  payload)
+        self.__post(end, transferred)
+
+    def __post(self, end, result):
+        for pre, post in self.hooks:
+            if post is not None:
+                _call_hook(post, self.device, self.endpoint, self.direction,
+                           self.length, self.timeout, self.start, end, result)
+
+def _call_hook(hook, *args):
+    # a broken hook must not break the I/O
+    try:
+        hook(*args)
+    except Exception:
+        _logger.error('Transfer hook %r failed', hook, exc_info=True)
+
+def add_transfer_hook(pre = None, post = None):
+    r"""Register functions called around every transfer.
+
+    The hooks are called for every transfer issued by the write(), read(),
+    readinto() and ctrl_transfer() methods of any Device object, and by the
+    stream readers of usb.capture.to_mmap(), usb.shm.feed() and
+    usb.select.Selector. pre is called right before the backend is invoked
+    (after the submission, for the asynchronous transfers of the stream
+    readers) as:
+
+    pre(device, endpoint, direction, length, timeout, start)
+
+    and post is called right after the backend returns as:
+
+    post(device, endpoint, direction, length, timeout, start, end, result)
+
+    device is the Device object, endpoint is the endpoint address (0 for
+    control transfers), direction is either usb.util.ENDPOINT_IN or
+    usb.util.ENDPOINT_OUT, length is the number of bytes requested and
+    timeout is the timeout in miliseconds. start and end are timestamps in
+    seconds from a monotonic clock. result is the number of bytes
+    transferred, or the USBError exception raised by the transfer (which is
+    reraised after the hooks return). Either pre or post may be None.
+
+    Hooks run in the thread doing the transfer and should return quickly.
+    A transfer is only seen by the hooks registered when it started.
+    Exceptions raised by hooks are logged and ignored. When no hooks are
+    registered the transfers pay nothing for this feature.
+
+    The function returns a handle to pass to remove_transfer_hook().
+    """
+    global _transfer_hooks
+    hook = (pre, post)
+    _transfer_hooks_lock.acquire()
+    try:
+        _transfer_hooks = _transfer_hooks + (hook,)
+    finally:
+        _transfer_hooks_lock.release()
+    return hook
+
+def remove_transfer_hook(handle):
+    r"""Unregister the hooks added by add_transfer_hook().
+
+    handle is the value returned by add_transfer_hook().
+    """
+    global _transfer_hooks
+    _transfer_hooks_lock.acquire()
+    try:
+        hooks = list(_transfer_hooks)
+        hooks.remove(handle)
+        _transfer_hooks = tuple(hooks)
+    finally:
+        _transfer_hooks_lock.release()
+
 def find(find_all=False, backend = None, custom_match = None, **args):
     r"""Find an USB device and return it.
 
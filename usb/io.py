@@ -0,0 +1,112 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+r"""usb.io - File objects over endpoints.
+
+This module exports:
+
+EndpointIO - raw binary stream reading from and writing to endpoints.
+
+EndpointIO is a io.RawIOBase subclass, so the standard library buffering
+classes work on top of it, and through them anything expecting a file
+object (shutil.copyfileobj(), compression streams, and so on):
+
+>>> import io, usb.io
+>>> f = io.BufferedReader(usb.io.EndpointIO(ep_in), 16384)
+>>> header = f.read(16)
+"""
+
+from __future__ import absolute_import
+
+__author__ = 'Wander Lairson Costa'
+
+__all__ = ['EndpointIO']
+
+import io
+import usb.util as util
+import usb._interop as _interop
+
+class EndpointIO(io.RawIOBase):
+    r"""Raw binary stream over an IN and an OUT endpoint.
+
+    ep_in and ep_out are the usb.core.Endpoint objects to read from and to
+    write to. The stream is readable if ep_in is given, and writable if
+    ep_out is given. timeout is the time limit of each transfer, in
+    miliseconds, and defaults to the device default_timeout property.
+
+    readinto() issues a single transfer, whose length is rounded down to a
+    multiple of the endpoint wMaxPacketSize, so the device never sends more
+    than it asks for. The transfers read into and write from the caller's
+    buffers, without copying them. Use a buffer size multiple of wMaxPacketSize with the
+    buffering classes. A zero length packet reads as end of file.
+
+    Closing the stream does not release the device.
+    """
+    def __init__(self, ep_in = None, ep_out = None, timeout = None):
+        io.RawIOBase.__init__(self)
+        if ep_in is None and ep_out is None:
+            raise ValueError('No endpoint given')
+        if ep_in is not None and \
+                util.endpoint_direction(ep_in.bEndpointAddress) != util.ENDPOINT_IN:
+            raise ValueError('ep_in is not an IN endpoint')
+        if ep_out is not None and \
+                util.endpoint_direction(ep_out.bEndpointAddress) != util.ENDPOINT_OUT:
+            raise ValueError('ep_out is not an OUT endpoint')
+        self.ep_in = ep_in
+        self.ep_out = ep_out
+        self.timeout = timeout
+
+    def readable(self):
+        return self.ep_in is not None
+
+    def writable(self):
+        return self.ep_out is not None
+
+    def readinto(self, b):
+        self.__check(self.ep_in, 'read')
+        m = memoryview(b)
+        size = len(m) * m.itemsize
+        packet = self.ep_in.wMaxPacketSize & 0x7ff
+        if packet and size >= packet:
+            size -= size % packet
+        if hasattr(m, 'cast'):
+            # the transfer goes straight into the caller's buffer
+            return self.ep_in.readinto(m.cast('B')[:size], self.timeout)
+        data = self.ep_in.read(size, self.timeout)
+        m[:len(data)] = _interop._tobytes(data)
+        return len(data)
+
+    def write(self, b):
+        self.__check(self.ep_out, 'write')
+        return self.ep_out.write(b, self.timeout)
+
+    def __check(self, ep, operation):
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+        if ep is None:
+            raise io.UnsupportedOperation(operation)
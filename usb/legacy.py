@@ -110,7 +110,15 @@ class Interface(object):
         self.interfaceClass = intf.bInterfaceClass
         self.interfaceSubClass = intf.bInterfaceSubClass
         self.interfaceProtocol = intf.bInterfaceProtocol
-        self.endpoints = [Endpoint(e) for e in intf]
+        self.__intf = intf
+        self.__endpoints = None
+
+    def __get_endpoints(self):
+        if self.__endpoints is None:
+            self.__endpoints = [Endpoint(e) for e in self.__intf]
+        return self.__endpoints
+
+    endpoints = property(__get_endpoints, doc = 'List of Endpoint objects')
 
 class Configuration(object):
     r"""Configuration descriptor object."""
@@ -121,14 +129,23 @@ class Configuration(object):
         self.selfPowered = (cfg.bmAttributes >> 6) & 1
         self.totalLength = cfg.wTotalLength
         self.value = cfg.bConfigurationValue
-        self.interfaces = [
-                            list(g) for k, g in _interop._groupby(
-                                    _interop._sorted(
-                                        [Interface(i) for i in cfg],
-                                        key=lambda i: i.interfaceNumber
-                                    ),
-                                    lambda i: i.alternateSetting)
-                        ]
+        self.__cfg = cfg
+        self.__interfaces = None
+
+    def __get_interfaces(self):
+        # the interface descriptors are read on first access only
+        if self.__interfaces is None:
+            self.__interfaces = [
+                                list(g) for k, g in _interop._groupby(
+                                        _interop._sorted(
+                                            [Interface(i) for i in self.__cfg],
+                                            key=lambda i: i.interfaceNumber
+                                        ),
+                                        lambda i: i.alternateSetting)
+                            ]
+        return self.__interfaces
+
+    interfaces = property(__get_interfaces, doc = 'List of Interface lists')
 
 class DeviceHandle(object):
     def __init__(self, dev):
@@ -181,6 +198,35 @@ class DeviceHandle(object):
         """
         return self.dev.read(endpoint, size, self.__claimed_interface, timeout)
 
+    def bulkReadInto(self, endpoint, buffer, timeout = 100):
+        r"""Performs a bulk read request into a buffer.
+
+            Unlike bulkRead, the data is written into the buffer, so no
+            new object is created for each transfer.
+
+            Arguments:
+                endpoint: endpoint number.
+                buffer: array object receiving the data. Its length is
+                        the number of bytes to read.
+                timeout: operation timeout in miliseconds. (default: 100)
+                         None means the device default timeout.
+            Return the number of bytes read.
+        """
+        return self.dev.readinto(endpoint, buffer, self.__claimed_interface, timeout)
+
+    def interruptReadInto(self, endpoint, buffer, timeout = 100):
+        r"""Performs a interrupt read request into a buffer.
+
+            Arguments:
+                endpoint: endpoint number.
+                buffer: array object receiving the data. Its length is
+                        the number of bytes to read.
+                timeout: operation timeout in miliseconds. (default: 100)
+                         None means the device default timeout.
+            Return the number of bytes read.
+        """
+        return self.dev.readinto(endpoint, buffer, self.__claimed_interface, timeout)
+
     def controlMsg(self, requestType, request, buffer, value = 0, index = 0, timeout = 100):
         r"""Perform a control request to the default control pipe on a device.
 
@@ -321,8 +367,20 @@ class Device(object):
                          '.' + \
                          str((dev.bcdUSB >> 4) & 0xf) + \
                          str(dev.bcdUSB & 0xf)
-        self.configurations = [Configuration(c) for c in dev]
         self.dev = dev
+        self.__configurations = None
+        if dev.address is not None:
+            self.devnum = dev.address
+            self.filename = '%03d' % dev.address
+
+    def __get_configurations(self):
+        # the configuration descriptors are read on first access only
+        if self.__configurations is None:
+            self.__configurations = [Configuration(c) for c in self.dev]
+        return self.__configurations
+
+    configurations = property(__get_configurations,
+                              doc = 'List of Configuration objects')
 
     def open(self):
         r"""Open the device for use.
@@ -333,12 +391,30 @@ class Device(object):
 
 class Bus(object):
     r"""Bus object."""
-    def __init__(self):
-        self.dirname = ''
-        self.location = 0
-        self.devices = [Device(d) for d in core.find(find_all=True)]
+    def __init__(self, location = 0, devices = None):
+        if location:
+            self.dirname = '%03d' % location
+        else:
+            self.dirname = ''
+        self.location = location
+        if devices is None:
+            devices = [Device(d) for d in core.find(find_all=True)]
+        self.devices = devices
 
 def busses():
-    r"""Return a tuple with the usb busses."""
-    return (Bus(),)
-
+    r"""Return a tuple with the usb busses.
+
+    The devices are grouped by the bus number reported by the backend, in
+    the order the backend enumerates them. Devices for which the backend
+    does not know the bus number go to a bus with location 0.
+    """
+    busses = []
+    by_location = {}
+    for d in core.find(find_all=True):
+        location = d.bus or 0
+        bus = by_location.get(location)
+        if bus is None:
+            bus = by_location[location] = Bus(location, [])
+            busses.append(bus)
+        bus.devices.append(Device(d))
+    return tuple(busses)
@@ -0,0 +1,310 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+r"""usb.metrics - Transfer metrics in the Prometheus text format.
+
+This module exports:
+
+enable() - start collecting metrics.
+disable() - stop collecting metrics.
+reset() - zero the collected metrics.
+render() - return the metrics in the Prometheus text exposition format.
+serve() - serve the metrics through HTTP.
+
+Once enabled, the transfers done by any usb.core.Device object are
+accounted per device and endpoint:
+
+usb_transfers_total - number of transfers.
+usb_transfer_bytes_total - number of bytes transferred.
+usb_transfer_errors_total - number of failed transfers, by errno.
+usb_transfer_timeouts_total - number of transfers which timed out.
+usb_transfer_duration_seconds - histogram of the transfer durations.
+
+Besides these, render() reports the current number of open device handles
+(usb_open_handles) and of interfaces claimed by each open device
+(usb_claimed_interfaces). Devices are identified by the bus, address,
+vendor and product labels, and endpoints by their address (control
+transfers are accounted to the endpoint 0x00).
+
+The metrics are collected through a usb.core transfer hook, so nothing is
+paid while they are disabled. serve() runs a small HTTP server in a
+background thread, using only the standard library, which Prometheus can
+scrape directly:
+
+>>> import usb.metrics
+>>> usb.metrics.enable()
+>>> server = usb.metrics.serve(9110)
+"""
+
+__author__ = 'Wander Lairson Costa'
+
+__all__ = ['enable', 'disable', 'reset', 'render', 'serve', 'CONTENT_TYPE']
+
+import bisect
+import errno
+import threading
+import usb.core as core
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# upper bounds of the latency histogram buckets, in seconds
+_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+            0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_ETIMEDOUT = errno.__dict__.get('ETIMEDOUT', None)
+
+class _EndpointMetrics(object):
+    __slots__ = ('transfers', 'bytes', 'timeouts', 'errors', 'buckets',
+                 'duration')
+
+    def __init__(self):
+        self.transfers = 0
+        self.bytes = 0
+        self.timeouts = 0
+        # failed transfers by errno
+        self.errors = {}
+        # one bucket per bound plus +Inf, not cumulative
+        self.buckets = [0] * (len(_BUCKETS) + 1)
+        self.duration = 0.0
+
+_lock = threading.Lock()
+# _EndpointMetrics objects by (device labels, endpoint address)
+_metrics = {}
+_hook = None
+
+def _device_labels(bus, address, idVendor, idProduct):
+    return (('bus', str(bus)),
+            ('address', str(address)),
+            ('vendor', '%04x' % idVendor),
+            ('product', '%04x' % idProduct))
+
+def _post(device, endpoint, direction, length, timeout, start, end, result):
+    key = (_device_labels(device.bus,
+                          device.address,
+                          device.idVendor,
+                          device.idProduct),
+           endpoint)
+    elapsed = end - start
+    _lock.acquire()
+    try:
+        m = _metrics.get(key)
+        if m is None:
+            m = _metrics[key] = _EndpointMetrics()
+        m.transfers += 1
+        m.duration += elapsed
+        m.buckets[bisect.bisect_left(_BUCKETS, elapsed)] += 1
+        if isinstance(result, core.USBError):
+            err = result.errno
+            m.errors[err] = m.errors.get(err, 0) + 1
+            if err is not None and err == _ETIMEDOUT:
+                m.timeouts += 1
+        else:
+            m.bytes += result
+    finally:
+        _lock.release()
+
+def enable():
+    r"""Start collecting the transfer metrics.
+
+    Enabling the metrics collection when it is already enabled has no
+    effect.
+    """
+    global _hook
+    _lock.acquire()
+    try:
+        if _hook is None:
+            _hook = core.add_transfer_hook(post = _post)
+    finally:
+        _lock.release()
+
+def disable():
+    r"""Stop collecting the transfer metrics.
+
+    The metrics collected so far are kept.
+    """
+    global _hook
+    _lock.acquire()
+    try:
+        if _hook is not None:
+            core.remove_transfer_hook(_hook)
+            _hook = None
+    finally:
+        _lock.release()
+
+def reset():
+    r"""Forget the metrics collected so far."""
+    _lock.acquire()
+    try:
+        _metrics.clear()
+    finally:
+        _lock.release()
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(['%s="%s"' % (k, _escape(v)) for k, v in labels]) + '}'
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def _errno_name(err):
+    if err is None:
+        return 'unknown'
+    return errno.errorcode.get(err, str(err))
+
+def _open_devices():
+    devices = []
+    for ctx in list(core._open_resources):
+        try:
+            desc = ctx.backend.get_device_descriptor(ctx.dev)
+        except core.USBError:
+            continue
+        devices.append((_device_labels(desc.bus,
+                                       desc.address,
+                                       desc.idVendor,
+                                       desc.idProduct),
+                        len(ctx._claimed_intf)))
+    devices.sort()
+    return devices
+
+def render():
+    r"""Return the current metrics in the Prometheus text format."""
+    _lock.acquire()
+    try:
+        items = []
+        for key in sorted(_metrics.keys()):
+            m = _metrics[key]
+            items.append((key[0] + (('endpoint', '0x%02x' % key[1]),),
+                          m.transfers,
+                          m.bytes,
+                          m.timeouts,
+                          sorted(m.errors.items(),
+                                 key = lambda e: _errno_name(e[0])),
+                          list(m.buckets),
+                          m.duration))
+    finally:
+        _lock.release()
+
+    lines = []
+    def family(name, kind, help):
+        lines.append('# HELP %s %s' % (name, help))
+        lines.append('# TYPE %s %s' % (name, kind))
+    def sample(name, labels, value):
+        lines.append('%s%s %s' % (name, _format_labels(labels),
+                                  _format_value(value)))
+
+    family('usb_transfers_total', 'counter', 'Number of transfers.')
+    for labels, transfers, nbytes, timeouts, errors, buckets, duration \
+            in items:
+        sample('usb_transfers_total', labels, transfers)
+
+    family('usb_transfer_bytes_total', 'counter',
+           'Number of bytes transferred.')
+    for labels, transfers, nbytes, timeouts, errors, buckets, duration \
+            in items:
+        sample('usb_transfer_bytes_total', labels, nbytes)
+
+    family('usb_transfer_errors_total', 'counter',
+           'Number of failed transfers, by errno.')
+    for labels, transfers, nbytes, timeouts, errors, buckets, duration \
+            in items:
+        for err, count in errors:
+            sample('usb_transfer_errors_total',
+                   labels + (('errno', _errno_name(err)),),
+                   count)
+
+    family('usb_transfer_timeouts_total', 'counter',
+           'Number of transfers which timed out.')
+    for labels, transfers, nbytes, timeouts, errors, buckets, duration \
+            in items:
+        sample('usb_transfer_timeouts_total', labels, timeouts)
+
+    family('usb_transfer_duration_seconds', 'histogram',
+           'Duration of the transfers.')
+    for labels, transfers, nbytes, timeouts, errors, buckets, duration \
+            in items:
+        acc = 0
+        for bound, count in zip(_BUCKETS + ('+Inf',), buckets):
+            acc += count
+            sample('usb_transfer_duration_seconds_bucket',
+                   labels + (('le', str(bound)),),
+                   acc)
+        sample('usb_transfer_duration_seconds_sum', labels, duration)
+        sample('usb_transfer_duration_seconds_count', labels, transfers)
+
+    devices = _open_devices()
+
+    family('usb_open_handles', 'gauge', 'Number of open device handles.')
+    sample('usb_open_handles', (), len(devices))
+
+    family('usb_claimed_interfaces', 'gauge',
+           'Number of interfaces claimed by each open device.')
+    for labels, claimed in devices:
+        sample('usb_claimed_interfaces', labels, claimed)
+
+    return '\n'.join(lines) + '\n'
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port = 9110, address = '127.0.0.1'):
+    r"""Serve the metrics through HTTP in a background thread.
+
+    The metrics are available at the /metrics path of the given address
+    and port. By default, the server only accepts local connections. The
+    function returns the server object; call its shutdown() method to stop
+    it.
+    """
+    server = HTTPServer((address, port), _MetricsHandler)
+    t = threading.Thread(target = server.serve_forever,
+                         name = 'usb.metrics server')
+    t.daemon = True
+    t.start()
+    return server
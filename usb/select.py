@@ -0,0 +1,272 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+r"""usb.select - Waiting on many IN endpoints at once.
+
+This module exports:
+
+Selector - keeps a transfer armed on each registered endpoint and tells
+           which ones got data.
+
+Polling many interrupt endpoints with read() calls and short timeouts
+wastes time on the idle ones and delays the busy ones. A Selector keeps
+one asynchronous transfer in flight on each registered endpoint, so the
+data is received as soon as the device sends it, and select() returns the
+endpoints whose transfer completed, with their data:
+
+>>> sel = usb.select.Selector()
+>>> for ep in endpoints:
+...     sel.register(ep)
+>>> while True:
+...     for ep, data in sel.select():
+...         handle(ep, data)
+
+With the libusb 1.0 backend, select() processes the libusb events itself,
+so a single thread serves any number of devices. Backends completing the
+transfers from their own threads wake it up instead. The backend must
+support asynchronous transfers. Those emulating them with threads, like
+libusb 0.1, cannot stop a transfer once it runs, so there the transfers
+are given a time limit and the device can be closed after it elapses.
+
+The transfers are seen by the statistics, the transfer hooks and the
+packet capture, as those of Device.read() are.
+"""
+
+__author__ = 'Wander Lairson Costa'
+
+__all__ = ['Selector']
+
+import sys
+import errno
+import time
+import threading
+import usb.core as core
+import usb.util as util
+import usb._interop as _interop
+
+# how long the event loop waits at once when select() has no timeout,
+# in miliseconds
+_EVENTS_TIMEOUT = 1000
+
+# the time limit of the transfers of backends emulating them with threads,
+# in miliseconds
+_THREADED_TIMEOUT = 1000
+
+class _Registration(object):
+    def __init__(self, endpoint, size, intf, ep_type):
+        self.endpoint = endpoint
+        self.intf = intf
+        self.ep_type = ep_type
+        self.buffer = _interop.as_array([0]) * size
+        self.transfer = None
+
+class Selector(object):
+    r"""A set of IN endpoints to wait on.
+
+    The endpoints can belong to different devices, all of them using the
+    same backend. Selector objects must be used from a single thread.
+    """
+
+    def __init__(self):
+        self.__registrations = {}
+        self.__backend = None
+        # whether the backend needs handle_events() calls
+        self.__events = True
+        # registrations whose transfer completed, with the transfer
+        self.__completed = []
+        self.__cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.__registrations)
+
+    def register(self, endpoint, size = None):
+        r"""Start waiting for data on the endpoint.
+
+        endpoint is an interrupt or bulk IN usb.core.Endpoint object and
+        size the length of its transfers, by default wMaxPacketSize.
+        """
+        if util.endpoint_direction(endpoint.bEndpointAddress) != util.ENDPOINT_IN:
+            raise ValueError('Not an IN endpoint')
+        key = (endpoint.device, endpoint.bEndpointAddress)
+        if key in self.__registrations:
+            raise ValueError('Endpoint already registered')
+        ctx = endpoint.device._ctx
+        if self.__backend is not None and ctx.backend is not self.__backend:
+            raise ValueError('The endpoints must share the backend')
+        ctx.managed_open()
+        intf, ep_type = ctx.prepare_transfer(endpoint.device,
+                                             endpoint.bEndpointAddress,
+                                             endpoint.interface)
+        if ep_type not in (util.ENDPOINT_TYPE_INTR, util.ENDPOINT_TYPE_BULK):
+            raise ValueError('Not an interrupt or bulk endpoint')
+        if size is None:
+            size = endpoint.wMaxPacketSize & 0x7ff
+        reg = _Registration(endpoint, size, intf, ep_type)
+        self.__arm(reg)
+        self.__registrations[key] = reg
+        self.__backend = ctx.backend
+
+    def unregister(self, endpoint):
+        r"""Stop waiting on the endpoint, dropping the data in flight."""
+        key = (endpoint.device, endpoint.bEndpointAddress)
+        try:
+            reg = self.__registrations.pop(key)
+        except KeyError:
+            raise ValueError('Endpoint not registered')
+        self.__cond.acquire()
+        try:
+            self.__completed = [c for c in self.__completed if c[0] is not reg]
+        finally:
+            self.__cond.release()
+        self.__disarm(reg)
+
+    def close(self):
+        r"""Unregister all the endpoints."""
+        for reg in list(self.__registrations.values()):
+            self.unregister(reg.endpoint)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def select(self, timeout = None):
+        r"""Wait for data on the registered endpoints.
+
+        The method returns a list of (endpoint, data) tuples, data being an
+        array with the data of a transfer, once at least one endpoint got
+        data or after timeout miliseconds (an empty list then). If timeout
+        is None, it waits forever, and if zero, it only collects what was
+        already received. An endpoint may appear several times.
+
+        If a transfer fails, its entry gets the USBError instead of data,
+        and the endpoint is unregistered.
+        """
+        if timeout is not None:
+            deadline = time.time() + timeout / 1000.0
+        # the events are processed at least once, even without a timeout
+        polled = False
+        while True:
+            self.__cond.acquire()
+            try:
+                ready = self.__completed
+                self.__completed = []
+            finally:
+                self.__cond.release()
+            result = []
+            for reg, transfer in ready:
+                data = self.__collect(reg, transfer)
+                if data is not None:
+                    result.append((reg.endpoint, data))
+            if result:
+                return result
+            if timeout is None:
+                remaining = None
+            else:
+                remaining = max(0, deadline - time.time())
+            if self.__events and self.__backend is not None:
+                if remaining == 0 and polled:
+                    return result
+                if remaining is None:
+                    ms = _EVENTS_TIMEOUT
+                else:
+                    ms = int(remaining * 1000)
+                try:
+                    self.__backend.handle_events(ms)
+                    polled = True
+                except NotImplementedError:
+                    self.__events = False
+                continue
+            if remaining == 0:
+                return result
+            self.__cond.acquire()
+            try:
+                if not self.__completed:
+                    self.__cond.wait(remaining)
+            finally:
+                self.__cond.release()
+
+    def __arm(self, reg):
+        def callback(transfer):
+            self.__cond.acquire()
+            try:
+                self.__completed.append((reg, transfer))
+                self.__cond.notify()
+            finally:
+                self.__cond.release()
+        device = reg.endpoint.device
+        timeout = 0
+        if getattr(device._ctx.backend, 'threaded_transfers', False):
+            timeout = _THREADED_TIMEOUT
+        # the callback may run before submit returns, but it cannot be
+        # collected before reg.transfer is set
+        self.__cond.acquire()
+        try:
+            reg.transfer = device._submit(reg.endpoint.bEndpointAddress,
+                                          reg.intf,
+                                          reg.ep_type,
+                                          reg.buffer,
+                                          timeout,
+                                          callback)
+        finally:
+            self.__cond.release()
+
+    def __disarm(self, reg):
+        transfer = reg.transfer
+        reg.transfer = None
+        if transfer is None:
+            return
+        device = reg.endpoint.device
+        device._cancel(transfer)
+        try:
+            device._wait(transfer)
+        except core.USBError:
+            pass
+
+    # wait the completed transfer and arm the next one
+    def __collect(self, reg, transfer):
+        handle = reg.transfer
+        if handle is None or handle.transfer is not transfer:
+            # cancelled by unregister(), which waited it
+            return None
+        address = reg.endpoint.bEndpointAddress
+        reg.transfer = None
+        try:
+            n = reg.endpoint.device._wait(handle)
+        except core.USBError:
+            error = sys.exc_info()[1]
+            if error.errno == errno.ETIMEDOUT:
+                # only the time limit of a threaded transfer
+                self.__arm(reg)
+                return None
+            del self.__registrations[(reg.endpoint.device, address)]
+            return error
+        data = reg.buffer[:n]
+        self.__arm(reg)
+        return data
@@ -0,0 +1,375 @@
+# Copyright (C) 2009-2011 Wander Lairson Costa 
+# 
+# The following terms apply to all files associated
+# with the software unless explicitly disclaimed in individual files.
+# 
+# The authors hereby grant permission to use, copy, modify, distribute,
+# and license this software and its documentation for any purpose, provided
+# that existing copyright notices are retained in all copies and that this
+# notice is included verbatim in any distributions. No written agreement,
+# license, or royalty fee is required for any of the authorized uses.
+# Modifications to this software may be copyrighted by their authors
+# and need not follow the licensing terms described here, provided that
+# the new terms are clearly indicated on the first page of each file where
+# they apply.
+# 
+# IN NO EVENT SHALL THE AUTHORS OR DISTRIBUTORS BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES
+# ARISING OUT OF THE USE OF THIS SOFTWARE, ITS DOCUMENTATION, OR ANY
+# DERIVATIVES THEREOF, EVEN IF THE AUTHORS HAVE BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# THE AUTHORS AND DISTRIBUTORS SPECIFICALLY DISCLAIM ANY WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE, AND NON-INFRINGEMENT.  THIS SOFTWARE
+# IS PROVIDED ON AN "AS IS" BASIS, AND THE AUTHORS AND DISTRIBUTORS HAVE
+# NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+r"""usb.shm - Shared memory feed of endpoint data for other processes.
+
+This module exports:
+
+Ring - a ring of records in a multiprocessing.shared_memory block.
+RingReader - the consumer side of a Ring, in any process.
+feed() - read an IN endpoint into a Ring from a background thread.
+Feed - the class representing a feed in progress.
+
+Each transfer completed by the feed becomes a record of the ring, in its
+own slot. The transfers read straight into the slots, and the readers get
+memoryviews of them, so the data is never copied by Python, nor pickled.
+Records are numbered by a sequence number; the producer never waits for
+the readers, so a reader too slow finds its next records overwritten:
+they are skipped and counted in the RingReader.lost attribute. Several
+readers can share the work, each one taking the records whose sequence
+number modulo count is its index.
+
+>>> # in the reading process
+>>> ring = usb.shm.Ring(slots = 256, slot_size = 65536)
+>>> f = usb.shm.feed(ep, ring)
+>>> # in each worker process, given ring.name, index and count
+>>> reader = usb.shm.RingReader(name, index, count)
+>>> while True:
+...     data = reader.get()
+...     decode(data)
+...     if not reader.valid(): # overwritten while decoding
+...         discard()
+
+A record view is only valid until the producer reuses its slot, hence the
+valid() check. The views must be released before the reader is closed.
+multiprocessing.shared_memory is available since Python 3.8.
+"""
+
+__author__ = 'Wander Lairson Costa'
+
+__all__ = ['Ring', 'RingReader', 'feed', 'Feed']
+
+import struct
+import threading
+import time
+import usb.core as core
+import usb.util as util
+import usb._interop as _interop
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+_MAGIC = b'PYUSBSHM'
+_VERSION = 1
+
+# magic, version, slot count, slot size, next sequence number
+_HEADER = struct.Struct('<8sIIIxxxxQ')
+_WRITE_SEQ_OFFSET = 24
+
+# sequence number plus one (zero while being written), data length
+_SLOT_HEADER = struct.Struct('<QI4x')
+
+_SEQ = struct.Struct('<Q')
+
+# slots start on cache line boundaries
+_ALIGNMENT = 64
+
+_DEFAULT_TRANSFERS = 4
+
+# reader polling interval, in seconds
+_POLL_INTERVAL = 0.0005
+
+def _stride(slot_size):
+    size = _SLOT_HEADER.size + slot_size
+    return size + (-size) % _ALIGNMENT
+
+def _attach(name):
+    if shared_memory is None:
+        raise NotImplementedError('multiprocessing.shared_memory is not available')
+    try:
+        # do not let the resource tracker of this process unlink it
+        return shared_memory.SharedMemory(name, track = False)
+    except TypeError:
+        return shared_memory.SharedMemory(name)
+
+class _RingLayout(object):
+    def __init__(self, shm):
+        self.shm = shm
+        self.buf = shm.buf
+        magic, version, self.slots, self.slot_size, seq = \
+                _HEADER.unpack_from(self.buf, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError('Not a PyUSB ring')
+        self.stride = _stride(self.slot_size)
+
+    def slot_offset(self, seq):
+        return _ALIGNMENT + (seq % self.slots) * self.stride
+
+    def write_seq(self):
+        return _SEQ.unpack_from(self.buf, _WRITE_SEQ_OFFSET)[0]
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+class Ring(object):
+    r"""A ring of records in a new shared memory block.
+
+    slots is the number of records kept and slot_size the maximum length
+    of a record, rounded down to a multiple of wMaxPacketSize by feed().
+    name is the name of the block, generated if None; readers attach to
+    it by name. The object owns the block: unlink() destroys it.
+    """
+
+    def __init__(self, slots = 64, slot_size = 65536, name = None):
+        if shared_memory is None:
+            raise NotImplementedError('multiprocessing.shared_memory is not available')
+        if slots < 2:
+            raise ValueError('A ring needs at least two slots')
+        if slot_size < 1:
+            raise ValueError('Invalid slot size')
+        self.shm = shared_memory.SharedMemory(name, True,
+                                              _ALIGNMENT + slots * _stride(slot_size))
+        _HEADER.pack_into(self.shm.buf, 0, _MAGIC, _VERSION, slots, slot_size, 0)
+        self.__layout = _RingLayout(self.shm)
+
+    def __get_name(self):
+        return self.shm.name
+
+    name = property(__get_name, doc = 'Name of the shared memory block')
+
+    def __get_slots(self):
+        return self.__layout.slots
+
+    slots = property(__get_slots, doc = 'Number of records kept')
+
+    def __get_slot_size(self):
+        return self.__layout.slot_size
+
+    slot_size = property(__get_slot_size, doc = 'Maximum length of a record')
+
+    def __get_write_seq(self):
+        return self.__layout.write_seq()
+
+    write_seq = property(
+                    __get_write_seq,
+                    doc = 'Sequence number of the next record published'
+                )
+
+    def slot(self, seq, length = None):
+        r"""Return a memoryview of the data of the slot for seq.
+
+        The view covers length bytes, by default the whole slot.
+        """
+        layout = self.__layout
+        offset = layout.slot_offset(seq) + _SLOT_HEADER.size
+        if length is None:
+            length = layout.slot_size
+        return layout.buf[offset:offset + length]
+
+    def begin(self, seq):
+        r"""Mark the slot for seq as being written."""
+        layout = self.__layout
+        _SLOT_HEADER.pack_into(layout.buf, layout.slot_offset(seq), 0, 0)
+
+    def publish(self, seq, length):
+        r"""Publish the record seq, of length bytes, written to its slot.
+
+        Records must be published in sequence.
+        """
+        layout = self.__layout
+        # the length goes before the sequence number, which makes the
+        # record visible
+        offset = layout.slot_offset(seq)
+        _SLOT_HEADER.pack_into(layout.buf, offset, 0, length)
+        _SEQ.pack_into(layout.buf, offset, seq + 1)
+        _SEQ.pack_into(layout.buf, _WRITE_SEQ_OFFSET, seq + 1)
+
+    def close(self):
+        r"""Detach from the block. The slot views must be released first."""
+        self.__layout.close()
+
+    def unlink(self):
+        r"""Destroy the block, once every process closed it."""
+        self.shm.unlink()
+
+class RingReader(object):
+    r"""The consumer side of a Ring, attached by name.
+
+    The reader takes the records published after it was created whose
+    sequence number modulo count equals index, so count readers with
+    different indices share the records. The lost attribute counts the
+    records of the reader which were overwritten before it got them.
+    """
+
+    def __init__(self, name, index = 0, count = 1):
+        if not 0 <= index < count:
+            raise ValueError('Invalid reader index')
+        self.index = index
+        self.count = count
+        self.lost = 0
+        self.seq = None
+        self.__layout = _RingLayout(_attach(name))
+        self.__next = self.__align(self.__layout.write_seq())
+
+    def __align(self, seq):
+        return seq + (self.index - seq) % self.count
+
+    def get(self, timeout = None):
+        r"""Return a memoryview of the data of the next record.
+
+        The method waits for it up to timeout seconds, forever if None,
+        and returns None if it elapses. The seq attribute is then the
+        sequence number of the record.
+        """
+        layout = self.__layout
+        buf = layout.buf
+        if timeout is not None:
+            deadline = time.time() + timeout
+        while True:
+            seq = self.__next
+            write_seq = layout.write_seq()
+            if write_seq > seq:
+                if write_seq - seq > layout.slots:
+                    # lapped, the oldest records left are the last slots
+                    skip = self.__align(write_seq - layout.slots)
+                    self.lost += (skip - seq) // self.count
+                    self.__next = seq = skip
+                offset = layout.slot_offset(seq)
+                # the sequence number is checked here and, once the data
+                # is used, by valid()
+                tag, length = _SLOT_HEADER.unpack_from(buf, offset)
+                if tag == seq + 1:
+                    self.seq = seq
+                    self.__next = seq + self.count
+                    offset += _SLOT_HEADER.size
+                    return buf[offset:offset + length]
+                # overwritten in the meantime
+                self.lost += 1
+                self.__next = seq + self.count
+                continue
+            if timeout is not None and time.time() >= deadline:
+                return None
+            time.sleep(_POLL_INTERVAL)
+
+    def valid(self):
+        r"""Tell whether the last record returned is still intact."""
+        layout = self.__layout
+        return self.seq is not None and \
+                _SEQ.unpack_from(layout.buf, layout.slot_offset(self.seq))[0] == \
+                    self.seq + 1
+
+    def close(self):
+        r"""Detach from the block. The record views must be released first."""
+        self.__layout.close()
+
+class Feed(object):
+    r"""A feed of endpoint data into a Ring.
+
+    Feed objects are created by the feed() function. The records attribute
+    is the number of records published and error the USBError which ended
+    the feed, if any.
+    """
+
+    def __init__(self, endpoint, ring, transfers = _DEFAULT_TRANSFERS,
+                 timeout = 0):
+        if util.endpoint_direction(endpoint.bEndpointAddress) != util.ENDPOINT_IN:
+            raise ValueError('Not an IN endpoint')
+        if not 1 <= transfers < ring.slots:
+            raise ValueError('The transfers in flight must be less than the slots')
+        packet = (endpoint.wMaxPacketSize & 0x7ff) or 1
+        if ring.slot_size < packet:
+            raise ValueError('The slots are smaller than a packet')
+        self.endpoint = endpoint
+        self.ring = ring
+        self.transfers = transfers
+        self.timeout = timeout
+        self.transfer_size = ring.slot_size - ring.slot_size % packet
+        self.records = 0
+        self.error = None
+        self.__stopped = False
+        self.__thread = threading.Thread(target=self.__run, name='usb.shm feed')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def wait(self, timeout = None):
+        r"""Wait for the feed to end and return the number of records.
+
+        If the feed ended with an error, it is raised. If timeout (in
+        seconds) elapses first, the feed keeps running.
+        """
+        self.__thread.join(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.records
+
+    def stop(self):
+        r"""Stop the feed."""
+        self.__stopped = True
+        self.endpoint.cancel_pending()
+        return self.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __run(self):
+        try:
+            self.__feed()
+        except core.USBTransferCancelled:
+            pass
+        except core.USBError:
+            # the traceback would keep the slot views alive
+            self.error = _interop._exception()
+
+    def __feed(self):
+        self.__next = self.ring.write_seq
+        core._read_stream(self.endpoint, self.transfers, self.timeout,
+                          lambda: self.__stopped, self.__fill, self.__done)
+
+    # the slot of the next record
+    def __fill(self, pending):
+        seq = self.__next
+        self.__next += 1
+        self.ring.begin(seq)
+        return seq, self.ring.slot(seq, self.transfer_size)
+
+    def __done(self, seq, buff, n):
+        self.ring.publish(seq, n)
+        self.records += 1
+        return True
+
+def feed(endpoint, ring, transfers = _DEFAULT_TRANSFERS, timeout = 0):
+    r"""Read an IN endpoint into a Ring from a background thread.
+
+    endpoint is the usb.core.Endpoint object to read from. Each transfer,
+    of the ring slot size rounded down to a multiple of wMaxPacketSize,
+    reads into its slot and is published as a record when it completes.
+    Up to transfers transfers are kept in flight if the backend supports
+    asynchronous transfers, and are seen by the statistics, the transfer
+    hooks and the packet capture as those of read() are. timeout is the time limit of each transfer, in
+    miliseconds; the default, zero, waits forever.
+
+    The function returns the new Feed object, which can also be used as a
+    context manager.
+    """
+    return Feed(endpoint, ring, transfers, timeout)
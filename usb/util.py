@@ -257,4 +257,4 @@ def get_string(dev, length, index, langid = None):
                 index,
                 langid
             )
-    return buf[2:buf[0]].tostring().decode('utf-16-le')
+    return _interop._tobytes(buf[2:buf[0]]).decode('utf-16-le')